@@ -0,0 +1,55 @@
+"""
+Compare the IOC JSON parsers.
+
+Usage:
+
+    python benchmarks/bench_parse.py --days 30 --sensors 3
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from observer.ioc.parser import parse_ioc_json
+
+from pandas_parser import parse_json_pandas
+
+
+def generate_response(days: int, sensors: int, interval: str = "1min", seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range("2023-01-01", periods=days * pd.Timedelta("1D") // pd.Timedelta(interval), freq=interval)
+    stimes = timestamps.strftime("%Y-%m-%d %H:%M:%S")
+    records = []
+    for sensor in ["wls", "rad", "prs", "bub", "enc"][:sensors]:
+        values = rng.normal(size=len(stimes)).round(3)
+        records.extend({"slevel": value, "stime": stime, "sensor": sensor} for value, stime in zip(values.tolist(), stimes))
+    return json.dumps(records, separators=(",", ":"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--sensors", type=int, default=3)
+    parser.add_argument("--interval", default="1min")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    content = generate_response(days=args.days, sensors=args.sensors, interval=args.interval)
+    print(f"Response size: {len(content) / 2**20:.1f} MiB")
+    parsers = {
+        "pandas": parse_json_pandas,
+        "vectorized": parse_ioc_json,
+    }
+    timings = {}
+    for name, func in parsers.items():
+        timings[name] = min(timeit.repeat(lambda: func(content=content, ioc_code="bench"), number=1, repeat=args.repeat))
+        print(f"{name:>12}: {timings[name] * 1000:8.1f} ms")
+    print(f"{'speedup':>12}: {timings['pandas'] / timings['vectorized']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Benchmark the scrape -> parse -> store pipeline against a local fake IOC service.
+
+Each stage is timed separately (the best of `--repeat` runs) and its peak memory is measured with
+`tracemalloc` in an extra run. Memory allocated by worker processes is not included. The results
+can be saved with `--save` and compared with a previous run with `--baseline`. The exit code is 1
+if any stage failed or (with `--baseline`) got slower than `--tolerance`.
+
+The 503s that are injected with `--error-rate` are retried like the ones of an overloaded IOC, so the
+timings include the waits between the retries. The requests that still fail abort `scrape_ioc()` and
+friends, so the "report" mode (`scrape_ioc_with_report()`), which tolerates them, is added automatically.
+
+Usage (the results are written to stdout, the progress bars of `multifutures` to stderr):
+
+    python benchmarks/bench_pipeline.py --stations 20 --days 60 --save baseline.json
+    python benchmarks/bench_pipeline.py --stations 20 --days 60 --baseline baseline.json
+    python benchmarks/bench_pipeline.py --latency 0.05 --error-rate 0.01 --modes report
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as T
+
+import httpx
+import limits
+import multifutures
+import pandas as pd
+
+from observer.ioc import scraper
+from observer.ioc.fs import get_ioc_df
+from observer.ioc.fs import write_ioc_df
+from observer.ioc.parser import melt_ioc_df
+from observer.settings import get_settings
+
+from fake_ioc import FakeIOCServer
+from fake_ioc import generate_stations
+from pandas_parser import parse_json_pandas
+
+MODES = ("scrape", "async", "iter", "report")
+
+
+def _measure(func: T.Callable[[], T.Any], repeat: int, memory: bool) -> tuple[T.Any, float, float | None]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, min(timings), peak
+
+
+class Bench:
+    def __init__(self, repeat: int, memory: bool) -> None:
+        self.repeat = repeat
+        self.memory = memory
+        self.results: dict[str, dict[str, float | None]] = {}
+        self.failed: list[str] = []
+
+    def run(self, name: str, func: T.Callable[[], T.Any], items: int = 0, size: int = 0) -> T.Any:
+        try:
+            result, seconds, peak = _measure(func, repeat=self.repeat, memory=self.memory)
+        except Exception as exc:
+            # Keep benchmarking the rest of the stages, but fail the run
+            message = str(exc).splitlines()[0] if str(exc) else ""
+            print(f"{name:<28} failed: {type(exc).__name__}: {message}")
+            self.failed.append(name)
+            return None
+        self.results[name] = {
+            "seconds": seconds,
+            "peak_mib": peak,
+            "items_per_second": items / seconds if items else None,
+            "mib_per_second": size / 2**20 / seconds if size else None,
+        }
+        self.print_row(name)
+        return result
+
+    def print_row(self, name: str) -> None:
+        row = self.results[name]
+        peak = f"{row['peak_mib']:10.1f}" if row["peak_mib"] is not None else f"{'-':>10}"
+        items = f"{row['items_per_second']:12.1f}" if row["items_per_second"] is not None else f"{'-':>12}"
+        mibs = f"{row['mib_per_second']:8.1f}" if row["mib_per_second"] is not None else f"{'-':>8}"
+        print(f"{name:<28} {row['seconds'] * 1000:10.1f} {peak} {items} {mibs}")
+
+
+def _compare(
+    results: dict[str, dict[str, T.Any]], baseline: dict[str, dict[str, T.Any]], tolerance: float
+) -> bool:
+    ok = True
+    print(f"\n{'stage':<28} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, row in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["seconds"], row["seconds"]
+        change = after / before - 1
+        flag = ""
+        if change > tolerance:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:<28} {before * 1000:12.1f} {after * 1000:12.1f} {change:+8.1%}{flag}")
+    return ok
+
+
+def _scrape(mode: str, rate: int, n_threads: int, **kwargs: T.Any) -> T.Any:
+    if mode == "scrape":
+        rate_limit = multifutures.RateLimit(rate_limit=limits.parse(f"{rate}/second"))
+        return scraper.scrape_ioc(**kwargs, rate_limit=rate_limit, n_threads=n_threads)
+    if mode == "async":
+        return asyncio.run(scraper.scrape_ioc_async(**kwargs, rate_limit=scraper.AsyncRateLimit(rate=rate)))
+    if mode == "iter":
+        rate_limit = multifutures.RateLimit(rate_limit=limits.parse(f"{rate}/second"))
+        return list(scraper.scrape_ioc_iter(**kwargs, rate_limit=rate_limit, n_threads=n_threads))
+    if mode == "report":
+        rate_limit = multifutures.RateLimit(rate_limit=limits.parse(f"{rate}/second"))
+        return scraper.scrape_ioc_with_report(**kwargs, rate_limit=rate_limit, n_threads=n_threads)
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+def _bench_storage(
+    bench: Bench,
+    tmpdir: str,
+    ioc_codes: list[str],
+    parsed: list[multifutures.FutureResult],
+) -> None:
+    dataframes = bench.run(
+        "group_results",
+        lambda: scraper.group_results(
+            ioc_codes=ioc_codes,
+            parsed_responses=[result for result in parsed if result.exception is None],
+        ),
+        items=len(ioc_codes),
+    )
+    if dataframes is None:
+        return
+    rows = sum(len(df) for df in dataframes.values())
+    bench.run(
+        "write_ioc_df",
+        lambda: [write_ioc_df(df=df, ioc_code=ioc_code) for ioc_code, df in dataframes.items()],
+        items=rows,
+    )
+    stored = sum(path.stat().st_size for path in pathlib.Path(tmpdir).rglob("*") if path.is_file())
+    long_dataframes = {ioc_code: melt_ioc_df(df) for ioc_code, df in dataframes.items()}
+    bench.run(
+        "write_ioc_df[long]",
+        lambda: [
+            write_ioc_df(df=df, ioc_code=f"{ioc_code}_long") for ioc_code, df in long_dataframes.items()
+        ],
+        items=rows,
+    )
+    bench.run(
+        "get_ioc_df[long]",
+        lambda: [get_ioc_df(f"{ioc_code}_long", no_years=None) for ioc_code in ioc_codes],
+        items=rows,
+    )
+    memory = sum(df.memory_usage().sum() for df in dataframes.values()) / 2**20
+    long_memory = sum(df.memory_usage().sum() for df in long_dataframes.values()) / 2**20
+    print(f"\nRows: {rows}, stored: {stored / 2**20:.1f} MiB")
+    print(f"In memory: wide {memory:.1f} MiB, long {long_memory:.1f} MiB\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--chunk-days", type=float, default=30)
+    parser.add_argument(
+        "--intervals", default="1min,2min,5min,15min", help="The sampling rates of the stations"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="The latency of the fake service in seconds"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="A random extra latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="The fraction of requests that fail")
+    parser.add_argument("--duplicate-rate", type=float, default=0.001)
+    parser.add_argument("--garbage-rate", type=float, default=0.001)
+    parser.add_argument("--threads", type=int, default=5)
+    parser.add_argument("--processes", type=int, default=multifutures.MAX_AVAILABLE_PROCESSES)
+    parser.add_argument("--rate", type=int, default=1000, help="Requests per second")
+    parser.add_argument(
+        "--modes",
+        default="scrape,async,iter",
+        help=f"The end-to-end execution modes to compare: {','.join(MODES)}",
+    )
+    parser.add_argument("--parse-executors", default="inline,thread,process")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Don't measure the peak memory")
+    parser.add_argument("--save", type=pathlib.Path, help="Save the results as JSON")
+    parser.add_argument("--baseline", type=pathlib.Path, help="Compare with previously saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="The allowed slowdown vs the baseline")
+    args = parser.parse_args()
+    # The fake responses contain duplicates on purpose; don't log a warning for each one of them
+    logging.getLogger("observer").setLevel(logging.ERROR)
+
+    stations = generate_stations(args.stations, intervals=args.intervals.split(","))
+    ioc_codes = [station.ioc_code for station in stations]
+    start_date = pd.Timestamp("2023-01-01")
+    end_date = start_date + pd.Timedelta(days=args.days)
+    chunk_size = pd.Timedelta(days=args.chunk_days)
+    server = FakeIOCServer(
+        stations,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        duplicate_rate=args.duplicate_rate,
+        garbage_rate=args.garbage_rate,
+    )
+    bench = Bench(repeat=args.repeat, memory=not args.no_memory)
+    with server, server.patch_base_url(), tempfile.TemporaryDirectory() as tmpdir:
+        os.environ["STORAGE_URL"] = tmpdir
+        get_settings.cache_clear()
+        rate_limit = multifutures.RateLimit(rate_limit=limits.parse(f"{args.rate}/second"))
+        scrape_kwargs: dict[str, T.Any] = dict(
+            ioc_codes=ioc_codes,
+            start_date=start_date,
+            end_date=end_date,
+            chunk_size=chunk_size,
+        )
+
+        def fetch() -> list[multifutures.FutureResult]:
+            return scraper.retrieve_ioc_data(
+                **scrape_kwargs,
+                rate_limit=rate_limit,
+                http_client=httpx.Client(timeout=httpx.Timeout(timeout=10, read=30)),
+                n_threads=args.threads,
+                check=False,
+            )
+
+        # Let the server generate (and cache) the responses, so that they don't count in the timings
+        fetched = fetch()
+        responses = [result for result in fetched if result.exception is None]
+        print(
+            f"Stations: {len(ioc_codes)}, requests: {len(fetched)}, failed: {len(fetched) - len(responses)}"
+        )
+        print(f"Response size: {sum(len(result.result) for result in responses) / 2**20:.1f} MiB\n")
+        print(f"{'stage':<28} {'ms':>10} {'peak MiB':>10} {'items/s':>12} {'MiB/s':>8}")
+
+        bench.run(
+            "generate_urls",
+            lambda: [
+                scraper.generate_station_urls(ioc_code, start_date, end_date, chunk_size)
+                for ioc_code in ioc_codes
+            ],
+            items=len(fetched),
+        )
+        size = sum(len(result.result) for result in responses)
+        fetched = bench.run("fetch_url", fetch, items=len(fetched), size=size)
+        responses = [result for result in fetched if result.exception is None]
+        contents = [
+            (result.kwargs["ioc_code"], result.result)  # type: ignore[index]
+            for result in responses
+            if not scraper.is_empty_response(result.result, result.kwargs["ioc_code"])  # type: ignore[index]
+        ]
+        bench.run(
+            "parse_json_pandas",
+            lambda: [parse_json_pandas(content, ioc_code) for ioc_code, content in contents],
+            items=len(contents),
+            size=size,
+        )
+        bench.run(
+            "parse_json",
+            lambda: [scraper.parse_json(content, ioc_code) for ioc_code, content in contents],
+            items=len(contents),
+            size=size,
+        )
+        bench.run(
+            "parse_json[long]",
+            lambda: [scraper.parse_json(content, ioc_code, layout="long") for ioc_code, content in contents],
+            items=len(contents),
+            size=size,
+        )
+        parsed = None
+        for executor in args.parse_executors.split(","):
+            result = bench.run(
+                f"parse_ioc_responses[{executor}]",
+                lambda: scraper.parse_ioc_responses(
+                    responses,
+                    n_processes=args.processes,
+                    executor=executor,
+                    check=False,
+                ),
+                items=len(contents),
+                size=size,
+            )
+            parsed = parsed if result is None else result
+        if parsed is not None:
+            _bench_storage(bench, tmpdir=tmpdir, ioc_codes=ioc_codes, parsed=parsed)
+
+        modes = args.modes.split(",")
+        if args.error_rate and "report" not in modes:
+            modes.append("report")
+        for mode in modes:
+            for executor in args.parse_executors.split(","):
+                func = functools.partial(
+                    _scrape,
+                    mode,
+                    **scrape_kwargs,
+                    rate=args.rate,
+                    n_threads=args.threads,
+                    n_processes=args.processes,
+                    parse_executor=executor,
+                )
+                bench.run(f"{mode}[{executor}]", func, items=len(ioc_codes), size=size)
+
+    if args.save:
+        args.save.write_text(json.dumps(bench.results, indent=2))
+    ok = not bench.failed
+    if bench.failed:
+        print(f"\nFailed stages: {', '.join(bench.failed)}")
+    if args.baseline and not _compare(bench.results, json.loads(args.baseline.read_text()), args.tolerance):
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+A local stand-in for the IOC data service.
+
+It serves `service.php?query=data&timestart=...&timestop=...&code=...` like the real one, with
+synthetic but realistic responses: configurable stations, sensors and sampling rates, duplicate
+timestamps, unknown sensors, `null` values and whitespace in the timestamps. Latency and errors
+can be injected. The server runs in a separate process, so that generating the responses does not
+compete for the GIL with the code that is being benchmarked.
+
+Usage:
+
+    with FakeIOCServer(stations=generate_stations(10)) as server:
+        with server.patch_base_url():
+            scrape_ioc(...)
+
+    # or standalone, e.g. to point other tools at it
+    python benchmarks/fake_ioc.py --stations 10 --port 8000
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import dataclasses
+import functools
+import http.server
+import json
+import multiprocessing
+import random
+import time
+import typing as T
+import urllib.parse
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import observer.ioc.scraper
+
+SENSORS = ["bub", "enc", "flt", "prs", "rad", "wls"]
+INTERVALS = ["1min", "2min", "5min", "15min"]
+
+
+@dataclasses.dataclass(frozen=True)
+class FakeStation:
+    ioc_code: str
+    sensors: tuple[str, ...] = ("rad",)
+    interval: str = "1min"
+
+
+@dataclasses.dataclass(frozen=True)
+class FakeIOCConfig:
+    stations: tuple[FakeStation, ...]
+    # The fraction of the records that are duplicated, have an unknown sensor or have a `null` value
+    duplicate_rate: float = 0.001
+    garbage_rate: float = 0.001
+    null_rate: float = 0.01
+    # Seconds; each request sleeps for a random time between `latency` and `latency + jitter`
+    latency: float = 0.0
+    jitter: float = 0.0
+    # The fraction of the requests that fail with a 503
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+def generate_stations(
+    n_stations: int,
+    sensors: T.Sequence[int] = (1, 2, 3),
+    intervals: T.Sequence[str] = tuple(INTERVALS),
+    seed: int = 0,
+) -> tuple[FakeStation, ...]:
+    """
+    Return `n_stations` stations with a random number of sensors and a random sampling rate.
+    """
+    rng = random.Random(seed)
+    stations = []
+    for index in range(n_stations):
+        n_sensors = rng.choice(sensors)
+        stations.append(
+            FakeStation(
+                ioc_code=f"st{index:03d}",
+                sensors=tuple(sorted(rng.sample(SENSORS, n_sensors))),
+                interval=rng.choice(intervals),
+            ),
+        )
+    return tuple(stations)
+
+
+def generate_response(
+    config: FakeIOCConfig,
+    station: FakeStation,
+    timestart: pd.Timestamp,
+    timestop: pd.Timestamp,
+) -> str:
+    """
+    Return the JSON response of `station` for `[timestart, timestop]`.
+
+    The same request always returns the same response.
+    """
+    timestamps = pd.date_range(timestart.ceil(station.interval), timestop, freq=station.interval)
+    if not len(timestamps):
+        return "[]"
+    seed = zlib.crc32(f"{config.seed}-{station.ioc_code}-{timestart.value}-{timestop.value}".encode())
+    rng = np.random.default_rng(seed)
+    stimes = timestamps.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+    minutes = (timestamps.asi8 // 60_000_000_000).astype(float)
+    records = []
+    for index, sensor in enumerate(station.sensors):
+        values = (
+            np.sin(minutes * 2 * np.pi / 745 + index) + rng.normal(scale=0.01, size=len(minutes))
+        ).round(3)
+        sensor_records = [
+            {"slevel": value, "stime": stime, "sensor": sensor}
+            for value, stime in zip(values.tolist(), stimes)
+        ]
+        for position in np.flatnonzero(rng.random(len(sensor_records)) < config.null_rate):
+            sensor_records[position]["slevel"] = None
+        records.extend(sensor_records)
+    n_duplicates = int(len(records) * config.duplicate_rate)
+    records.extend({**records[position]} for position in rng.integers(0, len(records), n_duplicates))
+    for position in rng.integers(0, len(records), int(len(records) * config.garbage_rate)):
+        records[position] = {
+            **records[position],
+            "sensor": "xxx",
+            "stime": f" {records[position]['stime']} ",
+        }
+    return json.dumps(records, separators=(",", ":"))
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    config: FakeIOCConfig
+    stations: dict[str, FakeStation]
+
+    def log_message(self, format: str, *args: T.Any) -> None:
+        pass
+
+    def _send(self, status: int, body: str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        config = self.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + random.random() * config.jitter)
+        if config.error_rate and random.random() < config.error_rate:
+            self._send(503, "Service Unavailable")
+            return
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        ioc_code = query.get("code", "")
+        station = self.stations.get(ioc_code)
+        if station is None:
+            self._send(200, f"""[{{"error":"code '{ioc_code}' not found"}}]""")
+            return
+        body = _get_response(station, query["timestart"], query["timestop"])
+        self._send(200, body)
+
+
+@functools.lru_cache(maxsize=256)
+def _get_response(station: FakeStation, timestart: str, timestop: str) -> str:
+    # Repeated benchmark runs request the same URLs; don't let the server be the bottleneck
+    return generate_response(_Handler.config, station, pd.Timestamp(timestart), pd.Timestamp(timestop))
+
+
+def _serve(config: FakeIOCConfig, port: int, connection: T.Any) -> None:
+    _Handler.config = config
+    _Handler.stations = {station.ioc_code: station for station in config.stations}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    connection.send(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeIOCServer:
+    """
+    Run the fake IOC service in a child process for the duration of a `with` block.
+    """
+
+    def __init__(self, stations: T.Sequence[FakeStation], port: int = 0, **kwargs: T.Any) -> None:
+        self.config = FakeIOCConfig(stations=tuple(stations), **kwargs)
+        self.port = port
+        self._process: multiprocessing.process.BaseProcess | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/service.php?query=data&timestart={{timestart}}&timestop={{timestop}}&code={{ioc_code}}"
+
+    def __enter__(self) -> FakeIOCServer:
+        parent, child = multiprocessing.get_context("spawn").Pipe()
+        self._process = multiprocessing.get_context("spawn").Process(
+            target=_serve,
+            args=(self.config, self.port, child),
+            daemon=True,
+        )
+        self._process.start()
+        self.port = parent.recv()
+        return self
+
+    def __exit__(self, *args: T.Any) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    @contextlib.contextmanager
+    def patch_base_url(self) -> T.Iterator[None]:
+        """
+        Make `observer` request the fake service instead of IOC.
+        """
+        original = observer.ioc.scraper.BASE_URL
+        observer.ioc.scraper.BASE_URL = self.base_url
+        try:
+            yield
+        finally:
+            observer.ioc.scraper.BASE_URL = original
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stations = generate_stations(args.stations)
+    with FakeIOCServer(
+        stations, port=args.port, latency=args.latency, error_rate=args.error_rate
+    ) as server:
+        print(
+            f"Serving {len(stations)} stations ({', '.join(s.ioc_code for s in stations)}) on {server.url}"
+        )
+        print(
+            f"e.g. {server.base_url.format(timestart='2023-01-01T00:00:00', timestop='2023-01-02T00:00:00', ioc_code='st000')}"
+        )
+        with contextlib.suppress(KeyboardInterrupt):
+            while True:
+                time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
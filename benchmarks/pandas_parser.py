@@ -0,0 +1,40 @@
+"""
+The original IOC JSON parser, based on `pd.read_json()`.
+
+It is slower than `observer.ioc.parser.parse_ioc_json()` but simple enough to be obviously correct,
+so it is the reference for the vectorized parser: `bench_parse.py` and `bench_pipeline.py` compare
+their speed and the tests compare their output.
+"""
+from __future__ import annotations
+
+import io
+import logging
+
+import pandas as pd
+import searvey.ioc
+
+from observer.ioc.scraper import IOC_JSON_TS_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[df.sensor.isin(searvey.ioc.IOC_STATION_DATA_COLUMNS.values())]
+    df = df.assign(stime=pd.DatetimeIndex(pd.to_datetime(df.stime.str.strip(), format=IOC_JSON_TS_FORMAT)))
+    df = df.rename(columns={"stime": "time"})
+    # Occasionaly IOC contains complete garbage. E.g. duplicate timestamps on the same sensor. We should drop those.
+    # https://www.ioc-sealevelmonitoring.org/service.php?query=data&timestart=2022-03-12T11:03:40&timestop=2022-04-11T09:04:26&code=acnj
+    duplicated_timestamps = df[["time", "sensor"]].duplicated()
+    if duplicated_timestamps.sum() > 0:
+        df = df[~duplicated_timestamps]
+        logger.warning("%s: Dropped duplicates: %d rows", df.attrs["ioc_code"], duplicated_timestamps.sum())
+    df = df.pivot(index="time", columns="sensor", values="slevel")
+    df._mgr.items.name = ""  # type: ignore[attr-defined]
+    return df
+
+
+def parse_json_pandas(content: str, ioc_code: str) -> pd.DataFrame:
+    df = pd.read_json(io.StringIO(content), orient="records")
+    df.attrs["ioc_code"] = ioc_code
+    df = normalize_df(df)
+    return df
@@ -6,18 +6,48 @@ import fastparquet  # noqa: F401=unused import
 
 from .azclients import Credential
 from .azclients import CredentialAIO
+from .azclients import get_active_session
 from .azclients import get_credential
 from .azclients import get_credential_aio
 from .azclients import get_obs_client
 from .azclients import get_obs_fs
 from .azclients import get_storage_options
+from .azclients import ObsSession
+from .ioc import compact_ioc_archive
+from .ioc import compact_ioc_station
+from .ioc import FailedChunk
+from .ioc import get_ioc_catalog
+from .ioc import get_ioc_dataset
 from .ioc import get_ioc_df
+from .ioc import get_ioc_dfs
+from .ioc import get_ioc_last_timestamp
+from .ioc import get_ioc_last_timestamps
 from .ioc import get_ioc_metadata
 from .ioc import get_ioc_parquet_file
+from .ioc import get_ioc_start_dates
 from .ioc import list_ioc_stations
+from .ioc import open_ioc_archive
+from .ioc import PipelineResult
+from .ioc import plan_ioc_shards
+from .ioc import ResponseCache
+from .ioc import retry_failed_chunks
+from .ioc import run_ioc_backfill
+from .ioc import run_ioc_pipeline
 from .ioc import scrape_ioc
+from .ioc import scrape_ioc_async
+from .ioc import scrape_ioc_incremental
+from .ioc import scrape_ioc_iter
 from .ioc import scrape_ioc_station
+from .ioc import scrape_ioc_with_report
+from .ioc import ScrapeResult
+from .ioc import StationCache
+from .ioc import sync_ioc_archive
+from .ioc import SyncResult
+from .ioc import update_ioc_catalog
 from .ioc import write_ioc_df
+from .ioc import write_ioc_dfs
+from .metrics import get_metrics
+from .metrics import MetricsRegistry
 from .notify import notify_error
 from .notify import notify_info
 from .settings import get_settings
@@ -31,19 +61,50 @@ __all__: list[str] = [
     # azclients
     "Credential",
     "CredentialAIO",
+    "get_active_session",
     "get_credential",
     "get_credential_aio",
     "get_obs_client",
     "get_obs_fs",
     "get_storage_options",
+    "ObsSession",
     # ioc
+    "compact_ioc_archive",
+    "compact_ioc_station",
+    "FailedChunk",
+    "get_ioc_catalog",
+    "get_ioc_dataset",
     "get_ioc_df",
+    "get_ioc_dfs",
+    "get_ioc_last_timestamp",
+    "get_ioc_last_timestamps",
     "get_ioc_metadata",
     "get_ioc_parquet_file",
+    "get_ioc_start_dates",
     "list_ioc_stations",
+    "open_ioc_archive",
+    "PipelineResult",
+    "plan_ioc_shards",
+    "ResponseCache",
+    "retry_failed_chunks",
+    "run_ioc_backfill",
+    "run_ioc_pipeline",
     "scrape_ioc",
+    "scrape_ioc_async",
+    "scrape_ioc_incremental",
+    "scrape_ioc_iter",
     "scrape_ioc_station",
+    "scrape_ioc_with_report",
+    "ScrapeResult",
+    "StationCache",
+    "sync_ioc_archive",
+    "SyncResult",
+    "update_ioc_catalog",
     "write_ioc_df",
+    "write_ioc_dfs",
+    # metrics
+    "get_metrics",
+    "MetricsRegistry",
     # notify
     "notify_error",
     "notify_info",
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import contextvars
 import logging
+import threading
+import types
 import typing as T
 
 import adlfs
+import azure.core.credentials
 import azure.identity.aio
+import fsspec
+import fsspec.asyn
 from azure.keyvault.secrets import SecretClient
 from azure.storage.blob import BlobServiceClient
 from azure.storage.blob import ContainerClient
@@ -50,17 +56,129 @@ def get_keyvault_client(
     return client
 
 
+class ObsSession:
+    """
+    Own a single credential, filesystem and blob client that are shared by everything that runs while
+    the session is active.
+
+    Each credential has to acquire its own tokens and each filesystem or client opens its own
+    connections, so creating them on every call is expensive. While a session is active, the
+    helpers of this module return the objects of the session instead of creating new ones
+    (unless they are explicitly passed a credential or a storage account):
+
+        with ObsSession():
+            for ioc_code in ioc_codes:
+                df = get_ioc_df(ioc_code)
+
+    The tokens are cached by the clients and are only refreshed when they are about to expire.
+    A session is only active in the thread (or `asyncio` task) that has entered it; the threads
+    of an executor don't inherit it, so pass them the filesystem of the session explicitly.
+    """
+
+    def __init__(self, credential: CredentialAIO | None = None, storage_account: str = "") -> None:
+        self._owns_credential = credential is None
+        self.credential = get_credential_aio() if credential is None else credential
+        self.storage_account = storage_account or get_settings().storage_account
+        self.is_azure = get_settings().is_azure
+        self._lock = threading.Lock()
+        self._fs: fsspec.AbstractFileSystem | None = None
+        self._blob_client: BlobServiceClient | None = None
+        self._tokens: list[contextvars.Token[ObsSession | None]] = []
+
+    @property
+    def storage_options(self) -> dict[str, T.Any]:
+        return dict(account_name=self.storage_account, credential=self.credential)
+
+    @property
+    def fs(self) -> fsspec.AbstractFileSystem:
+        with self._lock:
+            if self._fs is None and self.is_azure:
+                self._fs = adlfs.AzureBlobFileSystem(**self.storage_options, skip_instance_cache=True)
+            elif self._fs is None:
+                self._fs = _get_fsspec_fs()
+            return self._fs
+
+    @property
+    def blob_client(self) -> BlobServiceClient:
+        with self._lock:
+            if self._blob_client is None:
+                # The same credential (and tokens) as the filesystem
+                credential = _SyncCredential(self.credential)
+                self._blob_client = _create_blob_client(self.storage_account, credential=credential)
+            return self._blob_client
+
+    def close(self) -> None:
+        with self._lock:
+            if self._blob_client is not None:
+                self._blob_client.close()  # type: ignore[no-untyped-call]
+                self._blob_client = None
+            if self._fs is not None and self.is_azure:
+                fsspec.asyn.sync(self._fs.loop, self._fs.service_client.close)
+                if self._owns_credential:
+                    fsspec.asyn.sync(self._fs.loop, self.credential.close)
+            self._fs = None
+
+    def __enter__(self) -> ObsSession:
+        self._tokens.append(_SESSION.set(self))
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: types.TracebackType | None,
+    ) -> None:
+        _SESSION.reset(self._tokens.pop())
+        self.close()
+
+
+# A ContextVar, so that other threads can't pick up (and use after it has been closed) a session
+_SESSION: contextvars.ContextVar[ObsSession | None] = contextvars.ContextVar("observer_session", default=None)
+
+
+def get_active_session() -> ObsSession | None:
+    """
+    Return the innermost `ObsSession` that is active in the current thread or task, if any.
+    """
+    return _SESSION.get()
+
+
+class _SyncCredential:
+    """
+    Let the sync clients use an async credential, so that they share its tokens.
+    """
+
+    def __init__(self, credential: CredentialAIO) -> None:
+        self._credential = credential
+
+    def get_token(self, *scopes: str, **kwargs: T.Any) -> azure.core.credentials.AccessToken:
+        token: azure.core.credentials.AccessToken = fsspec.asyn.sync(
+            fsspec.asyn.get_loop(), self._credential.get_token, *scopes, **kwargs
+        )
+        return token
+
+
+def _create_blob_client(
+    storage_account: str,
+    credential: Credential | _SyncCredential,
+) -> BlobServiceClient:
+    account_url = f"https:{storage_account}.blob.core.windows.net"
+    client = BlobServiceClient(account_url=account_url, credential=credential)
+    return client
+
+
 def get_blob_client(
     storage_account: str = "",
     credential: Credential | None = None,
 ) -> BlobServiceClient:
+    session = get_active_session()
+    if session is not None and not storage_account and credential is None:
+        return session.blob_client
     if not storage_account:
         storage_account = get_settings().storage_account
-    account_url = f"https:{storage_account}.blob.core.windows.net"
     if credential is None:
         credential = get_credential()
-    client = BlobServiceClient(account_url=account_url, credential=credential)
-    return client
+    return _create_blob_client(storage_account, credential=credential)
 
 
 def get_obs_client(
@@ -69,8 +187,6 @@ def get_obs_client(
     credential: Credential | None = None,
 ) -> ContainerClient:
     settings = get_settings()
-    if not storage_account:
-        storage_account = settings.storage_account
     if not container_name:
         container_name = settings.container_name
     blob_client = get_blob_client(storage_account=storage_account, credential=credential)
@@ -81,15 +197,33 @@ def get_obs_client(
 def get_storage_options(
     credential: CredentialAIO | None = None,
 ) -> dict[str, T.Any]:
+    session = get_active_session()
+    if session is not None and credential is None:
+        return session.storage_options
     settings = get_settings()
     if credential is None:
         credential = get_credential_aio()
     return dict(account_name=settings.storage_account, credential=credential)
 
 
+def _get_fsspec_fs() -> fsspec.AbstractFileSystem:
+    fs: fsspec.AbstractFileSystem = fsspec.core.url_to_fs(get_settings().storage_root)[0]
+    return fs
+
+
 def get_obs_fs(
     credential: CredentialAIO | None = None,
-) -> adlfs.AzureBlobFileSystem:
+) -> fsspec.AbstractFileSystem:
+    """
+    Return the filesystem of the storage backend that has been configured with `Settings.storage_url`.
+
+    That's Azure Blob Storage by default, but it can be any fsspec filesystem, e.g. the local disk.
+    """
+    session = get_active_session()
+    if session is not None and credential is None:
+        return session.fs
+    if not get_settings().is_azure:
+        return _get_fsspec_fs()
     storage_options = get_storage_options(credential=credential)
     fs = adlfs.AzureBlobFileSystem(**storage_options)
     return fs
@@ -1,9 +1,31 @@
-from __future__ import annotations
-
-from typing import Annotated
+# N.B. No `from __future__ import annotations`: typer reads the `Annotated` metadata of the options
+# from `inspect.signature()`, which only has their string form when the annotations are postponed.
+import functools
+import json
+import logging
+import pathlib
+import typing as T
 
+import limits
+import multifutures
+import pandas as pd
 import typer
 
+from .azclients import ObsSession
+from .ioc.backfill import plan_ioc_shards
+from .ioc.backfill import run_ioc_backfill
+from .ioc.fs import COMPACT_COMPRESSION_LEVEL
+from .ioc.fs import get_ioc_catalog
+from .ioc.fs import get_ioc_metadata
+from .ioc.incremental import get_ioc_now
+from .ioc.mirror import sync_ioc_archive
+from .ioc.pipeline import PipelineMode
+from .ioc.pipeline import PipelineResult
+from .ioc.pipeline import run_ioc_pipeline
+from .ioc.scraper import ChunkSize
+from .ioc.scraper import get_chunk_sizes
+from .metrics import get_metrics
+
 # from .cluster_app import cluster_app
 # from .data_app import data_app
 # from .model_app import model_app
@@ -26,15 +48,371 @@ app = typer.Typer(
 # app.add_typer(model_app, name="model")
 
 
+@app.callback()
+def callback(
+    log_level: T.Annotated[str, typer.Option(help="The level of the log messages")] = "WARNING",
+) -> None:
+    logging.basicConfig(
+        level=log_level.upper(),
+        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+    )
+
+
+@app.command()
+def sync(
+    destination: T.Annotated[pathlib.Path, typer.Argument(help="The local directory of the mirror")],
+    station: T.Annotated[
+        list[str], typer.Option("--station", "-s", help="Only sync this station. Can be repeated")
+    ] = [],
+    threads: T.Annotated[int, typer.Option(help="The number of concurrent transfers")] = 10,
+    delete: T.Annotated[bool, typer.Option(help="Delete the local files that no longer exist remotely")] = True,
+) -> None:
+    """
+    Incrementally mirror the IOC archive to a local directory.
+
+    Only new or changed files are transferred. Point [blue]STORAGE_URL[/blue] to the mirror to read from it.
+    """
+    result = sync_ioc_archive(destination, ioc_codes=station or None, delete=delete, n_threads=threads)
+    typer.echo(
+        f"Transferred: {len(result.transferred)} files ({result.transferred_bytes / 2**20:.1f} MiB), "
+        f"deleted: {len(result.deleted)}, unchanged: {result.unchanged}",
+    )
+    for name, exception in result.failures.items():
+        typer.echo(f"Failed: {name}: {exception}", err=True)
+    if result.failures:
+        raise typer.Exit(code=1)
+
+
+StationOption = T.Annotated[
+    list[str], typer.Option("--station", "-s", help="Scrape this station. Can be repeated")
+]
+StationsFileOption = T.Annotated[
+    T.Optional[pathlib.Path],  # noqa: UP007
+    typer.Option(help="A file with one IOC code per line. Empty lines and lines starting with '#' are ignored"),
+]
+WhereOption = T.Annotated[
+    str,
+    typer.Option(
+        help="Only keep the stations whose metadata match this pandas query, e.g. [blue]\"country == 'Greece'\"[/blue]",
+    ),
+]
+AllOption = T.Annotated[bool, typer.Option("--all", help="Scrape all the stations of the IOC metadata")]
+EndOption = T.Annotated[
+    T.Optional[str],  # noqa: UP007
+    typer.Option(help="The end of the time range (UTC). Defaults to now"),
+]
+ThreadsOption = T.Annotated[int, typer.Option(help="The number of threads that fetch the responses")]
+ProcessesOption = T.Annotated[int, typer.Option(help="The number of processes that parse the responses")]
+ParseExecutorOption = T.Annotated[
+    str, typer.Option(help="Where to parse the responses: auto, inline, thread or process")
+]
+RateLimitOption = T.Annotated[str, typer.Option(help="The rate limit of the requests to IOC")]
+ChunkDaysOption = T.Annotated[float, typer.Option(help="The time range of each request in days")]
+AutoChunkOption = T.Annotated[
+    bool, typer.Option(help="Derive the time range of each request from the sample interval of the station")
+]
+BatchSizeOption = T.Annotated[int, typer.Option(help="The number of stations that are scraped concurrently")]
+RetriesOption = T.Annotated[
+    int, typer.Option(help="How many times the failed requests of a batch are retried")
+]
+UploadThreadsOption = T.Annotated[int, typer.Option(help="The number of concurrent uploads")]
+CompressionLevelOption = T.Annotated[
+    int,
+    typer.Option(
+        help=f"The zstd compression level. {COMPACT_COMPRESSION_LEVEL} is a good choice with a compact encoding"
+    ),
+]
+EncodingOption = T.Annotated[
+    str,
+    typer.Option(
+        help="How new stations are stored: float64, float32 or scaled (int32 thousandths). Appends keep the existing encoding",
+    ),
+]
+LayoutOption = T.Annotated[
+    str,
+    typer.Option(
+        help="How new stations are stored: wide (a column per sensor) or long (a row per measurement, partitioned by sensor). Appends keep the existing layout",
+    ),
+]
+MetricsOption = T.Annotated[
+    T.Optional[pathlib.Path],  # noqa: UP007
+    typer.Option(help="Write the run report (timings, latencies, throughput) as JSON to this file"),
+]
+PrometheusOption = T.Annotated[
+    T.Optional[pathlib.Path],  # noqa: UP007
+    typer.Option(
+        help="Write the metrics in the Prometheus text format to this file, e.g. for the textfile collector of node_exporter",
+    ),
+]
+
+
+def _get_n_sensors() -> dict[str, int]:
+    catalog = get_ioc_catalog()
+    return {
+        str(ioc_code): len(sensors) for ioc_code, sensors in catalog.sensors.items() if len(sensors)
+    }
+
+
+def _select_ioc_codes(
+    *,
+    stations: list[str],
+    stations_file: pathlib.Path | None,
+    where: str,
+    all_stations: bool,
+) -> list[str]:
+    ioc_codes = list(stations)
+    if stations_file is not None:
+        lines = (line.strip() for line in stations_file.read_text().splitlines())
+        ioc_codes.extend(line for line in lines if line and not line.startswith("#"))
+    if where or all_stations:
+        metadata = get_ioc_metadata()
+        if ioc_codes:
+            metadata = metadata[metadata.ioc_code.isin(ioc_codes)]
+        if where:
+            metadata = metadata.query(where)
+        ioc_codes = metadata.ioc_code.tolist()
+    # Remove the duplicates but keep the order
+    return list(dict.fromkeys(ioc_codes))
+
+
+def _parse_shard(shard: str) -> tuple[int, int]:
+    try:
+        index, n_shards = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise typer.BadParameter(f"Expected i/n, e.g. 1/4: {shard}", param_hint="--shard") from None
+    if not 1 <= index <= n_shards:
+        raise typer.BadParameter(
+            f"The shard must be between 1/{n_shards} and {n_shards}/{n_shards}: {shard}"
+        )
+    return index, n_shards
+
+
+def _echo_stats(result: PipelineResult, report: dict[str, T.Any]) -> None:
+    requests = report["requests"]
+    typer.echo(
+        f"Stations: {result.stations}, uploaded: {len(result.uploaded)}, failed: {len(result.failures)}\n"
+        f"Requests: {result.requests}, rows: {result.rows}, elapsed: {result.elapsed:.1f}s\n"
+        f"Throughput: {result.requests_per_second:.2f} requests/s, {result.rows_per_second:.0f} rows/s, "
+        f"{result.stations_per_minute:.1f} stations/min\n"
+        f"Downloaded: {report['downloaded_bytes'] / 2**20:.1f} MiB, retries: {requests['retries']}, "
+        f"latency p50/p95: {requests['latency_p50_seconds']}s/{requests['latency_p95_seconds']}s, "
+        f"rate limit wait: {requests['rate_limit_wait_seconds']:.1f}s",
+    )
+    for ioc_code, exception in sorted(result.failures.items()):
+        typer.echo(f"Failed: {ioc_code}: {exception!r}", err=True)
+
+
+def _run_pipeline(
+    mode: PipelineMode,
+    *,
+    station: list[str],
+    stations_file: pathlib.Path | None,
+    where: str,
+    all_stations: bool,
+    start: str,
+    end: str | None,
+    threads: int,
+    processes: int,
+    parse_executor: str,
+    rate_limit: str,
+    chunk_days: float,
+    auto_chunk_size: bool,
+    batch_size: int,
+    retries: int,
+    upload_threads: int,
+    compression_level: int,
+    encoding: str,
+    layout: str,
+    metrics: pathlib.Path | None,
+    prometheus: pathlib.Path | None,
+    shard: str = "1/1",
+    run_name: str = "",
+) -> None:
+    if not (station or stations_file or where or all_stations):
+        raise typer.BadParameter("Select the stations with --station, --stations-file, --where or --all")
+    if parse_executor not in ("auto", "inline", "thread", "process"):
+        raise typer.BadParameter(f"Unknown parse executor: {parse_executor}", param_hint="--parse-executor")
+    if encoding not in ("float64", "float32", "scaled"):
+        raise typer.BadParameter(f"Unknown encoding: {encoding}", param_hint="--encoding")
+    if layout not in ("wide", "long"):
+        raise typer.BadParameter(f"Unknown layout: {layout}", param_hint="--layout")
+    try:
+        rate = limits.parse(rate_limit)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc), param_hint="--rate-limit") from exc
+    chunk_size: ChunkSize = pd.Timedelta(days=chunk_days)
+    start_date = pd.Timestamp(start)
+    if end is not None:
+        end_date = pd.Timestamp(end)
+    elif mode == "backfill":
+        # The same on every node (and on restarts within the same day), so that the shards match
+        end_date = get_ioc_now().floor("D")
+    else:
+        end_date = get_ioc_now()
+    index, n_shards = _parse_shard(shard)
+    registry = get_metrics()
+    registry.reset()
+    with ObsSession():
+        ioc_codes = _select_ioc_codes(
+            stations=station,
+            stations_file=stations_file,
+            where=where,
+            all_stations=all_stations,
+        )
+        if auto_chunk_size:
+            # The shards of a backfill must be planned with the same chunk sizes on every node, even if
+            # the catalog changes in the meantime, so backfills use the default number of sensors
+            n_sensors = None if mode == "backfill" else _get_n_sensors()
+            chunk_size = get_chunk_sizes(get_ioc_metadata(), n_sensors=n_sensors)
+        length = len(ioc_codes)
+        pipeline: T.Callable[..., PipelineResult]
+        if mode == "backfill":
+            pipeline = functools.partial(run_ioc_backfill, shard=index, n_shards=n_shards, name=run_name)
+            plan = plan_ioc_shards(
+                ioc_codes,
+                start_date=start_date,
+                end_date=end_date,
+                n_shards=n_shards,
+                chunk_size=chunk_size,
+            )
+            length = len(plan[index - 1])
+        else:
+            pipeline = functools.partial(run_ioc_pipeline, mode=mode, from_catalog=True)
+        progress_bar: T.Any = typer.progressbar(length=length, label=mode.capitalize())
+        with progress_bar:
+            result = pipeline(
+                ioc_codes,
+                start_date=start_date,
+                end_date=end_date,
+                chunk_size=chunk_size,
+                rate_limit=multifutures.RateLimit(rate_limit=rate),
+                n_threads=threads,
+                n_processes=processes,
+                parse_executor=T.cast(T.Any, parse_executor),
+                batch_size=batch_size,
+                n_retries=retries,
+                n_upload_threads=upload_threads,
+                compression_level=compression_level,
+                encoding=T.cast(T.Any, encoding),
+                layout=T.cast(T.Any, layout),
+                progress=progress_bar.update,
+            )
+    report = registry.report()
+    _echo_stats(result, report)
+    if metrics is not None:
+        pipeline_report = {
+            "mode": mode,
+            "stations": result.stations,
+            "uploaded": len(result.uploaded),
+            "failed": sorted(result.failures),
+            "requests": result.requests,
+            "rows": result.rows,
+            "elapsed_seconds": result.elapsed,
+        }
+        metrics.write_text(json.dumps({"pipeline": pipeline_report, **report}, indent=2))
+    if prometheus is not None:
+        prometheus.write_text(registry.to_prometheus())
+    if result.failures:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def scrape(
+    start: T.Annotated[str, typer.Option(help="The start of the time range (UTC)")],
+    end: EndOption = None,
+    station: StationOption = [],
+    stations_file: StationsFileOption = None,
+    where: WhereOption = "",
+    all_stations: AllOption = False,
+    threads: ThreadsOption = 5,
+    processes: ProcessesOption = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutorOption = "auto",
+    rate_limit: RateLimitOption = "5/second",
+    chunk_days: ChunkDaysOption = 30.0,
+    auto_chunk_size: AutoChunkOption = False,
+    batch_size: BatchSizeOption = 50,
+    retries: RetriesOption = 1,
+    upload_threads: UploadThreadsOption = 10,
+    compression_level: CompressionLevelOption = 0,
+    encoding: EncodingOption = "float64",
+    layout: LayoutOption = "wide",
+    metrics: MetricsOption = None,
+    prometheus: PrometheusOption = None,
+) -> None:
+    """
+    Scrape a time range and append it to the stored stations.
+    """
+    _run_pipeline("scrape", **locals())
+
+
 @app.command()
-def main(
-    a: Annotated[str, typer.Option(help="This is option a")],
-    # timeout: Annotated[int, typer.Option( help="The timeout countdown. If it expires, you probably haven't setup the managed identity correctly.")] = 5,
-    # no_attempts: Annotated[int, typer.Option(help="How many times to retry to login")] = 3,
-    # show_output: Annotated[bool, SHOW_OUTPUT_OPTION] = True,
-    # show_traceback: Annotated[bool, SHOW_TRACEBACK_OPTION] = True,
-) -> None:  ## fmt: skip
+def backfill(
+    start: T.Annotated[str, typer.Option(help="The start of the time range (UTC)")],
+    end: EndOption = None,
+    station: StationOption = [],
+    stations_file: StationsFileOption = None,
+    where: WhereOption = "",
+    all_stations: AllOption = False,
+    threads: ThreadsOption = 5,
+    processes: ProcessesOption = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutorOption = "auto",
+    rate_limit: RateLimitOption = "5/second",
+    chunk_days: ChunkDaysOption = 30.0,
+    auto_chunk_size: AutoChunkOption = False,
+    batch_size: BatchSizeOption = 50,
+    retries: RetriesOption = 1,
+    upload_threads: UploadThreadsOption = 10,
+    compression_level: CompressionLevelOption = 0,
+    encoding: EncodingOption = "float64",
+    layout: LayoutOption = "wide",
+    metrics: MetricsOption = None,
+    prometheus: PrometheusOption = None,
+    shard: T.Annotated[
+        str,
+        typer.Option(
+            help="Only backfill shard i of n, e.g. 2/4. The stations are split between the shards by their number of requests",
+        ),
+    ] = "1/1",
+    run_name: T.Annotated[
+        str, typer.Option(help="The name of the checkpoint manifests. Defaults to the time range")
+    ] = "",
+) -> None:
+    """
+    Scrape the whole history of the stations and [red]replace[/red] the stored data.
+
+    The completed stations are checkpointed, so a backfill that is restarted with the same arguments
+    skips them. Run it with e.g. [blue]--shard 1/4[/blue] ... [blue]--shard 4/4[/blue] on different nodes
+    to split the work. Without [blue]--end[/blue] it ends at the start of the current day (UTC).
     """
-    Login to [blue]azure-cli[/blue] and [blue]azcopy[/blue] using [italic]system-managed-identity[/italic].
+    _run_pipeline("backfill", **locals())
+
 
+@app.command()
+def update(
+    start: T.Annotated[
+        str, typer.Option(help="Where to start from for the stations that have not been stored yet (UTC)")
+    ] = "2010-01-01",
+    end: EndOption = None,
+    station: StationOption = [],
+    stations_file: StationsFileOption = None,
+    where: WhereOption = "",
+    all_stations: AllOption = False,
+    threads: ThreadsOption = 5,
+    processes: ProcessesOption = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutorOption = "auto",
+    rate_limit: RateLimitOption = "5/second",
+    chunk_days: ChunkDaysOption = 30.0,
+    auto_chunk_size: AutoChunkOption = False,
+    batch_size: BatchSizeOption = 50,
+    retries: RetriesOption = 1,
+    upload_threads: UploadThreadsOption = 10,
+    compression_level: CompressionLevelOption = 0,
+    encoding: EncodingOption = "float64",
+    layout: LayoutOption = "wide",
+    metrics: MetricsOption = None,
+    prometheus: PrometheusOption = None,
+) -> None:
+    """
+    Scrape the data after the last stored timestamp of each station and append them.
     """
+    _run_pipeline("update", **locals())
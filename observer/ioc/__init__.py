@@ -1,19 +1,71 @@
 from __future__ import annotations
 
+from .archive import open_ioc_archive
+from .backfill import plan_ioc_shards
+from .backfill import run_ioc_backfill
+from .cache import ResponseCache
+from .cache import StationCache
+from .fs import compact_ioc_archive
+from .fs import compact_ioc_station
+from .fs import get_ioc_catalog
+from .fs import get_ioc_dataset
 from .fs import get_ioc_df
+from .fs import get_ioc_dfs
+from .fs import get_ioc_last_timestamp
+from .fs import get_ioc_last_timestamps
 from .fs import get_ioc_metadata
 from .fs import get_ioc_parquet_file
 from .fs import list_ioc_stations
+from .fs import update_ioc_catalog
 from .fs import write_ioc_df
+from .fs import write_ioc_dfs
+from .incremental import get_ioc_start_dates
+from .incremental import scrape_ioc_incremental
+from .mirror import sync_ioc_archive
+from .mirror import SyncResult
+from .pipeline import PipelineResult
+from .pipeline import run_ioc_pipeline
+from .scraper import FailedChunk
+from .scraper import retry_failed_chunks
 from .scraper import scrape_ioc
+from .scraper import scrape_ioc_async
+from .scraper import scrape_ioc_iter
 from .scraper import scrape_ioc_station
+from .scraper import scrape_ioc_with_report
+from .scraper import ScrapeResult
 
 __all__: list[str] = [
+    "compact_ioc_archive",
+    "compact_ioc_station",
+    "FailedChunk",
+    "get_ioc_catalog",
+    "get_ioc_dataset",
     "get_ioc_df",
+    "get_ioc_dfs",
+    "get_ioc_last_timestamp",
+    "get_ioc_last_timestamps",
     "get_ioc_metadata",
     "get_ioc_parquet_file",
+    "get_ioc_start_dates",
     "list_ioc_stations",
+    "open_ioc_archive",
+    "PipelineResult",
+    "plan_ioc_shards",
+    "ResponseCache",
+    "retry_failed_chunks",
+    "run_ioc_backfill",
+    "run_ioc_pipeline",
     "scrape_ioc",
+    "scrape_ioc_async",
+    "scrape_ioc_incremental",
+    "scrape_ioc_iter",
     "scrape_ioc_station",
+    "scrape_ioc_with_report",
+    "ScrapeResult",
+    "StationCache",
+    "sync_ioc_archive",
+    "SyncResult",
+    "update_ioc_catalog",
     "write_ioc_df",
+    "write_ioc_dfs",
 ]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+
+import dask.dataframe as dd
+import fastparquet
+import fsspec
+import multifutures
+import pandas as pd
+from dask.delayed import delayed
+
+from observer.azclients import CredentialAIO
+from observer.azclients import get_obs_fs
+
+from .cache import StationCache
+from .fs import get_ioc_parquet_file
+from .fs import get_ioc_sensors
+from .fs import get_ioc_time_filters
+from .fs import get_ioc_years
+from .fs import list_ioc_stations
+from .fs import read_ioc_station_df
+
+logger = logging.getLogger(__name__)
+
+
+def _open_parquet_file(
+    ioc_code: str,
+    *,
+    fs: fsspec.AbstractFileSystem,
+    cache: StationCache | None,
+) -> fastparquet.ParquetFile | None:
+    try:
+        pf = get_ioc_parquet_file(ioc_code=ioc_code, fs=fs, cache=cache)
+    except FileNotFoundError:
+        logger.warning("%s: No data", ioc_code)
+        return None
+    return pf
+
+
+def _make_meta(columns: list[str], ioc_code_dtype: pd.CategoricalDtype) -> pd.DataFrame:
+    meta = pd.DataFrame(
+        {column: pd.Series([], dtype=float) for column in columns},
+        index=pd.DatetimeIndex([], dtype="datetime64[ns]", name="time"),
+    )
+    meta["ioc_code"] = pd.Series([], dtype=ioc_code_dtype)
+    return meta
+
+
+def _read_partition(
+    pf: fastparquet.ParquetFile,
+    *,
+    ioc_code: str,
+    year: int,
+    columns: list[str],
+    ioc_code_dtype: pd.CategoricalDtype,
+    start_date: pd.Timestamp | None,
+    end_date: pd.Timestamp | None,
+) -> pd.DataFrame:
+    filters = [("year", "==", year), *get_ioc_time_filters(start_date=start_date, end_date=end_date)]
+    df = read_ioc_station_df(
+        pf,
+        filters=filters,
+        start_date=start_date,
+        end_date=end_date,
+        sensors=columns,
+        dtype="float64",
+        layout="wide",
+        ioc_code=ioc_code,
+    )
+    # All the partitions must have the same columns, even if the station lacks some sensors
+    df = df.reindex(columns=columns).astype(float)
+    df["ioc_code"] = pd.Categorical([ioc_code] * len(df), dtype=ioc_code_dtype)
+    return df
+
+
+def open_ioc_archive(
+    ioc_codes: list[str] | None = None,
+    start_date: pd.Timestamp | None = None,
+    end_date: pd.Timestamp | None = None,
+    *,
+    sensors: list[str] | None = None,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    cache: StationCache | None = None,
+    n_threads: int = 10,
+) -> dd.DataFrame:
+    """
+    Return a lazy dask dataframe over the stored IOC stations, with one partition per station and year.
+
+    Only the parquet metadata are being read; the data are read when the dataframe is computed.
+    The dataframe contains one column per sensor plus a categorical `ioc_code` column.
+    If `ioc_codes` is not specified, all the stored stations are included.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    if ioc_codes is None:
+        ioc_codes = list_ioc_stations(fs=fs)
+    results = multifutures.multithread(
+        func=_open_parquet_file,
+        func_kwargs=[dict(ioc_code=ioc_code, fs=fs, cache=cache) for ioc_code in ioc_codes],
+        check=True,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    pfs = {result.kwargs["ioc_code"]: result.result for result in results}  # type: ignore[index]
+    pfs = {ioc_code: pfs[ioc_code] for ioc_code in ioc_codes if pfs[ioc_code] is not None}
+    available = sorted({sensor for pf in pfs.values() for sensor in get_ioc_sensors(pf)})
+    columns = available if sensors is None else [column for column in available if column in sensors]
+    ioc_code_dtype = pd.CategoricalDtype(list(pfs))
+    meta = _make_meta(columns=columns, ioc_code_dtype=ioc_code_dtype)
+    parts = []
+    for ioc_code, pf in pfs.items():
+        for year in get_ioc_years(pf):
+            if start_date is not None and year < start_date.year:
+                continue
+            if end_date is not None and year > end_date.year:
+                continue
+            part = delayed(_read_partition)(
+                pf,
+                ioc_code=ioc_code,
+                year=year,
+                columns=columns,
+                ioc_code_dtype=ioc_code_dtype,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            parts.append(part)
+    if not parts:
+        return dd.from_pandas(meta, npartitions=1)
+    ddf = dd.from_delayed(parts, meta=meta, verify_meta=False)
+    return T.cast(dd.DataFrame, ddf)
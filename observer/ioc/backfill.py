@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import posixpath
+import time
+import typing as T
+
+import azure.core.exceptions
+import fsspec
+import pandas as pd
+import pydantic
+
+from observer.azclients import CredentialAIO
+from observer.azclients import get_obs_fs
+from observer.settings import get_settings
+
+from .fs import update_ioc_catalog
+from .pipeline import PipelineResult
+from .pipeline import run_ioc_pipeline
+from .scraper import ChunkSize
+from .scraper import DEFAULT_CHUNK_SIZE
+from .scraper import generate_station_urls
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillManifest(pydantic.BaseModel):
+    """
+    The checkpoint of a backfill shard.
+
+    It is stored next to the data, so that every node can see the progress of every shard.
+    """
+
+    shard: int
+    n_shards: int
+    start_date: str
+    end_date: str
+    ioc_codes: list[str]
+    completed: list[str] = []
+    # ioc_code -> the last error
+    failed: dict[str, str] = {}
+
+    @property
+    def is_complete(self) -> bool:
+        return set(self.ioc_codes) <= set(self.completed)
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether every station has either been completed or has failed."""
+        return set(self.ioc_codes) <= set(self.completed) | set(self.failed)
+
+
+def _get_backfill_name(start_date: pd.Timestamp, end_date: pd.Timestamp) -> str:
+    return f"{start_date:%Y%m%dT%H%M}-{end_date:%Y%m%dT%H%M}"
+
+
+def _get_manifest_uri(name: str, shard: int, n_shards: int) -> str:
+    settings = get_settings()
+    uri = f"{settings.storage_root}/ioc/backfills/{name}/shard-{shard}-of-{n_shards}.json"
+    return uri
+
+
+def _get_marker_uri(name: str, marker: str) -> str:
+    settings = get_settings()
+    uri = f"{settings.storage_root}/ioc/backfills/{name}/{marker}"
+    return uri
+
+
+def _read_manifest(fs: fsspec.AbstractFileSystem, uri: str) -> BackfillManifest | None:
+    try:
+        content = fs.cat_file(uri)
+    except FileNotFoundError:
+        return None
+    return BackfillManifest(**json.loads(content))
+
+
+def _write_manifest(fs: fsspec.AbstractFileSystem, uri: str, manifest: BackfillManifest) -> None:
+    fs.mkdirs(posixpath.dirname(uri), exist_ok=True)
+    fs.pipe_file(uri, manifest.model_dump_json(indent=2).encode())
+
+
+def _create_marker(fs: fsspec.AbstractFileSystem, uri: str) -> bool:
+    """Create the empty file `uri` unless it already exists; return whether it has been created."""
+    if fs.exists(uri):
+        return False
+    # Blob storage only creates the blob if it doesn't exist, so that only one of several concurrent calls succeeds
+    try:
+        fs.pipe_file(uri, b"", overwrite=False)
+    except (FileExistsError, azure.core.exceptions.ResourceExistsError):
+        return False
+    return True
+
+
+def plan_ioc_shards(
+    ioc_codes: list[str],
+    *,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    n_shards: int,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+) -> list[list[str]]:
+    """
+    Split the stations into `n_shards` disjoint shards with roughly the same number of requests.
+
+    All the time chunks of a station belong to the same shard, because a station can only be
+    written by one process at a time. The plan only depends on the arguments (not on the order of
+    `ioc_codes`), so every node computes the same plan.
+    """
+    if n_shards < 1:
+        raise ValueError(f"'n_shards' must be positive: {n_shards}")
+    n_requests = {
+        ioc_code: len(
+            generate_station_urls(ioc_code, start_date=start_date, end_date=end_date, chunk_size=chunk_size)
+        )
+        for ioc_code in sorted(set(ioc_codes))
+    }
+    # Longest processing time first: assign the most expensive stations first, each to the least loaded shard
+    shards: list[list[str]] = [[] for _ in range(n_shards)]
+    loads = [0] * n_shards
+    for ioc_code in sorted(n_requests, key=lambda ioc_code: (-n_requests[ioc_code], ioc_code)):
+        index = min(range(n_shards), key=lambda index: (loads[index], index))
+        shards[index].append(ioc_code)
+        loads[index] += n_requests[ioc_code]
+    return [sorted(shard) for shard in shards]
+
+
+def _update_catalog_if_finished(
+    fs: fsspec.AbstractFileSystem,
+    name: str,
+    n_shards: int,
+) -> None:
+    completed: list[str] = []
+    for shard in range(1, n_shards + 1):
+        manifest = _read_manifest(fs, _get_manifest_uri(name, shard, n_shards))
+        if manifest is None or not manifest.is_finished:
+            logger.info(
+                "Backfill %s: shard %d/%d is not finished, not updating the catalog", name, shard, n_shards
+            )
+            return
+        completed.extend(manifest.completed)
+    # Shards that finish at the same time would update the catalog concurrently, so only the one that
+    # creates the marker does. If a restart completes more stations, the marker is a different one.
+    digest = hashlib.sha256("\n".join(sorted(completed)).encode()).hexdigest()[:16]
+    marker_uri = _get_marker_uri(name, f"catalog-updated-{digest}")
+    if not _create_marker(fs, marker_uri):
+        logger.info("Backfill %s: the catalog has already been updated by another shard", name)
+        return
+    logger.info("Backfill %s: all the shards are finished, updating the catalog", name)
+    try:
+        update_ioc_catalog(sorted(completed), fs=fs)
+    except Exception:
+        # Let a restart update the catalog
+        fs.rm(marker_uri)
+        raise
+
+
+def run_ioc_backfill(
+    ioc_codes: list[str],
+    *,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    shard: int = 1,
+    n_shards: int = 1,
+    name: str = "",
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    batch_size: int = 50,
+    credential: CredentialAIO | None = None,
+    progress: T.Callable[[int], None] | None = None,
+    **kwargs: T.Any,
+) -> PipelineResult:
+    """
+    Backfill shard `shard` (1-based) of `n_shards` and checkpoint its progress in a manifest.
+
+    Every node must be passed the same `ioc_codes`, dates and `chunk_size`, so that the shards are
+    disjoint (see `plan_ioc_shards()`). After each batch the completed stations are recorded in the
+    manifest of the shard; if the backfill is restarted, they are skipped. The manifests are stored
+    under `ioc/backfills/{name}`; `name` defaults to the time range.
+
+    The catalog can't be updated concurrently, so with more than one shard it is only updated
+    by the shard that finds all the shards finished, with the completed stations of every shard.
+    If several shards finish at the same time, a marker file next to the manifests makes sure that
+    only one of them updates the catalog.
+    Failed stations don't hold the catalog back; they are retried (and added to the catalog)
+    when the backfill is restarted. Any extra `kwargs` are passed to `run_ioc_pipeline()`.
+    """
+    if not 1 <= shard <= n_shards:
+        raise ValueError(f"'shard' must be between 1 and {n_shards}: {shard}")
+    name = name or _get_backfill_name(start_date, end_date)
+    fs = get_obs_fs(credential=credential)
+    plan = plan_ioc_shards(
+        ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        n_shards=n_shards,
+        chunk_size=chunk_size,
+    )
+    uri = _get_manifest_uri(name, shard, n_shards)
+    manifest = _read_manifest(fs, uri)
+    if manifest is None:
+        manifest = BackfillManifest(
+            shard=shard,
+            n_shards=n_shards,
+            start_date=str(start_date),
+            end_date=str(end_date),
+            ioc_codes=plan[shard - 1],
+        )
+        _write_manifest(fs, uri, manifest)
+    elif (manifest.start_date, manifest.end_date) != (str(start_date), str(end_date)):
+        raise ValueError(f"The time range of shard {shard}/{n_shards} doesn't match its manifest: {uri}")
+    elif manifest.ioc_codes != plan[shard - 1]:
+        raise ValueError(f"The stations of shard {shard}/{n_shards} don't match its manifest: {uri}")
+    pending = [ioc_code for ioc_code in manifest.ioc_codes if ioc_code not in manifest.completed]
+    logger.info(
+        "Backfill %s: shard %d/%d: stations: %d, already completed: %d",
+        name,
+        shard,
+        n_shards,
+        len(manifest.ioc_codes),
+        len(manifest.ioc_codes) - len(pending),
+    )
+    if progress is not None:
+        progress(len(manifest.ioc_codes) - len(pending))
+
+    result = PipelineResult()
+    started = time.perf_counter()
+    for offset in range(0, len(pending), batch_size):
+        batch_codes = pending[offset : offset + batch_size]
+        batch_result = run_ioc_pipeline(
+            batch_codes,
+            start_date=start_date,
+            end_date=end_date,
+            mode="backfill",
+            chunk_size=chunk_size,
+            batch_size=batch_size,
+            credential=credential,
+            update_catalog=n_shards == 1,
+            progress=progress,
+            **kwargs,
+        )
+        result.stations += batch_result.stations
+        result.requests += batch_result.requests
+        result.rows += batch_result.rows
+        result.uploaded.extend(batch_result.uploaded)
+        result.failures.update(batch_result.failures)
+        # Stations without any data are complete too
+        for ioc_code in batch_codes:
+            if ioc_code in batch_result.failures:
+                manifest.failed[ioc_code] = repr(batch_result.failures[ioc_code])
+            else:
+                manifest.completed.append(ioc_code)
+                manifest.failed.pop(ioc_code, None)
+        _write_manifest(fs, uri, manifest)
+    result.elapsed = time.perf_counter() - started
+    if n_shards > 1 and manifest.is_finished:
+        _update_catalog_if_finished(fs, name=name, n_shards=n_shards)
+    return result
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import typing as T
+import urllib.parse
+
+import fastparquet
+import fsspec
+import fsspec.utils
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    A persistent on-disk cache of IOC responses, keyed by `(ioc_code, timestart, timestop)`.
+
+    Only closed historical windows are cached, i.e. windows whose `timestop` is older than `min_age`;
+    the data of recent windows may still change. When the total size of the cache exceeds
+    `max_size` bytes, the least recently used responses are evicted.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        max_size: int = 2 * 2**30,
+        min_age: pd.Timedelta = pd.Timedelta(days=1),
+    ) -> None:
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._iter_files())
+
+    def _iter_files(self) -> list[pathlib.Path]:
+        return list(self.directory.glob("*/*.json"))
+
+    def _get_path(self, ioc_code: str, timestart: str, timestop: str) -> pathlib.Path:
+        # Avoid ":" in filenames
+        filename = f"{timestart}_{timestop}.json".replace(":", "")
+        return self.directory / ioc_code / filename
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def is_cacheable(self, timestop: str) -> bool:
+        return pd.Timestamp(timestop) < pd.Timestamp.now(tz="UTC").tz_localize(None) - self.min_age
+
+    def get(self, ioc_code: str, timestart: str, timestop: str) -> str | None:
+        path = self._get_path(ioc_code=ioc_code, timestart=timestart, timestop=timestop)
+        try:
+            content = path.read_text()
+        except FileNotFoundError:
+            return None
+        # Update the modification time so that eviction is LRU. Unlike `touch()`, `utime()` doesn't
+        # recreate (as an empty file) a response that has been evicted since it was read
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        logger.debug("%s: Cache hit: %s - %s", ioc_code, timestart, timestop)
+        return content
+
+    def set(self, ioc_code: str, timestart: str, timestop: str, content: str) -> None:
+        if not self.is_cacheable(timestop=timestop):
+            return
+        path = self._get_path(ioc_code=ioc_code, timestart=timestart, timestop=timestop)
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see partial responses
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as fd:
+            fd.write(content)
+        with self._lock:
+            if path.exists():
+                self._size -= path.stat().st_size
+            os.replace(fd.name, path)
+            self._size += path.stat().st_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        files = []
+        for path in self._iter_files():
+            try:
+                files.append((path.stat().st_mtime, path.stat().st_size, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+            logger.debug("Evicted from cache: %s", path)
+
+    def get_url(self, url: str) -> str | None:
+        return self.get(*_parse_url(url))
+
+    def set_url(self, url: str, content: str) -> None:
+        self.set(*_parse_url(url), content=content)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self._iter_files():
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+
+def _parse_url(url: str) -> tuple[str, str, str]:
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    return query["code"][0], query["timestart"][0], query["timestop"][0]
+
+
+class StationCache:
+    """
+    A local read-through cache of the station parquet files.
+
+    Opening a station costs a single listing of its remote directory: every file whose ETag
+    has changed since it was downloaded is considered stale. The metadata are always fetched,
+    but the data files are only downloaded when a row group that they contain is being read.
+    When the total size of the cache exceeds `max_size` bytes, the least recently used
+    stations are evicted.
+    """
+
+    def __init__(self, directory: str | os.PathLike[str], max_size: int = 10 * 2**30) -> None:
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self.directory.rglob("*") if path.is_file())
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_parquet_file(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        uri: str,
+        **kwargs: T.Any,
+    ) -> fastparquet.ParquetFile:
+        root = fs._strip_protocol(uri)
+        listing = fs.find(root, detail=True)
+        if not listing:
+            raise FileNotFoundError(uri)
+        versions = {path[len(root) :].lstrip("/"): get_file_version(info) for path, info in listing.items()}
+        local_root = self.directory / root.lstrip("/")
+        local_root.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest(local_root)
+        # Drop the files that have been changed or removed remotely
+        for name, version in list(manifest.items()):
+            if versions.get(name) != version:
+                self._remove(local_root / name)
+                del manifest[name]
+        fetch = functools.partial(
+            self._fetch,
+            fs=fs,
+            root=root,
+            local_root=local_root,
+            versions=versions,
+            manifest=manifest,
+        )
+        for name in ("_metadata", "_common_metadata"):
+            if name in versions:
+                fetch(name)
+        self._save_manifest(local_root, manifest)
+        pf = fastparquet.ParquetFile(str(local_root), **kwargs)
+
+        def open_with(path: str, mode: str = "rb") -> T.IO[bytes]:
+            name = pathlib.Path(path).relative_to(local_root).as_posix()
+            if name not in manifest:
+                fetch(name)
+                self._save_manifest(local_root, manifest)
+            return open(path, mode)
+
+        pf.open = open_with
+        self._evict(keep=local_root)
+        return pf
+
+    def _fetch(
+        self,
+        name: str,
+        *,
+        fs: fsspec.AbstractFileSystem,
+        root: str,
+        local_root: pathlib.Path,
+        versions: dict[str, str],
+        manifest: dict[str, str],
+    ) -> None:
+        if name in manifest:
+            return
+        path = local_root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        logger.debug("Downloading to cache: %s/%s", root, name)
+        with download_to_temp_file(fs, f"{root}/{name}", directory=path.parent) as tmp:
+            with self._lock:
+                if path.exists():
+                    self._size -= path.stat().st_size
+                os.replace(tmp, path)
+                self._size += path.stat().st_size
+        manifest[name] = versions[name]
+
+    def _remove(self, path: pathlib.Path) -> None:
+        with self._lock:
+            try:
+                self._size -= path.stat().st_size
+            except FileNotFoundError:
+                return
+            path.unlink(missing_ok=True)
+
+    def _load_manifest(self, local_root: pathlib.Path) -> dict[str, str]:
+        try:
+            manifest: dict[str, str] = json.loads((local_root / "_manifest.json").read_text())
+        except FileNotFoundError:
+            manifest = {}
+        return manifest
+
+    def _save_manifest(self, local_root: pathlib.Path, manifest: dict[str, str]) -> None:
+        # The modification time of the manifest is used for the LRU eviction
+        path = local_root / "_manifest.json"
+        with self._lock:
+            if path.exists():
+                self._size -= path.stat().st_size
+            path.write_text(json.dumps(manifest))
+            self._size += path.stat().st_size
+
+    def _evict(self, keep: pathlib.Path) -> None:
+        with self._lock:
+            if self._size <= self.max_size:
+                return
+            manifests = sorted(self.directory.rglob("_manifest.json"), key=lambda path: path.stat().st_mtime)
+            for manifest in manifests:
+                if self._size <= self.max_size:
+                    break
+                local_root = manifest.parent
+                if local_root == keep:
+                    continue
+                size = sum(path.stat().st_size for path in local_root.rglob("*") if path.is_file())
+                shutil.rmtree(local_root, ignore_errors=True)
+                self._size -= size
+                logger.debug("Evicted from cache: %s", local_root)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.directory.iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+            self._size = 0
+
+
+def get_file_version(info: dict[str, T.Any]) -> str:
+    """
+    Return a string that changes whenever the file that `info` (e.g. from `fs.info()`) describes changes.
+    """
+    # Blob storage returns an ETag; fall back to the remaining properties for other filesystems
+    etag = info.get("etag")
+    if etag:
+        return str(etag)
+    return str(fsspec.utils.tokenize(info))
+
+
+@contextlib.contextmanager
+def download_to_temp_file(
+    fs: fsspec.AbstractFileSystem,
+    remote_path: str,
+    directory: pathlib.Path,
+) -> T.Iterator[str]:
+    """
+    Download `remote_path` to a temporary file in `directory` and yield its path.
+
+    Move the file to its final path (e.g. with `os.replace()`) within the context, so that concurrent
+    readers never see partial files. Otherwise it is removed on exit.
+    """
+    handle, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(handle)
+    try:
+        fs.get_file(remote_path, tmp)
+        yield tmp
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
@@ -1,20 +1,69 @@
 from __future__ import annotations
 
+import contextlib
+import functools
 import logging
+import math
+import posixpath
+import threading
 import typing as T
 
 import azure.identity.aio
 import fastparquet
+import fsspec
+import multifutures
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+import xarray as xr
 
 from observer.azclients import CredentialAIO
 from observer.azclients import get_obs_fs
-from observer.azclients import get_storage_options
+from observer.ioc.cache import StationCache
+from observer.ioc.parser import concat_long_ioc_dfs
+from observer.ioc.parser import DataLayout
+from observer.ioc.parser import empty_long_ioc_df
+from observer.ioc.parser import is_long_ioc_df
+from observer.ioc.parser import LONG_COLUMNS
+from observer.ioc.parser import melt_ioc_df
+from observer.ioc.parser import pivot_long_ioc_df
+from observer.ioc.parser import SENSOR_DTYPE
+from observer.metrics import CountingFile
+from observer.metrics import get_metrics
 from observer.settings import get_settings
 
 
 logger = logging.getLogger(__name__)
 
+# One year of 1-minute data fits in a single row group
+DEFAULT_ROW_GROUP_SIZE = 600_000
+
+# How the stations are stored:
+#   - "float64": nanosecond timestamps and float64 values, i.e. exactly as they are parsed
+#   - "float32": millisecond timestamps and float32 values
+#   - "scaled": millisecond timestamps and the values as nullable int32 multiples of 1/VALUE_SCALE
+# The IOC timestamps have a resolution of 1 second and the values (at most) 3 decimals, so "scaled" does not
+# lose any precision, while "float32" keeps ~7 significant digits. The timestamps are the bulk of a station and
+# compress much better in milliseconds (the finest unit that fastparquet stores as a parquet timestamp type).
+# Together with a higher compression level (e.g. COMPACT_COMPRESSION_LEVEL) the compact encodings take about
+# half the space of "float64".
+StorageEncoding: T.TypeAlias = T.Literal["float64", "float32", "scaled"]
+ENCODING_KEY = "observer_encoding"
+VALUE_SCALE = 1000
+COMPACT_COMPRESSION_LEVEL = 9
+
+# The layout of a station (see `DataLayout`) is recorded next to its encoding. The "wide" stations are
+# partitioned by year; the "long" ones by sensor, so reading a sensor only downloads its own files. The latter
+# store the year as a column instead and no row group spans two years, so the `year` filters still prune the
+# row groups. (fastparquet partitions on more than one column with a `groupby()` that is ~10x slower than
+# writing the data.)
+LAYOUT_KEY = "observer_layout"
+
+# The metadata and the catalog are small and read often, so they are only downloaded once per process.
+# They are cached by URI, because the filesystems and credentials are usually created anew on every call.
+_FILE_CACHE: dict[str, pd.DataFrame] = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
 
 def _get_compression(compression_level: int) -> dict[str, T.Any]:
     return {
@@ -27,30 +76,234 @@ def _get_compression(compression_level: int) -> dict[str, T.Any]:
 
 def _get_metadata_uri() -> str:
     settings = get_settings()
-    uri = f"az://{settings.container_name}/ioc/metadata.parquet"
+    uri = f"{settings.storage_root}/ioc/metadata.parquet"
     return uri
 
 
-def _get_station_uri(ioc_code: str) -> str:
+def _get_catalog_uri() -> str:
     settings = get_settings()
-    uri = f"az://{settings.container_name}/ioc/stations/{ioc_code}.parquet"
+    uri = f"{settings.storage_root}/ioc/catalog.parquet"
+    return uri
+
+
+def _get_stations_uri() -> str:
+    settings = get_settings()
+    uri = f"{settings.storage_root}/ioc/stations"
+    return uri
+
+
+def _get_station_uri(ioc_code: str) -> str:
+    uri = f"{_get_stations_uri()}/{ioc_code}.parquet"
     return uri
 
 
-def get_ioc_metadata(*, credential: CredentialAIO | None = None) -> pd.DataFrame:
+def get_ioc_metadata(*, credential: CredentialAIO | None = None, refresh: bool = False) -> pd.DataFrame:
     """
     Return the IOC metadata from Blob
+
+    The metadata are only downloaded once per process, unless `refresh` is `True`.
     """
-    settings = get_settings()
-    storage_options = get_storage_options(credential=credential)
-    df = pd.read_parquet(
-        _get_metadata_uri(),
-        storage_options=storage_options,
-        engine=settings.engine,
-    )
+    read = functools.partial(_read_ioc_metadata, credential=credential)
+    return _read_cached(_get_metadata_uri(), read=read, refresh=refresh).copy()
+
+
+def _read_cached(uri: str, read: T.Callable[[], pd.DataFrame], refresh: bool) -> pd.DataFrame:
+    with _FILE_CACHE_LOCK:
+        df = None if refresh else _FILE_CACHE.get(uri)
+    if df is None:
+        df = read()
+        with _FILE_CACHE_LOCK:
+            _FILE_CACHE[uri] = df
     return df
 
 
+def _read_ioc_metadata(credential: CredentialAIO | None) -> pd.DataFrame:
+    fs = get_obs_fs(credential=credential)
+    pf = fastparquet.ParquetFile(_get_metadata_uri(), fs=fs)
+    df: pd.DataFrame = pf.to_pandas()
+    return df
+
+
+def _get_row_group_offsets(partition_keys: list[npt.NDArray[np.int_]], row_group_size: int) -> list[int]:
+    # Start a new row group on every change of partition (e.g. of year), so that no row group spans
+    # two partitions (fastparquet would write each part of it as a separate file)
+    changes = np.zeros(len(partition_keys[0]), dtype=bool)
+    for keys in partition_keys:
+        changes |= np.diff(keys, prepend=-1) != 0
+    partition_starts = np.flatnonzero(changes)
+    partition_stops = [*partition_starts[1:], len(changes)]
+    offsets = [
+        offset
+        for start, stop in zip(partition_starts, partition_stops)
+        for offset in range(start, stop, row_group_size)
+    ]
+    return offsets or [0]
+
+
+def encode_ioc_df(df: pd.DataFrame, encoding: StorageEncoding) -> pd.DataFrame:
+    """
+    Convert a dataframe with either layout (see `DataLayout`) to `encoding`.
+    """
+    if encoding == "float64":
+        return df
+    if encoding not in ("float32", "scaled"):
+        raise ValueError(f"Unknown encoding: {encoding}")
+    # Arrays, not Series, so that the frame is not aligned on a (possibly duplicated) index
+    columns: dict[str, T.Any] = {}
+    for column in df.columns:
+        if column in ("year", "sensor"):
+            columns[column] = df[column].array
+        elif column == "time":
+            columns[column] = df[column].to_numpy().astype("datetime64[ms]")
+        elif encoding == "float32":
+            columns[column] = df[column].to_numpy(dtype=np.float32)
+        else:
+            scaled = np.round(df[column].to_numpy(dtype=float) * VALUE_SCALE)
+            if np.nanmax(np.abs(scaled), initial=0) >= 2**31:
+                raise ValueError(f"Column {column!r} has values that can't be scaled to int32")
+            columns[column] = pd.array(scaled, dtype="Int32")
+    index = df.index
+    if isinstance(index, pd.DatetimeIndex):
+        index = index.as_unit("ms")  # type: ignore[attr-defined]
+    encoded = pd.DataFrame(columns, index=index)
+    encoded.columns.name = df.columns.name
+    return encoded
+
+
+def decode_ioc_df(
+    df: pd.DataFrame,
+    encoding: str,
+    dtype: T.Literal["float64", "float32"] = "float64",
+) -> pd.DataFrame:
+    """
+    Convert a dataframe that has been stored with `encoding` back to float columns of `dtype`.
+    """
+    times_dtype = df["time"].dtype if "time" in df.columns else df.index.dtype
+    if encoding == "float64" and dtype == "float64" and times_dtype == "datetime64[ns]":
+        return df
+    # Arrays, not Series, so that the frame is not aligned on a (possibly duplicated) index
+    columns: dict[str, T.Any] = {}
+    for column in df.columns:
+        if column in ("year", "sensor"):
+            columns[column] = df[column].array
+            continue
+        if column == "time":
+            columns[column] = df[column].to_numpy().astype("datetime64[ns]")
+            continue
+        values = df[column].to_numpy(dtype=dtype, na_value=np.nan)
+        if encoding == "scaled":
+            values /= VALUE_SCALE
+        columns[column] = values
+    index = df.index
+    if isinstance(index, pd.DatetimeIndex):
+        index = index.as_unit("ns")  # type: ignore[attr-defined]
+    decoded = pd.DataFrame(columns, index=index)
+    decoded.columns.name = df.columns.name
+    return decoded
+
+
+def _get_encoding(pf: fastparquet.ParquetFile) -> str:
+    return T.cast(str, pf.key_value_metadata.get(ENCODING_KEY, "float64"))
+
+
+def _get_layout(pf: fastparquet.ParquetFile) -> DataLayout:
+    return T.cast(DataLayout, pf.key_value_metadata.get(LAYOUT_KEY, "wide"))
+
+
+def get_ioc_years(pf: fastparquet.ParquetFile) -> list[int]:
+    """
+    Return the years for which the parquet file `pf` contains data.
+    """
+    if "year" in pf.cats:
+        return sorted(pf.cats["year"])
+    return sorted({int(year) for year in pf.statistics["min"].get("year", []) if year is not None})
+
+
+def get_ioc_sensors(pf: fastparquet.ParquetFile) -> list[str]:
+    """
+    Return the sensors stored in the parquet file `pf`, whatever its layout.
+    """
+    if _get_layout(pf) == "long":
+        return sorted(pf.cats.get("sensor", []))
+    return [column for column in pf.columns if column != "time"]
+
+
+def _to_layout(df: pd.DataFrame, layout: DataLayout, ioc_code: str = "") -> pd.DataFrame:
+    if layout == "long" and not is_long_ioc_df(df):
+        return melt_ioc_df(df)
+    if layout == "wide" and is_long_ioc_df(df):
+        return pivot_long_ioc_df(df, ioc_code=ioc_code)
+    return df
+
+
+def _get_counting_open(fs: fsspec.AbstractFileSystem) -> T.Callable[..., T.Any]:
+    metrics = get_metrics()
+
+    def open_with(path: str, mode: str = "rb") -> T.Any:
+        fd = fs.open(path, mode)
+        if "r" in mode:
+            return fd
+        return CountingFile(fd, registry=metrics, name="observer_uploaded_bytes_total")
+
+    return open_with
+
+
+def _write_station_parquet(
+    uri: str,
+    df: pd.DataFrame,
+    *,
+    compression_level: int,
+    append: bool,
+    custom_metadata: dict[str, str] | None,
+    row_group_size: int,
+    fs: fsspec.AbstractFileSystem,
+    encoding: StorageEncoding = "float64",
+    skip_stored: bool = False,
+) -> None:
+    layout: DataLayout = "long" if is_long_ioc_df(df) else "wide"
+    if append:
+        # The appended files must have the same schema as the existing ones
+        with contextlib.suppress(FileNotFoundError):
+            pf = fastparquet.ParquetFile(uri, fs=fs)
+            encoding = T.cast(StorageEncoding, _get_encoding(pf))
+            layout = _get_layout(pf)
+            df = _to_layout(df, layout=layout)
+            last_timestamp = _get_time_statistic(pf, "max")
+            if skip_stored and last_timestamp is not None:
+                times = df["time"] if layout == "long" else df.index
+                df = df[times > last_timestamp]
+                if df.empty:
+                    logger.debug("%s: No new timestamps", uri)
+                    return
+    if layout == "long":
+        df = df.assign(sensor=df["sensor"].astype(SENSOR_DTYPE), year=df["time"].dt.year)
+        partition_on = ["sensor"]
+        partition_keys = [df["sensor"].cat.codes.to_numpy(), df["year"].to_numpy()]
+    else:
+        if "year" not in df.columns:
+            df = df.assign(year=df.index.year)  # type: ignore[attr-defined]
+        partition_on = ["year"]
+        partition_keys = [df["year"].to_numpy()]
+    df = encode_ioc_df(df, encoding=encoding)
+    custom_metadata = {**(custom_metadata or {}), ENCODING_KEY: encoding, LAYOUT_KEY: layout}
+    # We call fastparquet directly instead of `df.to_parquet()` so that we can use the same
+    # filesystem for all the files (and reuse its connections) and so that `append` can read
+    # the existing metadata
+    fastparquet.write(
+        uri,
+        df,
+        row_group_offsets=_get_row_group_offsets(partition_keys, row_group_size=row_group_size),
+        compression=_get_compression(compression_level=compression_level),
+        file_scheme="hive",
+        write_index=layout == "wide",
+        partition_on=partition_on,
+        append=append,
+        custom_metadata=custom_metadata,
+        open_with=_get_counting_open(fs),
+        mkdirs=lambda path: fs.mkdirs(path, exist_ok=True),
+    )
+
+
 def write_ioc_df(
     *,
     df: pd.DataFrame,
@@ -59,54 +312,695 @@ def write_ioc_df(
     credential: CredentialAIO | None = None,
     append: bool = False,
     custom_metadata: dict[str, str] | None = None,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    fs: fsspec.AbstractFileSystem | None = None,
+    encoding: StorageEncoding = "float64",
+    skip_stored: bool = False,
 ) -> None:
+    """
+    Upload a station.
+
+    New stations are stored with `encoding`, while appends keep the encoding of the existing station
+    (see `StorageEncoding`). Likewise, new stations are stored with the layout of `df`, while appends
+    are converted to the layout of the existing station (see `DataLayout`).
+
+    If `append` and `skip_stored` are `True`, the rows up to the last timestamp that is already stored
+    are not appended (e.g. the overlap of an incremental update). The last timestamp is taken from the
+    footer of the station, so this is safe even if the catalog is outdated.
+    """
     logger.debug("%s: Starting upload", ioc_code)
-    settings = get_settings()
-    uri = _get_station_uri(ioc_code)
-    storage_options = get_storage_options(credential=credential)
-    if "year" not in df.columns:
-        df = df.assign(year=df.index.year)  # type: ignore[attr-defined]
-    df.to_parquet(  # type: ignore[call-overload]
-        uri,
-        partition_cols=["year"],
-        index=True,
-        storage_options=storage_options,
-        engine=settings.engine,
-        compression=_get_compression(compression_level=compression_level),  # type: ignore
-        append=append,
-        custom_metadata=custom_metadata,
-    )
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    with get_metrics().timer("observer_upload_seconds"):
+        _write_station_parquet(
+            _get_station_uri(ioc_code),
+            df,
+            compression_level=compression_level,
+            append=append,
+            custom_metadata=custom_metadata,
+            row_group_size=row_group_size,
+            fs=fs,
+            encoding=encoding,
+            skip_stored=skip_stored,
+        )
     logger.info("%s: Finished upload", ioc_code)
 
 
+def write_ioc_dfs(
+    dfs: T.Mapping[str, pd.DataFrame],
+    *,
+    compression_level: int = 0,
+    credential: CredentialAIO | None = None,
+    append: bool = False,
+    custom_metadata: dict[str, str] | None = None,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    fs: fsspec.AbstractFileSystem | None = None,
+    n_threads: int = 10,
+    update_catalog: bool = True,
+    encoding: StorageEncoding = "float64",
+    skip_stored: bool = False,
+) -> dict[str, BaseException]:
+    """
+    Upload many stations concurrently over a single filesystem.
+
+    Empty dataframes are skipped; `skip_stored` is passed to `write_ioc_df()`. Unless `update_catalog` is `False`, the catalog entries of the
+    uploaded stations are updated once all the uploads have finished.
+    Return the exception of each station that failed to upload.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    kwargs = [
+        dict(
+            df=df,
+            ioc_code=ioc_code,
+            compression_level=compression_level,
+            append=append,
+            custom_metadata=custom_metadata,
+            row_group_size=row_group_size,
+            fs=fs,
+            encoding=encoding,
+            skip_stored=skip_stored,
+        )
+        for ioc_code, df in dfs.items()
+        if not df.empty
+    ]
+    logger.info("Starting upload of %d stations", len(kwargs))
+    with get_metrics().phase("upload"):
+        results = multifutures.multithread(
+            func=write_ioc_df,
+            func_kwargs=kwargs,
+            check=False,
+            n_workers=n_threads,
+            disable_progress_bar=True,
+        )
+    failures: dict[str, BaseException] = {}
+    for result in results:
+        if result.exception is not None:
+            ioc_code = result.kwargs["ioc_code"]  # type: ignore[index]
+            logger.error("%s: Failed upload: %s", ioc_code, result.exception)
+            failures[ioc_code] = result.exception
+    logger.info("Finished upload of %d stations, failures: %d", len(kwargs), len(failures))
+    uploaded = [T.cast(str, kwarg["ioc_code"]) for kwarg in kwargs if kwarg["ioc_code"] not in failures]
+    if update_catalog and uploaded:
+        update_ioc_catalog(uploaded, fs=fs, n_threads=n_threads)
+    return failures
+
+
 def get_ioc_parquet_file(
     ioc_code: str,
     *,
     credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    cache: StationCache | None = None,
     **kwargs: dict[str, T.Any],
 ) -> fastparquet.ParquetFile:
     uri = _get_station_uri(ioc_code)
-    fs = get_obs_fs(credential=credential)
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    if cache is not None:
+        return cache.get_parquet_file(fs=fs, uri=uri, **kwargs)
     pf = fastparquet.ParquetFile(uri, fs=fs, **kwargs)  # type: ignore
     return pf
 
 
+def get_ioc_time_filters(
+    start_date: pd.Timestamp | None,
+    end_date: pd.Timestamp | None,
+) -> list[tuple[str, str, T.Any]]:
+    """
+    Return the parquet filters that select the row groups between `start_date` and `end_date`.
+    """
+    # The `year` filters prune the partitions while the `time` filters prune the row groups
+    # using the statistics stored in the parquet metadata; neither needs to read any data.
+    filters: list[tuple[str, str, T.Any]] = []
+    if start_date is not None:
+        filters.extend([("year", ">=", start_date.year), ("time", ">=", start_date)])
+    if end_date is not None:
+        filters.extend([("year", "<=", end_date.year), ("time", "<=", end_date)])
+    return filters
+
+
+def _read_long_columns(
+    pf: fastparquet.ParquetFile,
+    filters: list[tuple[str, str, T.Any]] | None = None,
+) -> pd.DataFrame:
+    if "sensor" not in pf.cats:
+        # Written from an empty dataframe, so there are no sensor partitions
+        return empty_long_ioc_df()
+    df: pd.DataFrame = pf.to_pandas(columns=["time", "value", "sensor"], filters=filters)
+    return df[LONG_COLUMNS]
+
+
+def _combine_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    # Overlapping appends store some timestamps more than once. Like in the "long" layout, later appends
+    # take precedence per sensor, so a missing (NaN) value doesn't overwrite a stored one
+    if not df.index.has_duplicates:
+        return df
+    combined: pd.DataFrame = df.groupby(level=0).last()
+    combined.columns.name = df.columns.name
+    return combined
+
+
+def read_ioc_station_df(
+    pf: fastparquet.ParquetFile,
+    *,
+    filters: list[tuple[str, str, T.Any]],
+    start_date: pd.Timestamp | None,
+    end_date: pd.Timestamp | None,
+    sensors: list[str] | None,
+    dtype: T.Literal["float64", "float32"],
+    layout: DataLayout,
+    ioc_code: str,
+) -> pd.DataFrame:
+    """
+    Read the data of a single station from the parquet file `pf` and return them in `layout`.
+    """
+    # The filters select whole row groups, so we still need to trim the edges
+    if _get_layout(pf) == "wide":
+        if sensors is None:
+            columns = pf.columns
+        else:
+            columns = [column for column in pf.columns if column in sensors]
+        df: pd.DataFrame = pf.to_pandas(columns=columns, filters=filters)
+        df = decode_ioc_df(df, encoding=_get_encoding(pf), dtype=dtype)
+        # The appended files come after the rest, so later appends take precedence
+        df = _combine_duplicates(df)
+        if start_date is not None or end_date is not None:
+            df = df.sort_index().loc[start_date:end_date]  # type: ignore[misc]
+        return _to_layout(df, layout=layout)
+    # The `sensor` filter prunes whole partitions
+    if sensors is not None:
+        filters = [*filters, ("sensor", "in", sensors)]
+    df = decode_ioc_df(_read_long_columns(pf, filters=filters), encoding=_get_encoding(pf), dtype=dtype)
+    df = df.assign(sensor=df["sensor"].astype(SENSOR_DTYPE))
+    if start_date is not None:
+        df = df[df["time"] >= start_date]
+    if end_date is not None:
+        df = df[df["time"] <= end_date]
+    if not len(df):
+        return pivot_long_ioc_df(df) if layout == "wide" else df.reset_index(drop=True)
+    # The appended files come after the rest, so later appends take precedence, like in `compact_ioc_station()`
+    df = concat_long_ioc_dfs([df], ioc_code=ioc_code, keep="last")
+    if layout == "wide":
+        return pivot_long_ioc_df(df, ioc_code=ioc_code)
+    return df
+
+
 def get_ioc_df(
     ioc_code: str,
     *,
-    no_years: int = 2,
+    start_date: pd.Timestamp | None = None,
+    end_date: pd.Timestamp | None = None,
+    sensors: list[str] | None = None,
+    no_years: int | None = 2,
+    dtype: T.Literal["float64", "float32"] = "float64",
+    layout: DataLayout = "wide",
     credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    cache: StationCache | None = None,
     **kwargs: dict[str, T.Any],
 ) -> pd.DataFrame:
-    pf = get_ioc_parquet_file(ioc_code=ioc_code, credential=credential, **kwargs)
-    df: pd.DataFrame = pf[-no_years:].to_pandas(columns=pf.columns)
+    """
+    Return the data of `ioc_code` between `start_date` and `end_date` (both inclusive).
+
+    Only the partitions and row groups that overlap with the requested period are being downloaded.
+    If neither `start_date` nor `end_date` are specified, the last `no_years` years are returned
+    (all of them if `no_years` is `None`). If `sensors` is specified, only those sensors are being
+    decoded; sensors that the station does not have are ignored. If a `cache` is specified,
+    the files are being read from the local disk unless they have changed remotely.
+    The values are returned as `dtype` and the dataframe has `layout` (see `DataLayout`), regardless of
+    how the station is stored. "long" stations are pivoted on read, and only the files of `sensors` are
+    downloaded.
+    """
+    pf = get_ioc_parquet_file(ioc_code=ioc_code, credential=credential, fs=fs, cache=cache, **kwargs)
+    if start_date is None and end_date is None:
+        years = get_ioc_years(pf)
+        filters = [("year", "in", years[-no_years:])] if no_years and years else []
+    else:
+        filters = get_ioc_time_filters(start_date=start_date, end_date=end_date)
+    df = read_ioc_station_df(
+        pf,
+        filters=filters,
+        start_date=start_date,
+        end_date=end_date,
+        sensors=sensors,
+        dtype=dtype,
+        layout=layout,
+        ioc_code=ioc_code,
+    )
     return df
 
 
+def _read_ioc_df(
+    ioc_code: str,
+    *,
+    start_date: pd.Timestamp | None,
+    end_date: pd.Timestamp | None,
+    sensors: list[str] | None,
+    dtype: T.Literal["float64", "float32"],
+    layout: DataLayout,
+    fs: fsspec.AbstractFileSystem,
+    cache: StationCache | None,
+) -> pd.DataFrame | None:
+    try:
+        df = get_ioc_df(
+            ioc_code=ioc_code,
+            start_date=start_date,
+            end_date=end_date,
+            sensors=sensors,
+            no_years=None,
+            dtype=dtype,
+            layout=layout,
+            fs=fs,
+            cache=cache,
+        )
+    except FileNotFoundError:
+        logger.warning("%s: No data", ioc_code)
+        return None
+    return df
+
+
+def get_ioc_dfs(
+    ioc_codes: list[str],
+    start_date: pd.Timestamp | None = None,
+    end_date: pd.Timestamp | None = None,
+    *,
+    sensors: list[str] | None = None,
+    dtype: T.Literal["float64", "float32"] = "float64",
+    layout: DataLayout = "wide",
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    cache: StationCache | None = None,
+    n_threads: int = 10,
+) -> dict[str, pd.DataFrame]:
+    """
+    Read many stations concurrently over a single filesystem.
+
+    Both `start_date` and `end_date` are inclusive. Stations without data are omitted.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    kwargs = [
+        dict(
+            ioc_code=ioc_code,
+            start_date=start_date,
+            end_date=end_date,
+            sensors=sensors,
+            dtype=dtype,
+            layout=layout,
+            fs=fs,
+            cache=cache,
+        )
+        for ioc_code in ioc_codes
+    ]
+    results = multifutures.multithread(
+        func=_read_ioc_df,
+        func_kwargs=kwargs,
+        check=True,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    dfs = {}
+    for result in results:
+        if result.result is not None:
+            dfs[result.kwargs["ioc_code"]] = result.result  # type: ignore[index]
+    # multithread does not preserve the order
+    dfs = {ioc_code: dfs[ioc_code] for ioc_code in ioc_codes if ioc_code in dfs}
+    return dfs
+
+
+def get_ioc_dataset(
+    ioc_codes: list[str],
+    start_date: pd.Timestamp | None = None,
+    end_date: pd.Timestamp | None = None,
+    *,
+    sensors: list[str] | None = None,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    cache: StationCache | None = None,
+    n_threads: int = 10,
+) -> xr.Dataset:
+    """
+    Read many stations concurrently and return a `(ioc_code, time)` dataset with one variable per sensor.
+
+    Missing values, e.g. sensors that a station does not have, are NaN.
+    """
+    dfs = get_ioc_dfs(
+        ioc_codes=ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        sensors=sensors,
+        credential=credential,
+        fs=fs,
+        cache=cache,
+        n_threads=n_threads,
+    )
+    if not dfs:
+        return xr.Dataset(coords={"ioc_code": [], "time": pd.DatetimeIndex([])})
+    df = pd.concat(dfs, names=["ioc_code", "time"])
+    df.columns.name = None
+    ds = xr.Dataset.from_dataframe(df)
+    return ds
+
+
+def get_ioc_last_timestamp(
+    ioc_code: str,
+    *,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+) -> pd.Timestamp | None:
+    """
+    Return the last timestamp stored for `ioc_code` or `None` if the station has no data.
+
+    Only the parquet footer is being read, not the data.
+    """
+    try:
+        pf = get_ioc_parquet_file(ioc_code=ioc_code, credential=credential, fs=fs)
+    except FileNotFoundError:
+        return None
+    return _get_time_statistic(pf, "max")
+
+
+def _get_time_statistic(
+    pf: fastparquet.ParquetFile,
+    statistic: T.Literal["min", "max"],
+) -> pd.Timestamp | None:
+    values = [value for value in pf.statistics[statistic].get("time", []) if value is not None]
+    if not values:
+        return None
+    aggregate = min if statistic == "min" else max
+    # The compact encodings store the timestamps in milliseconds
+    return pd.Timestamp(np.datetime64(aggregate(values), "ns"))
+
+
+def get_ioc_last_timestamps(
+    ioc_codes: list[str],
+    *,
+    credential: CredentialAIO | None = None,
+    n_threads: int = 10,
+    from_catalog: bool = False,
+) -> dict[str, pd.Timestamp | None]:
+    """
+    Return the last timestamp stored for each station.
+
+    If `from_catalog` is `True`, the (freshly downloaded) catalog is used instead of reading the footer
+    of every station. The catalog is only updated by the batch writers (e.g. `write_ioc_dfs()`), so it may
+    lag behind stations that have been written otherwise; use `skip_stored` when appending to them.
+    The footers of the stations that are missing from the catalog are still read, because the catalog
+    may be outdated or missing altogether, e.g. if `update_ioc_catalog()` has failed.
+    """
+    if from_catalog:
+        catalog = get_ioc_catalog(credential=credential, refresh=True)
+        cataloged = [ioc_code for ioc_code in ioc_codes if ioc_code in catalog.index]
+        # A cataloged station without data has no end
+        last_timestamps = {
+            ioc_code: None if pd.isna(catalog.end[ioc_code]) else catalog.end[ioc_code] for ioc_code in cataloged
+        }
+        missing = [ioc_code for ioc_code in ioc_codes if ioc_code not in last_timestamps]
+        if missing:
+            logger.info("Stations missing from the catalog: %d, reading their footers", len(missing))
+            last_timestamps.update(get_ioc_last_timestamps(missing, credential=credential, n_threads=n_threads))
+        return {ioc_code: last_timestamps[ioc_code] for ioc_code in ioc_codes}
+    fs = get_obs_fs(credential=credential)
+    kwargs = [dict(ioc_code=ioc_code, fs=fs) for ioc_code in ioc_codes]
+    results = multifutures.multithread(
+        func=get_ioc_last_timestamp,
+        func_kwargs=kwargs,
+        check=True,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    last_timestamps = {result.kwargs["ioc_code"]: result.result for result in results}  # type: ignore[index]
+    return last_timestamps
+
+
 def list_ioc_stations(
     *,
     credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    from_catalog: bool = False,
 ) -> list[str]:
-    fs = get_obs_fs(credential=credential)
-    existing = [parquet.split("/")[-1].split(".")[0] for parquet in fs.ls(f"{get_settings().container_name}/ioc/stations")]
+    """
+    Return the stored stations.
+
+    If `from_catalog` is `True`, the catalog is used instead of listing the stations directory.
+    """
+    if from_catalog:
+        return get_ioc_catalog(credential=credential, fs=fs).index.tolist()
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    existing = [parquet.split("/")[-1].split(".")[0] for parquet in fs.ls(_get_stations_uri())]
     return existing
+
+
+def _is_compact(pf: fastparquet.ParquetFile, row_group_size: int) -> bool:
+    rows: dict[tuple[str, T.Any], list[int]] = {}
+    # Only the "long" stations have a `year` column
+    years = pf.statistics["min"].get("year") or [None] * len(pf.row_groups)
+    for rg, year in zip(pf.row_groups, years):
+        partition = (posixpath.dirname(rg.columns[0].file_path), year)
+        rows.setdefault(partition, []).append(rg.num_rows)
+    return all(len(sizes) <= math.ceil(sum(sizes) / row_group_size) for sizes in rows.values())
+
+
+def compact_ioc_station(
+    ioc_code: str,
+    *,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    compression_level: int = 0,
+    force: bool = False,
+    encoding: StorageEncoding | None = None,
+    layout: DataLayout | None = None,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+) -> bool:
+    """
+    Rewrite a station into time sorted row groups of `row_group_size` rows without duplicate timestamps.
+
+    Appending data creates a new file in each affected partition; after many appends the reads
+    become slower and slower. Stations that don't have more files than necessary are skipped,
+    unless `force` is `True`. Return whether the station has been rewritten.
+
+    If `encoding` is specified and differs from the current one, the station is rewritten with it;
+    this is how existing stations are converted to a compact encoding (see `StorageEncoding`).
+    The same goes for `layout` (see `DataLayout`).
+
+    The new files are written next to the old ones, the old ones are moved aside and the new ones
+    are moved in place; the old files are only deleted after that. Readers may still briefly fail
+    to find the station while the moves are in progress. If a previous compaction has been
+    interrupted while the files were being moved, a `RuntimeError` is raised and the station must
+    be restored manually from the `.compacting` (new) and `.replaced` (old) directories.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    uri = _get_station_uri(ioc_code)
+    tmp_uri = f"{uri}.compacting"
+    old_uri = f"{uri}.replaced"
+    if fs.exists(old_uri):
+        if fs.exists(tmp_uri):
+            raise RuntimeError(f"{ioc_code}: A previous compaction has been interrupted while moving {uri}")
+        # The new files had been moved in place, only the old ones were left to delete
+        fs.rm(old_uri, recursive=True)
+    if fs.exists(tmp_uri):
+        # The station has not been touched yet; these are the partial files of a failed compaction
+        fs.rm(tmp_uri, recursive=True)
+    pf = get_ioc_parquet_file(ioc_code=ioc_code, fs=fs)
+    current_encoding = T.cast(StorageEncoding, _get_encoding(pf))
+    current_layout = _get_layout(pf)
+    encoding = encoding or current_encoding
+    layout = layout or current_layout
+    unchanged = encoding == current_encoding and layout == current_layout
+    if not force and unchanged and _is_compact(pf, row_group_size=row_group_size):
+        logger.debug("%s: Already compact", ioc_code)
+        return False
+    logger.debug("%s: Starting compaction: %d row groups", ioc_code, len(pf.row_groups))
+    if current_layout == "long":
+        df = decode_ioc_df(_read_long_columns(pf), encoding=current_encoding)
+        # Later appends take precedence
+        df = concat_long_ioc_dfs([df], ioc_code=ioc_code, keep="last")
+    else:
+        df = pf.to_pandas(columns=pf.columns)
+        df = decode_ioc_df(df, encoding=current_encoding)
+        df = df.sort_index(kind="stable")
+        # Later appends take precedence, but only for the sensors they have values for
+        df = _combine_duplicates(df)
+    df = _to_layout(df, layout=layout, ioc_code=ioc_code)
+    custom_metadata = {
+        key: value
+        for key, value in pf.key_value_metadata.items()
+        if key not in ("pandas", ENCODING_KEY, LAYOUT_KEY)
+    }
+    _write_station_parquet(
+        tmp_uri,
+        df,
+        compression_level=compression_level,
+        append=False,
+        custom_metadata=custom_metadata,
+        row_group_size=row_group_size,
+        fs=fs,
+        encoding=encoding,
+    )
+    fs.mv(uri, old_uri, recursive=True)
+    fs.mv(tmp_uri, uri, recursive=True)
+    fs.rm(old_uri, recursive=True)
+    logger.info("%s: Finished compaction of %d row groups", ioc_code, len(pf.row_groups))
+    return True
+
+
+def compact_ioc_archive(
+    ioc_codes: list[str] | None = None,
+    *,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    compression_level: int = 0,
+    force: bool = False,
+    encoding: StorageEncoding | None = None,
+    layout: DataLayout | None = None,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    n_threads: int = 10,
+    update_catalog: bool = True,
+) -> dict[str, BaseException]:
+    """
+    Compact many stations concurrently (all the stored ones by default).
+
+    Unless `update_catalog` is `False`, the catalog entries of the compacted stations are updated.
+    Return the exception of each station that failed to be compacted.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    if ioc_codes is None:
+        ioc_codes = list_ioc_stations(fs=fs)
+    kwargs = [
+        dict(
+            ioc_code=ioc_code,
+            row_group_size=row_group_size,
+            compression_level=compression_level,
+            force=force,
+            encoding=encoding,
+            layout=layout,
+            fs=fs,
+        )
+        for ioc_code in ioc_codes
+    ]
+    results = multifutures.multithread(
+        func=compact_ioc_station,
+        func_kwargs=kwargs,
+        check=False,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    failures: dict[str, BaseException] = {}
+    compacted = []
+    for result in results:
+        ioc_code = result.kwargs["ioc_code"]  # type: ignore[index]
+        if result.exception is not None:
+            logger.error("%s: Failed compaction: %s", ioc_code, result.exception)
+            failures[ioc_code] = result.exception
+        elif result.result:
+            compacted.append(ioc_code)
+    logger.info("Compacted %d/%d stations, failures: %d", len(compacted), len(kwargs), len(failures))
+    if update_catalog and compacted:
+        update_ioc_catalog(compacted, fs=fs, n_threads=n_threads)
+    return failures
+
+
+def _empty_catalog() -> pd.DataFrame:
+    catalog = pd.DataFrame(
+        {
+            "start": pd.Series([], dtype="datetime64[ns]"),
+            "end": pd.Series([], dtype="datetime64[ns]"),
+            "num_rows": pd.Series([], dtype=int),
+            "sensors": pd.Series([], dtype=object),
+            "files": pd.Series([], dtype=object),
+            "last_update": pd.Series([], dtype="datetime64[ns]"),
+        },
+        index=pd.Index([], dtype=object, name="ioc_code"),
+    )
+    return catalog
+
+
+def _get_catalog_entry(ioc_code: str, *, fs: fsspec.AbstractFileSystem) -> dict[str, T.Any] | None:
+    try:
+        pf = get_ioc_parquet_file(ioc_code=ioc_code, fs=fs)
+    except FileNotFoundError:
+        return None
+    entry = dict(
+        ioc_code=ioc_code,
+        start=_get_time_statistic(pf, "min"),
+        end=_get_time_statistic(pf, "max"),
+        num_rows=sum(rg.num_rows for rg in pf.row_groups),
+        sensors=get_ioc_sensors(pf),
+        files=sorted({rg.columns[0].file_path for rg in pf.row_groups}),
+        last_update=pd.Timestamp.now(tz="UTC").tz_localize(None),
+    )
+    return entry
+
+
+def _read_ioc_catalog(fs: fsspec.AbstractFileSystem) -> pd.DataFrame:
+    try:
+        pf = fastparquet.ParquetFile(_get_catalog_uri(), fs=fs)
+    except FileNotFoundError:
+        logger.warning("No catalog")
+        return _empty_catalog()
+    catalog: pd.DataFrame = pf.to_pandas()
+    return catalog
+
+
+def get_ioc_catalog(
+    *,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    refresh: bool = False,
+) -> pd.DataFrame:
+    """
+    Return the catalog of the stored stations.
+
+    The catalog is indexed by `ioc_code` and records the time range, the number of rows,
+    the sensors, the files and the time of the last update of each station. It is only
+    downloaded once per process, unless `refresh` is `True`.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    read = functools.partial(_read_ioc_catalog, fs=fs)
+    return _read_cached(_get_catalog_uri(), read=read, refresh=refresh).copy()
+
+
+def update_ioc_catalog(
+    ioc_codes: list[str],
+    *,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+    n_threads: int = 10,
+) -> pd.DataFrame:
+    """
+    Update the catalog entries of `ioc_codes` from the metadata of the stations and return the catalog.
+
+    Stations that no longer exist are removed. The catalog is read, modified and written back,
+    so it must not be updated concurrently by more than one process.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    results = multifutures.multithread(
+        func=_get_catalog_entry,
+        func_kwargs=[dict(ioc_code=ioc_code, fs=fs) for ioc_code in ioc_codes],
+        check=True,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    entries = [result.result for result in results if result.result is not None]
+    catalog = get_ioc_catalog(fs=fs, refresh=True)
+    catalog = catalog[~catalog.index.isin(ioc_codes)]
+    if entries:
+        catalog = pd.concat([catalog, pd.DataFrame(entries).set_index("ioc_code")])
+    catalog = catalog.sort_index()
+    fastparquet.write(
+        _get_catalog_uri(),
+        catalog,
+        compression=_get_compression(compression_level=0),
+        open_with=fs.open,
+        mkdirs=lambda path: fs.mkdirs(path, exist_ok=True),
+    )
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[_get_catalog_uri()] = catalog
+    logger.info("Updated catalog: %d stations", len(entries))
+    return catalog
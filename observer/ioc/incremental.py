@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+
+import pandas as pd
+
+from observer.azclients import CredentialAIO
+
+from .fs import get_ioc_last_timestamps
+from .parser import get_ioc_rows_after
+from .scraper import scrape_ioc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OVERLAP = pd.Timedelta(hours=1)
+
+
+def get_ioc_start_dates(
+    ioc_codes: list[str],
+    *,
+    default_start_date: pd.Timestamp,
+    overlap: pd.Timedelta = DEFAULT_OVERLAP,
+    last_timestamps: dict[str, pd.Timestamp | None] | None = None,
+    credential: CredentialAIO | None = None,
+) -> dict[str, pd.Timestamp]:
+    """
+    Return the date from which each station needs to be scraped.
+
+    That's the last timestamp that is already stored minus `overlap`, or `default_start_date`
+    for stations that have not been stored yet.
+    """
+    if last_timestamps is None:
+        last_timestamps = get_ioc_last_timestamps(ioc_codes=ioc_codes, credential=credential)
+    start_dates = {}
+    for ioc_code in ioc_codes:
+        last_timestamp = last_timestamps.get(ioc_code)
+        if last_timestamp is None:
+            start_dates[ioc_code] = default_start_date
+        else:
+            start_dates[ioc_code] = last_timestamp - overlap
+    return start_dates
+
+
+def get_ioc_now() -> pd.Timestamp:
+    """
+    Return the current time, floored to the minute, the way IOC timestamps are stored.
+    """
+    # IOC timestamps are naive UTC
+    return pd.Timestamp.now(tz="UTC").tz_localize(None).floor("min")
+
+
+def scrape_ioc_incremental(
+    *,
+    ioc_codes: list[str],
+    default_start_date: pd.Timestamp,
+    end_date: pd.Timestamp | None = None,
+    overlap: pd.Timedelta = DEFAULT_OVERLAP,
+    credential: CredentialAIO | None = None,
+    from_catalog: bool = False,
+    **kwargs: T.Any,
+) -> dict[str, pd.DataFrame]:
+    """
+    Scrape only the data that are newer than what is already stored for each station.
+
+    The returned dataframes only contain timestamps after the last stored one, so they
+    can be passed to `write_ioc_df(..., append=True)` as they are. If `from_catalog` is `True`,
+    the last timestamps are taken from the catalog instead of the footer of every station; since the
+    catalog may be outdated, pass `skip_stored=True` to `write_ioc_df()` as well.
+    Any extra `kwargs` are passed to `scrape_ioc()`.
+    """
+    if end_date is None:
+        end_date = get_ioc_now()
+    last_timestamps = get_ioc_last_timestamps(
+        ioc_codes=ioc_codes,
+        credential=credential,
+        from_catalog=from_catalog,
+    )
+    start_dates = get_ioc_start_dates(
+        ioc_codes=ioc_codes,
+        default_start_date=default_start_date,
+        overlap=overlap,
+        last_timestamps=last_timestamps,
+    )
+    dataframes = scrape_ioc(ioc_codes=ioc_codes, start_date=start_dates, end_date=end_date, **kwargs)
+    for ioc_code, df in dataframes.items():
+        last_timestamp = last_timestamps[ioc_code]
+        if last_timestamp is not None and not df.empty:
+            # The overlap is only there so that we don't miss any data at the boundary.
+            # Don't store the timestamps that we already have twice
+            dataframes[ioc_code] = get_ioc_rows_after(df, last_timestamp)
+        logger.debug("%s: New timestamps: %d", ioc_code, len(dataframes[ioc_code]))
+    return dataframes
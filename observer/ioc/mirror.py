@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import posixpath
+import typing as T
+
+import fsspec
+import multifutures
+import pydantic
+
+from observer.azclients import CredentialAIO
+from observer.azclients import get_obs_fs
+from observer.settings import get_settings
+
+from .cache import download_to_temp_file
+from .cache import get_file_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".sync-manifest.json"
+# Written after the data files, so that the local metadata never reference missing files
+METADATA_NAMES = ("_metadata", "_common_metadata")
+
+
+class SyncResult(pydantic.BaseModel):
+    """
+    The result of `sync_ioc_archive()`.
+
+    The paths are relative to the `ioc` directory.
+    """
+
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
+    transferred: list[str] = []
+    deleted: list[str] = []
+    unchanged: int = 0
+    transferred_bytes: int = 0
+    failures: dict[str, BaseException] = {}
+
+
+def _get_md5(info: dict[str, T.Any]) -> str | None:
+    # Azure returns the MD5 of the blobs that have been uploaded in a single request
+    content_settings = info.get("content_settings")
+    md5 = content_settings.get("content_md5") if content_settings else None
+    return bytes(md5).hex() if md5 else None
+
+
+def _compute_md5(path: str | os.PathLike[str]) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_selected(name: str, ioc_codes: list[str] | None) -> bool:
+    if ioc_codes is None or not name.startswith("stations/"):
+        return True
+    return name.split("/")[1].removesuffix(".parquet") in ioc_codes
+
+
+def _get_station_dir(name: str) -> str:
+    # e.g. "stations/acnj.parquet/year=2023/part.0.parquet" -> "stations/acnj.parquet"
+    return "/".join(name.split("/")[:2])
+
+
+def _download(
+    name: str,
+    *,
+    fs: fsspec.AbstractFileSystem,
+    root: str,
+    destination: pathlib.Path,
+    info: dict[str, T.Any],
+) -> int:
+    path = destination / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with download_to_temp_file(fs, f"{root}/{name}", directory=path.parent) as tmp:
+        md5 = _get_md5(info)
+        if md5 is not None and _compute_md5(tmp) != md5:
+            raise ValueError(f"Checksum mismatch: {name}")
+        os.replace(tmp, path)
+    logger.debug("Transferred: %s", name)
+    return path.stat().st_size
+
+
+def _transfer(
+    names: list[str],
+    *,
+    fs: fsspec.AbstractFileSystem,
+    root: str,
+    destination: pathlib.Path,
+    listing: dict[str, dict[str, T.Any]],
+    manifest: dict[str, str],
+    result: SyncResult,
+    n_threads: int,
+) -> None:
+    results = multifutures.multithread(
+        func=_download,
+        func_kwargs=[
+            dict(name=name, fs=fs, root=root, destination=destination, info=listing[name]) for name in names
+        ],
+        check=False,
+        n_workers=n_threads,
+        disable_progress_bar=True,
+    )
+    for future_result in results:
+        name = future_result.kwargs["name"]  # type: ignore[index]
+        if future_result.exception is not None:
+            logger.error("Failed transfer: %s: %s", name, future_result.exception)
+            result.failures[name] = future_result.exception
+            manifest.pop(name, None)
+        else:
+            result.transferred.append(name)
+            result.transferred_bytes += future_result.result
+            manifest[name] = get_file_version(listing[name])
+
+
+def sync_ioc_archive(
+    destination: str | os.PathLike[str],
+    *,
+    ioc_codes: list[str] | None = None,
+    delete: bool = True,
+    n_threads: int = 10,
+    credential: CredentialAIO | None = None,
+    fs: fsspec.AbstractFileSystem | None = None,
+) -> SyncResult:
+    """
+    Incrementally mirror the `ioc` directory of the storage to the local `destination`.
+
+    A file is only transferred if it is new or if its ETag or size have changed since the previous sync.
+    Downloads are verified against the MD5 checksum of the blob when one is available.
+    Local files that no longer exist remotely are deleted, unless `delete` is `False`.
+    If `ioc_codes` is specified, only these stations are synced (along with the top level files).
+
+    The mirror can be used by setting `STORAGE_URL` to `destination`.
+    """
+    if fs is None:
+        fs = get_obs_fs(credential=credential)
+    root = fs._strip_protocol(f"{get_settings().storage_root}/ioc")
+    destination = pathlib.Path(destination) / "ioc"
+    destination.mkdir(parents=True, exist_ok=True)
+    manifest_path = destination / MANIFEST_NAME
+    manifest: dict[str, str] = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    listing = {path[len(root) :].lstrip("/"): info for path, info in fs.find(root, detail=True).items()}
+    listing = {name: info for name, info in listing.items() if _is_selected(name, ioc_codes)}
+    result = SyncResult()
+    to_transfer = []
+    for name, info in sorted(listing.items()):
+        local_path = destination / name
+        version = get_file_version(info)
+        is_unchanged = (
+            manifest.get(name) == version
+            and local_path.exists()
+            and local_path.stat().st_size == info["size"]
+        )
+        if is_unchanged:
+            result.unchanged += 1
+        else:
+            to_transfer.append(name)
+    logger.info("Files to transfer: %d, unchanged: %d", len(to_transfer), result.unchanged)
+
+    data_files = [name for name in to_transfer if posixpath.basename(name) not in METADATA_NAMES]
+    metadata_files = [name for name in to_transfer if posixpath.basename(name) in METADATA_NAMES]
+    transfer = functools.partial(
+        _transfer,
+        fs=fs,
+        root=root,
+        destination=destination,
+        listing=listing,
+        manifest=manifest,
+        result=result,
+        n_threads=n_threads,
+    )
+    transfer(data_files)
+    # Don't update the metadata of the stations whose data files failed to transfer,
+    # they must keep referencing the old files
+    failed = {_get_station_dir(name) for name in result.failures}
+    transfer([name for name in metadata_files if _get_station_dir(name) not in failed])
+
+    if delete:
+        failed = {_get_station_dir(name) for name in result.failures}
+        for path in sorted(destination.rglob("*")):
+            name = path.relative_to(destination).as_posix()
+            is_stale = name != MANIFEST_NAME and name not in listing and _is_selected(name, ioc_codes)
+            if path.is_file() and is_stale and _get_station_dir(name) not in failed:
+                path.unlink()
+                manifest.pop(name, None)
+                result.deleted.append(name)
+                logger.debug("Deleted: %s", name)
+
+    manifest_path.write_text(json.dumps(manifest))
+    logger.info(
+        "Finished sync: transferred: %d (%d bytes), deleted: %d, failures: %d",
+        len(result.transferred),
+        result.transferred_bytes,
+        len(result.deleted),
+        len(result.failures),
+    )
+    return result
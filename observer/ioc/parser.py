@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import json
+import logging
+import typing as T
+from multiprocessing import shared_memory
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import searvey.ioc
+
+logger = logging.getLogger(__name__)
+
+IOC_SENSORS = np.array(sorted(set(searvey.ioc.IOC_STATION_DATA_COLUMNS.values())), dtype=object)
+# The dictionary of the `sensor` column of the long dataframes
+SENSOR_DTYPE = pd.CategoricalDtype(IOC_SENSORS.tolist())
+
+# The shape of the parsed dataframes:
+#   - "wide": a `time` index and one float column per sensor. Timestamps that only some sensors have are NaN
+#     for the rest, so stations whose sensors sample at different rates are mostly NaN.
+#   - "long": `time`, `sensor` (categorical) and `value` columns with one row per measurement, sorted by
+#     sensor and time. No pivot is needed and the missing measurements take no space.
+DataLayout: T.TypeAlias = T.Literal["wide", "long"]
+LONG_COLUMNS = ["time", "sensor", "value"]
+
+
+def _empty_df() -> pd.DataFrame:
+    df = pd.DataFrame(
+        index=pd.DatetimeIndex([], dtype="datetime64[ns]", name="time"),
+        columns=pd.Index([], dtype=object, name=""),
+        dtype=float,
+    )
+    return df
+
+
+def empty_long_ioc_df() -> pd.DataFrame:
+    """
+    Return an empty dataframe with the "long" layout (see `DataLayout`).
+    """
+    return _make_long_df(
+        times=np.array([], dtype="datetime64[ns]"),
+        codes=np.array([], dtype=np.int8),
+        values=np.array([], dtype=float),
+    )
+
+
+def _make_long_df(
+    times: npt.NDArray[np.datetime64],
+    codes: npt.NDArray[np.integer[T.Any]],
+    values: npt.NDArray[np.float64],
+) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {
+            "time": times,
+            "sensor": pd.Categorical.from_codes(codes, dtype=SENSOR_DTYPE),  # type: ignore[arg-type]
+            "value": values,
+        },
+    )
+    return df
+
+
+def is_long_ioc_df(df: pd.DataFrame) -> bool:
+    """
+    Return whether `df` has the "long" layout (see `DataLayout`).
+    """
+    return list(df.columns) == LONG_COLUMNS
+
+
+def get_ioc_rows_after(df: pd.DataFrame, timestamp: pd.Timestamp) -> pd.DataFrame:
+    """
+    Return the rows of `df` that are after `timestamp`, whatever its layout (see `DataLayout`).
+    """
+    times = df["time"] if is_long_ioc_df(df) else df.index
+    after: pd.DataFrame = df[times > timestamp]
+    return after
+
+
+def decode_ioc_json(
+    content: str | bytes,
+) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.object_], npt.NDArray[np.float64]]:
+    """
+    Decode an IOC response to columnar `(times, sensors, values)` arrays.
+    """
+    records = json.loads(content)
+    # The timestamps have a fixed format (e.g. "2022-03-12 11:04:00") which numpy parses
+    # much faster than `pd.to_datetime()`. Occasionally they contain whitespace.
+    times = np.array([record["stime"].strip() for record in records], dtype="datetime64[ns]")
+    sensors = np.array([record["sensor"] for record in records], dtype=object)
+    # `null` values become NaN
+    values = np.array([record["slevel"] for record in records], dtype=float)
+    return times, sensors, values
+
+
+def pivot_ioc_arrays(
+    times: npt.NDArray[np.datetime64],
+    sensors: npt.NDArray[np.object_],
+    values: npt.NDArray[np.float64],
+    ioc_code: str,
+) -> pd.DataFrame:
+    """
+    Convert columnar `(times, sensors, values)` arrays to a wide dataframe with one column per sensor.
+
+    Unknown sensors and duplicate `(time, sensor)` pairs are dropped.
+    """
+    codes, uniques = pd.factorize(sensors)  # type: ignore[call-overload]
+    valid = np.isin(uniques, IOC_SENSORS)
+    if not valid.all():
+        keep = valid[codes]
+        times, codes, values = times[keep], codes[keep], values[keep]
+    if not len(times):
+        return _empty_df()
+    # Map the factorized codes to the (alphabetically sorted) column positions
+    columns = np.array(sorted(uniques[valid]), dtype=object)
+    column_positions = np.full(len(uniques), -1)
+    column_positions[valid] = np.searchsorted(columns, uniques[valid])
+    codes = column_positions[codes]
+    df = _pivot_codes(times=times, codes=codes, values=values, columns=columns, ioc_code=ioc_code)
+    return df
+
+
+def _pivot_codes(
+    times: npt.NDArray[np.datetime64],
+    codes: npt.NDArray[np.integer[T.Any]],
+    values: npt.NDArray[np.float64],
+    columns: npt.NDArray[np.object_],
+    ioc_code: str,
+) -> pd.DataFrame:
+    # `codes` are the positions of the sensors in `columns`
+    # lexsort is stable, so the first occurrence of each (time, sensor) pair comes first
+    order = np.lexsort((codes, times))
+    times, codes, values = times[order], codes[order], values[order]
+
+    # Occasionaly IOC contains complete garbage. E.g. duplicate timestamps on the same sensor. We should drop those.
+    # https://www.ioc-sealevelmonitoring.org/service.php?query=data&timestart=2022-03-12T11:03:40&timestop=2022-04-11T09:04:26&code=acnj
+    new_time = np.empty(len(times), dtype=bool)
+    new_time[0] = True
+    np.not_equal(times[1:], times[:-1], out=new_time[1:])
+    duplicated = ~new_time
+    duplicated[1:] &= codes[1:] == codes[:-1]
+    if duplicated.any():
+        logger.warning("%s: Dropped duplicates: %d rows", ioc_code, duplicated.sum())
+        keep = ~duplicated
+        times, codes, values, new_time = times[keep], codes[keep], values[keep], new_time[keep]
+
+    rows = np.cumsum(new_time) - 1
+    data = np.full((rows[-1] + 1, len(columns)), np.nan, dtype=values.dtype)
+    data[rows, codes] = values
+    df = pd.DataFrame(
+        data,
+        index=pd.DatetimeIndex(times[new_time], name="time"),
+        columns=pd.Index(columns, name=""),
+    )
+    return df
+
+
+def _sort_long_arrays(
+    times: npt.NDArray[np.datetime64],
+    codes: npt.NDArray[np.integer[T.Any]],
+    values: npt.NDArray[np.float64],
+    ioc_code: str,
+    keep: T.Literal["first", "last"] = "first",
+    log_level: int = logging.WARNING,
+) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.integer[T.Any]], npt.NDArray[np.float64]]:
+    # Sort by sensor and time and drop the duplicate (time, sensor) pairs. lexsort is stable,
+    # so the occurrences of each pair remain in their original order
+    order = np.lexsort((times, codes))
+    times, codes, values = times[order], codes[order], values[order]
+    duplicated = np.zeros(len(times), dtype=bool)
+    # Mark every occurrence but the first (or the last) one
+    same = (times[1:] == times[:-1]) & (codes[1:] == codes[:-1])
+    if keep == "first":
+        duplicated[1:] = same
+    else:
+        duplicated[:-1] = same
+    if duplicated.any():
+        logger.log(log_level, "%s: Dropped duplicates: %d rows", ioc_code, duplicated.sum())
+        unique = ~duplicated
+        times, codes, values = times[unique], codes[unique], values[unique]
+    return times, codes, values
+
+
+def to_long_ioc_df(
+    times: npt.NDArray[np.datetime64],
+    sensors: npt.NDArray[np.object_],
+    values: npt.NDArray[np.float64],
+    ioc_code: str,
+) -> pd.DataFrame:
+    """
+    Convert columnar `(times, sensors, values)` arrays to a long dataframe (see `DataLayout`).
+
+    Unknown sensors, duplicate `(time, sensor)` pairs and null values are dropped.
+    """
+    codes: npt.NDArray[np.integer[T.Any]] = pd.Categorical(sensors, dtype=SENSOR_DTYPE).codes
+    known = codes >= 0
+    if not known.all():
+        times, codes, values = times[known], codes[known], values[known]
+    times, codes, values = _sort_long_arrays(times=times, codes=codes, values=values, ioc_code=ioc_code)
+    # The nulls are dropped after the duplicates, so that the same measurements are kept as in the wide layout
+    valid = ~np.isnan(values)
+    df = _make_long_df(times=times[valid], codes=codes[valid], values=values[valid])
+    return df
+
+
+def concat_long_ioc_dfs(
+    dfs: list[pd.DataFrame],
+    ioc_code: str,
+    keep: T.Literal["first", "last"] = "first",
+) -> pd.DataFrame:
+    """
+    Concatenate long dataframes, sort them by sensor and time and drop the duplicate `(time, sensor)` pairs.
+
+    Where the dataframes (or the rows of a dataframe) overlap, the `keep` occurrence is kept.
+    """
+    dfs = [df for df in dfs if len(df)]
+    if not dfs:
+        return empty_long_ioc_df()
+    times, codes, values = _sort_long_arrays(
+        times=np.concatenate([df["time"].to_numpy(dtype="datetime64[ns]") for df in dfs]),
+        codes=np.concatenate([df["sensor"].astype(SENSOR_DTYPE).cat.codes.to_numpy() for df in dfs]),
+        values=np.concatenate([df["value"].to_numpy() for df in dfs]),
+        ioc_code=ioc_code,
+        keep=keep,
+        # Unlike the duplicates within an IOC response, overlaps between dataframes are expected
+        log_level=logging.DEBUG,
+    )
+    df = _make_long_df(times=times, codes=codes, values=values)
+    return df
+
+
+def pivot_long_ioc_df(df: pd.DataFrame, ioc_code: str = "") -> pd.DataFrame:
+    """
+    Convert a long dataframe to a wide one with one column per sensor (see `DataLayout`).
+
+    The sensors are already dictionary encoded, so this is much faster than `df.pivot()`.
+    Only the sensors that have measurements become columns. Duplicate `(time, sensor)` pairs are dropped.
+    """
+    if not len(df):
+        return _empty_df()
+    sensors = pd.Categorical(df["sensor"]).remove_unused_categories()
+    columns = np.array(sorted(sensors.categories), dtype=object)
+    column_positions = np.searchsorted(columns, np.asarray(sensors.categories, dtype=object))
+    wide = _pivot_codes(
+        times=df["time"].to_numpy(dtype="datetime64[ns]"),
+        codes=column_positions[sensors.codes],
+        values=df["value"].to_numpy(),
+        columns=columns,
+        ioc_code=ioc_code,
+    )
+    return wide
+
+
+def melt_ioc_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a wide dataframe with one column per sensor to a long one (see `DataLayout`).
+
+    The NaN values are dropped.
+    """
+    # The categories of SENSOR_DTYPE are sorted, so the codes are the positions in IOC_SENSORS
+    columns = sorted(column for column in df.columns if column in SENSOR_DTYPE.categories)
+    if not len(df) or not columns:
+        return empty_long_ioc_df()
+    # Column major, so that the values of each sensor are a contiguous slice
+    values = df[columns].to_numpy().T.ravel()
+    times = np.tile(df.index.to_numpy(dtype="datetime64[ns]"), len(columns))
+    codes = np.repeat(np.searchsorted(IOC_SENSORS, columns), len(df)).astype(np.int8)
+    valid = ~np.isnan(values)
+    times, codes, values = times[valid], codes[valid], values[valid]
+    if not df.index.is_monotonic_increasing:
+        order = np.lexsort((times, codes))
+        times, codes, values = times[order], codes[order], values[order]
+    long = _make_long_df(times=times, codes=codes, values=values)
+    return long
+
+
+def parse_ioc_json(content: str | bytes, ioc_code: str, layout: DataLayout = "wide") -> pd.DataFrame:
+    """
+    Parse an IOC response to a dataframe with `layout` (see `DataLayout`).
+
+    With the "wide" layout this is equivalent to `pd.read_json()` + pivoting (the reference implementation
+    is in `benchmarks/pandas_parser.py`) but about 2-2.5x faster (see `benchmarks/bench_parse.py`).
+    """
+    times, sensors, values = decode_ioc_json(content)
+    if layout == "long":
+        return to_long_ioc_df(times=times, sensors=sensors, values=values, ioc_code=ioc_code)
+    if layout != "wide":
+        raise ValueError(f"Unknown layout: {layout}")
+    df = pivot_ioc_arrays(times=times, sensors=sensors, values=values, ioc_code=ioc_code)
+    return df
+
+
+class ParsedChunk(T.NamedTuple):
+    """
+    The columnar representation of a parsed IOC response.
+
+    Transferring this between processes only requires copying 2 numpy buffers,
+    which is much cheaper than pickling a `pd.DataFrame`.
+    """
+
+    times: npt.NDArray[np.datetime64]
+    columns: list[str]
+    values: npt.NDArray[np.float64]
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> ParsedChunk:
+        return cls(times=df.index.to_numpy(), columns=df.columns.tolist(), values=df.to_numpy())
+
+    def to_df(self) -> pd.DataFrame:
+        if not len(self.columns):
+            return _empty_df()
+        df = pd.DataFrame(
+            self.values,
+            index=pd.DatetimeIndex(self.times, name="time"),
+            columns=pd.Index(self.columns, dtype=object, name=""),
+            copy=False,
+        )
+        return df
+
+
+class ParsedLongChunk(T.NamedTuple):
+    """
+    The columnar representation of a parsed IOC response with the "long" layout.
+    """
+
+    times: npt.NDArray[np.datetime64]
+    codes: npt.NDArray[np.int8]
+    values: npt.NDArray[np.float64]
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> ParsedLongChunk:
+        return cls(
+            times=df["time"].to_numpy(),
+            codes=df["sensor"].cat.codes.to_numpy(),
+            values=df["value"].to_numpy(),
+        )
+
+    def to_df(self) -> pd.DataFrame:
+        return _make_long_df(times=self.times, codes=self.codes, values=self.values)
+
+
+def parse_ioc_json_shared_memory(
+    name: str,
+    offset: int,
+    size: int,
+    ioc_code: str,
+    url: str = "",
+    layout: DataLayout = "wide",
+) -> ParsedChunk | ParsedLongChunk:
+    """
+    Parse an IOC response that has been written to a `SharedMemory` block by the parent process.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        content = bytes(shm.buf[offset : offset + size])
+    finally:
+        shm.close()
+    try:
+        df = parse_ioc_json(content=content, ioc_code=ioc_code, layout=layout)
+    except Exception:
+        logger.warning("%s: Failed to parse: %s", ioc_code, url)
+        raise
+    if layout == "long":
+        return ParsedLongChunk.from_df(df)
+    return ParsedChunk.from_df(df)
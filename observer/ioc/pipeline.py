@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import logging
+import time
+import typing as T
+
+import multifutures
+import pandas as pd
+import pydantic
+
+from observer.azclients import CredentialAIO
+
+from .cache import ResponseCache
+from .fs import get_ioc_last_timestamps
+from .fs import StorageEncoding
+from .fs import write_ioc_dfs
+from .incremental import DEFAULT_OVERLAP
+from .incremental import get_ioc_start_dates
+from .parser import DataLayout
+from .parser import get_ioc_rows_after
+from .scraper import ChunkSize
+from .scraper import DEFAULT_CHUNK_SIZE
+from .scraper import generate_station_urls
+from .scraper import ParseExecutor
+from .scraper import resolve_rate_limit
+from .scraper import retry_failed_chunks
+from .scraper import scrape_ioc_with_report
+
+logger = logging.getLogger(__name__)
+
+# How the scraped data are stored:
+#   - "scrape": append the data to the existing stations
+#   - "backfill": replace the existing stations
+#   - "update": only scrape the data after the last stored timestamp and append them
+PipelineMode: T.TypeAlias = T.Literal["scrape", "backfill", "update"]
+
+
+class PipelineResult(pydantic.BaseModel):
+    """
+    The result of `run_ioc_pipeline()`.
+
+    `failures` contains the first exception of each station that failed to be scraped or uploaded.
+    """
+
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
+    stations: int = 0
+    requests: int = 0
+    rows: int = 0
+    uploaded: list[str] = []
+    failures: dict[str, BaseException] = {}
+    elapsed: float = 0.0
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def stations_per_minute(self) -> float:
+        return 60 * self.stations / self.elapsed if self.elapsed else 0.0
+
+
+def _count_requests(
+    ioc_codes: list[str],
+    start_dates: dict[str, pd.Timestamp],
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize,
+) -> int:
+    n_requests = 0
+    for ioc_code in ioc_codes:
+        urls = generate_station_urls(
+            ioc_code, start_date=start_dates, end_date=end_date, chunk_size=chunk_size
+        )
+        n_requests += len(urls)
+    return n_requests
+
+
+def run_ioc_pipeline(
+    ioc_codes: list[str],
+    *,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    mode: PipelineMode = "scrape",
+    overlap: pd.Timedelta = DEFAULT_OVERLAP,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    rate_limit: multifutures.RateLimit | None = None,
+    n_threads: int = 5,
+    n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutor = "auto",
+    batch_size: int = 50,
+    n_retries: int = 1,
+    n_upload_threads: int = 10,
+    compression_level: int = 0,
+    encoding: StorageEncoding = "float64",
+    layout: DataLayout = "wide",
+    cache: ResponseCache | None = None,
+    credential: CredentialAIO | None = None,
+    from_catalog: bool = False,
+    update_catalog: bool = True,
+    progress: T.Callable[[int], None] | None = None,
+) -> PipelineResult:
+    """
+    Scrape the IOC stations and upload them, `batch_size` stations at a time.
+
+    Each batch is scraped with `scrape_ioc_with_report()`, its failed chunks are retried up to
+    `n_retries` times and the complete stations are uploaded with `write_ioc_dfs()`. A station that
+    fails doesn't abort the rest of the pipeline; it is reported in `PipelineResult.failures`.
+    The peak memory is bounded by the size of a batch.
+
+    In "update" mode `start_date` is only used for the stations that have not been stored yet.
+    Whether a station is appended to or replaced depends on its last stored timestamp (only stations
+    without data are replaced). If `from_catalog` is `True`, the last stored timestamps are taken from
+    the catalog, falling back to the footers of the stations that are missing from it; in "update" mode
+    the appended rows are still checked against the footer of each station, in case the catalog is outdated.
+    `compression_level`, `encoding` and `update_catalog` are passed to `write_ioc_dfs()`.
+    The stations are scraped with `layout`; new stations are stored with it, while appends are converted
+    to the layout of the existing stations (see `DataLayout`).
+    `progress` is called with the number of stations of each batch once the batch is done.
+    """
+    result = PipelineResult()
+    started = time.perf_counter()
+    logger.info("Starting %s pipeline of %d stations: %s - %s", mode, len(ioc_codes), start_date, end_date)
+    # Share the rate limit between the batches, so that it is respected across them
+    rate_limit = resolve_rate_limit(rate_limit=rate_limit)
+    last_timestamps: dict[str, pd.Timestamp | None] = {}
+    if mode != "backfill":
+        last_timestamps = get_ioc_last_timestamps(
+            ioc_codes=ioc_codes, credential=credential, from_catalog=from_catalog
+        )
+    for offset in range(0, len(ioc_codes), batch_size):
+        batch_codes = ioc_codes[offset : offset + batch_size]
+        if mode == "update":
+            start_dates = get_ioc_start_dates(
+                batch_codes,
+                default_start_date=start_date,
+                overlap=overlap,
+                last_timestamps=last_timestamps,
+            )
+        else:
+            start_dates = {ioc_code: start_date for ioc_code in batch_codes}
+        result.requests += _count_requests(batch_codes, start_dates, end_date, chunk_size)
+        scrape_kwargs: dict[str, T.Any] = dict(
+            rate_limit=rate_limit,
+            n_threads=n_threads,
+            n_processes=n_processes,
+            parse_executor=parse_executor,
+            cache=cache,
+            layout=layout,
+        )
+        scrape_result = scrape_ioc_with_report(
+            ioc_codes=batch_codes,
+            start_date=start_dates,
+            end_date=end_date,
+            chunk_size=chunk_size,
+            **scrape_kwargs,
+        )
+        for _ in range(n_retries):
+            if not scrape_result.failures:
+                break
+            result.requests += len(scrape_result.failures)
+            scrape_result = retry_failed_chunks(scrape_result, **scrape_kwargs)
+        for failure in scrape_result.failures:
+            result.failures.setdefault(failure.ioc_code, failure.exception)
+
+        to_append: dict[str, pd.DataFrame] = {}
+        to_replace: dict[str, pd.DataFrame] = {}
+        for ioc_code, df in scrape_result.dataframes.items():
+            last_timestamp = last_timestamps.get(ioc_code)
+            if last_timestamp is None:
+                to_replace[ioc_code] = df
+            elif mode == "update":
+                # Don't store the overlap twice
+                to_append[ioc_code] = get_ioc_rows_after(df, last_timestamp)
+            else:
+                to_append[ioc_code] = df
+        upload_kwargs: dict[str, T.Any] = dict(
+            compression_level=compression_level,
+            encoding=encoding,
+            credential=credential,
+            n_threads=n_upload_threads,
+            update_catalog=update_catalog,
+        )
+        upload_failures = {
+            **write_ioc_dfs(to_append, append=True, skip_stored=mode == "update", **upload_kwargs),
+            **write_ioc_dfs(to_replace, append=False, **upload_kwargs),
+        }
+        result.failures.update(upload_failures)
+        for ioc_code, df in {**to_append, **to_replace}.items():
+            if not df.empty and ioc_code not in upload_failures:
+                result.uploaded.append(ioc_code)
+                result.rows += len(df)
+        result.stations += len(batch_codes)
+        result.elapsed = time.perf_counter() - started
+        logger.info(
+            "Finished batch: stations: %d/%d, failures: %d, rows/s: %.0f",
+            result.stations,
+            len(ioc_codes),
+            len(result.failures),
+            result.rows_per_second,
+        )
+        if progress is not None:
+            progress(len(batch_codes))
+    result.elapsed = time.perf_counter() - started
+    logger.info(
+        "Finished %s pipeline: uploaded: %d, failures: %d", mode, len(result.uploaded), len(result.failures)
+    )
+    return result
@@ -1,18 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 import collections
-import io
+import concurrent.futures
+import functools
 import itertools
 import logging
+import time
 import typing as T
+from multiprocessing import shared_memory
 
 import httpx
 import limits
 import multifutures
+import numpy as np
 import pandas as pd
-import searvey.ioc
+import pydantic
 import tenacity
 
+from observer.metrics import get_metrics
+
+from .cache import ResponseCache
+from .parser import concat_long_ioc_dfs
+from .parser import DataLayout
+from .parser import empty_long_ioc_df
+from .parser import parse_ioc_json
+from .parser import parse_ioc_json_shared_memory
+from .parser import ParsedChunk
+from .parser import ParsedLongChunk
+
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://www.ioc-sealevelmonitoring.org/service.php?query=data&timestart={timestart}&timestop={timestop}&code={ioc_code}"
@@ -20,6 +36,30 @@ BASE_URL = "https://www.ioc-sealevelmonitoring.org/service.php?query=data&timest
 IOC_URL_TS_FORMAT = "%Y-%m-%dT%H:%M:%S"
 IOC_JSON_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Either a common start date or a start date per IOC code
+StartDate: T.TypeAlias = pd.Timestamp | T.Mapping[str, pd.Timestamp]
+
+# Where to parse the responses:
+#   - "inline": in the calling thread; no serialization at all
+#   - "thread": in a thread pool; no serialization but subject to the GIL
+#   - "process": in a process pool; the responses are passed via shared memory
+#   - "auto": "inline" for small jobs, "process" for big ones
+ParseExecutor: T.TypeAlias = T.Literal["auto", "inline", "thread", "process"]
+AUTO_INLINE_MAX_SIZE = 32 * 2**20
+
+# The default chunk is 30 days. For stations with a known sampling rate we target a constant number of records per
+# request instead; a 1 minute station with 3 sensors returns ~130k records/~8MB per 30 days, which is often too slow.
+DEFAULT_CHUNK_SIZE = pd.Timedelta(days=30)
+MIN_CHUNK_SIZE = pd.Timedelta(days=1)
+MAX_CHUNK_SIZE = pd.Timedelta(days=365)
+TARGET_RECORDS_PER_REQUEST = 50_000
+# The number of sensors that is assumed when it is not known. Most stations have more than one,
+# and underestimating it results in responses that are too big for IOC to serve in time.
+DEFAULT_N_SENSORS = 3
+
+# Either a common chunk size or a chunk size per IOC code
+ChunkSize: T.TypeAlias = pd.Timedelta | T.Mapping[str, pd.Timedelta]
+
 
 def ioc_date(ts: pd.Timestamp) -> str:
     formatted = ts.strftime(IOC_URL_TS_FORMAT)
@@ -30,11 +70,14 @@ def generate_urls(
     ioc_code: str,
     start_date: pd.Timestamp,
     end_date: pd.Timestamp,
+    chunk_size: pd.Timedelta = DEFAULT_CHUNK_SIZE,
 ) -> list[str]:
     if end_date <= start_date:
         raise ValueError(f"'end_date' must be after 'start_date': {end_date} vs {start_date}")
+    if chunk_size <= pd.Timedelta(0):
+        raise ValueError(f"'chunk_size' must be positive: {chunk_size}")
     duration = end_date - start_date
-    periods = duration.days // 30 + 2
+    periods = duration // chunk_size + 2
     urls = []
     date_range = pd.date_range(start_date, end_date, periods=periods, unit="us", inclusive="both")
     for start, stop in itertools.pairwise(date_range):
@@ -45,7 +88,112 @@ def generate_urls(
     return urls
 
 
+def generate_station_urls(
+    ioc_code: str,
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+) -> list[str]:
+    if not isinstance(start_date, pd.Timestamp):
+        start_date = start_date[ioc_code]
+    if not isinstance(chunk_size, pd.Timedelta):
+        chunk_size = chunk_size.get(ioc_code, DEFAULT_CHUNK_SIZE)
+    if start_date >= end_date:
+        logger.info("%s: Nothing to scrape after: %s", ioc_code, start_date)
+        return []
+    urls = generate_urls(ioc_code=ioc_code, start_date=start_date, end_date=end_date, chunk_size=chunk_size)
+    return urls
+
+
+def parse_sample_interval(value: T.Any) -> pd.Timedelta | None:
+    """
+    Parse the `sample_interval` of the IOC metadata, e.g. `1'` (minutes) or `30"` (seconds).
+
+    Plain numbers are interpreted as minutes. Return `None` if the value can't be parsed.
+    """
+    if isinstance(value, (int, float)):
+        return pd.Timedelta(minutes=value) if value > 0 else None
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        if text.endswith(("''", '"')):
+            interval = pd.Timedelta(seconds=float(text.rstrip("'\"")))
+        elif text.endswith("'"):
+            interval = pd.Timedelta(minutes=float(text.rstrip("'")))
+        else:
+            interval = pd.Timedelta(minutes=float(text))
+    except ValueError:
+        try:
+            interval = pd.Timedelta(text)
+        except ValueError:
+            return None
+    if pd.isna(interval) or interval <= pd.Timedelta(0):
+        return None
+    return interval
+
+
+def estimate_chunk_size(
+    records_per_day: float,
+    target_records: int = TARGET_RECORDS_PER_REQUEST,
+) -> pd.Timedelta:
+    """
+    Return the chunk size that should result in responses of roughly `target_records` records.
+    """
+    if records_per_day <= 0:
+        return DEFAULT_CHUNK_SIZE
+    chunk_size = pd.Timedelta(days=target_records / records_per_day).floor("min")
+    return min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+
+def get_chunk_sizes(
+    metadata: pd.DataFrame,
+    n_sensors: T.Mapping[str, int] | None = None,
+    target_records: int = TARGET_RECORDS_PER_REQUEST,
+) -> dict[str, pd.Timedelta]:
+    """
+    Return the chunk size of each station using the IOC metadata (e.g. from `get_ioc_metadata()`).
+
+    The metadata does not contain the number of sensors per station; if it is known, e.g. from
+    the catalog, it can be passed via `n_sensors`. Otherwise `DEFAULT_N_SENSORS` are assumed.
+    """
+    if n_sensors is None:
+        n_sensors = {}
+    chunk_sizes = {}
+    for row in metadata.to_dict(orient="records"):
+        ioc_code = row["ioc_code"]
+        sample_interval = parse_sample_interval(row.get("sample_interval"))
+        if sample_interval is None:
+            continue
+        records_per_day = pd.Timedelta(days=1) / sample_interval * n_sensors.get(ioc_code, DEFAULT_N_SENSORS)
+        chunk_sizes[ioc_code] = estimate_chunk_size(records_per_day, target_records=target_records)
+    return chunk_sizes
+
+
+def learn_chunk_sizes(
+    dataframes: T.Mapping[str, pd.DataFrame],
+    target_records: int = TARGET_RECORDS_PER_REQUEST,
+) -> dict[str, pd.Timedelta]:
+    """
+    Return the chunk size of each station using previously scraped data (e.g. from `scrape_ioc()`).
+
+    This takes into account both the actual sampling rate and the actual number of sensors.
+    """
+    chunk_sizes = {}
+    for ioc_code, df in dataframes.items():
+        if len(df) < 2:
+            continue
+        days = (df.index[-1] - df.index[0]) / pd.Timedelta(days=1)
+        if days <= 0:
+            continue
+        # Each non-null value is a separate record in the IOC response
+        records_per_day = df.count().sum() / days
+        chunk_sizes[ioc_code] = estimate_chunk_size(records_per_day, target_records=target_records)
+    return chunk_sizes
+
+
 def my_before_sleep(retry_state: T.Any) -> None:
+    get_metrics().inc("observer_ioc_retries_total")
     logger.warning(
         "Retrying %s: attempt %s ended with: %s",
         retry_state.fn,
@@ -54,53 +202,139 @@ def my_before_sleep(retry_state: T.Any) -> None:
     )
 
 
-@tenacity.retry(
+def _record_response(response: httpx.Response, started: float) -> None:
+    metrics = get_metrics()
+    metrics.observe("observer_ioc_request_seconds", time.perf_counter() - started)
+    metrics.inc("observer_ioc_requests_total", status=str(response.status_code))
+    metrics.inc("observer_ioc_downloaded_bytes_total", len(response.content))
+
+
+def _is_transient_error(exception: BaseException) -> bool:
+    # e.g. a 503 while IOC is overloaded or a 429 when we are rate limited; other HTTP errors are final
+    if isinstance(exception, httpx.HTTPStatusError):
+        status_code = exception.response.status_code
+        return status_code == httpx.codes.TOO_MANY_REQUESTS or status_code >= 500
+    return isinstance(exception, httpx.TransportError)
+
+
+retry_on_transient_error = tenacity.retry(
     stop=(tenacity.stop_after_delay(90) | tenacity.stop_after_attempt(10)),
     wait=tenacity.wait_random(min=2, max=10),
-    retry=tenacity.retry_if_exception_type(httpx.TransportError),
+    retry=tenacity.retry_if_exception(_is_transient_error),
     before_sleep=my_before_sleep,
 )
+
+
+@retry_on_transient_error
 def fetch_url(
     url: str,
     client: httpx.Client,
     rate_limit: multifutures.RateLimit,
     ioc_code: str = "",
+    cache: ResponseCache | None = None,
 ) -> str:
+    metrics = get_metrics()
+    if cache is not None and (data := cache.get_url(url)) is not None:
+        metrics.inc("observer_ioc_cache_hits_total")
+        return data
+
+    started = time.perf_counter()
     while rate_limit.reached(identifier="IOC"):
         multifutures.wait()
+    metrics.inc("observer_ioc_rate_limit_wait_seconds_total", time.perf_counter() - started)
 
+    started = time.perf_counter()
     try:
         response = client.get(url)
     except Exception:
+        metrics.inc("observer_ioc_requests_total", status="error")
         logger.warning("Failed to retrieve: %s", url)
         raise
+    _record_response(response, started=started)
+    # e.g. a 503 while IOC is overloaded. The body is not data, so fail (see `_is_transient_error()`)
+    response.raise_for_status()
     data = response.text
+    if cache is not None:
+        cache.set_url(url, content=data)
     return data
 
 
-def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
-    df = df[df.sensor.isin(searvey.ioc.IOC_STATION_DATA_COLUMNS.values())]
-    df = df.assign(stime=pd.DatetimeIndex(pd.to_datetime(df.stime.str.strip(), format=IOC_JSON_TS_FORMAT)))
-    df = df.rename(columns={"stime": "time"})
-    # Occasionaly IOC contains complete garbage. E.g. duplicate timestamps on the same sensor. We should drop those.
-    # https://www.ioc-sealevelmonitoring.org/service.php?query=data&timestart=2022-03-12T11:03:40&timestop=2022-04-11T09:04:26&code=acnj
-    duplicated_timestamps = df[["time", "sensor"]].duplicated()
-    if duplicated_timestamps.sum() > 0:
-        df = df[~duplicated_timestamps]
-        logger.warning("%s: Dropped duplicates: %d rows", df.attrs["ioc_code"], duplicated_timestamps.sum())
-    df = df.pivot(index="time", columns="sensor", values="slevel")
-    df._mgr.items.name = ""  # type: ignore[attr-defined]
-    return df
+class AsyncRateLimit:
+    """
+    A token bucket rate limiter that can be shared between `asyncio` tasks.
+
+    Contrary to `multifutures.RateLimit`, waiting for a token does not busy-wait;
+    each caller sleeps exactly until the next token becomes available.
+    """
+
+    def __init__(self, rate: float = 5, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f"'rate' must be positive: {rate}")
+        if burst < 1:
+            raise ValueError(f"'burst' must be at least 1: {burst}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1
+                self._updated = time.monotonic()
+            self._tokens -= 1
+
+
+@retry_on_transient_error
+async def fetch_url_async(
+    url: str,
+    client: httpx.AsyncClient,
+    rate_limit: AsyncRateLimit,
+    ioc_code: str = "",
+    cache: ResponseCache | None = None,
+) -> str:
+    metrics = get_metrics()
+    if cache is not None and (data := cache.get_url(url)) is not None:
+        metrics.inc("observer_ioc_cache_hits_total")
+        return data
+
+    started = time.perf_counter()
+    await rate_limit.acquire()
+    metrics.inc("observer_ioc_rate_limit_wait_seconds_total", time.perf_counter() - started)
+    started = time.perf_counter()
+    try:
+        response = await client.get(url)
+    except Exception:
+        metrics.inc("observer_ioc_requests_total", status="error")
+        logger.warning("Failed to retrieve: %s", url)
+        raise
+    _record_response(response, started=started)
+    # e.g. a 503 while IOC is overloaded. The body is not data, so fail (see `_is_transient_error()`)
+    response.raise_for_status()
+    data = response.text
+    if cache is not None:
+        cache.set_url(url, content=data)
+    return data
 
 
-def parse_json(content: str, ioc_code: str) -> pd.DataFrame:
-    df = pd.read_json(content, orient="records")
-    df.attrs["ioc_code"] = ioc_code
-    df = normalize_df(df)
+def parse_json(content: str, ioc_code: str, url: str = "", layout: DataLayout = "wide") -> pd.DataFrame:
+    try:
+        df = parse_ioc_json(content=content, ioc_code=ioc_code, layout=layout)
+    except Exception:
+        logger.warning("%s: Failed to parse: %s", ioc_code, url)
+        raise
     return df
 
 
-def _resolve_rate_limit(rate_limit: multifutures.RateLimit | None = None) -> multifutures.RateLimit:
+def resolve_rate_limit(rate_limit: multifutures.RateLimit | None = None) -> multifutures.RateLimit:
+    """
+    Return `rate_limit` or, if it is not specified, the default rate limit of the IOC requests.
+    """
     if rate_limit is None:
         rate_limit = multifutures.RateLimit(rate_limit=limits.parse("5/second"))
     return rate_limit
@@ -113,109 +347,391 @@ def _resolve_http_client(http_client: httpx.Client | None = None) -> httpx.Clien
     return http_client
 
 
+def _resolve_async_rate_limit(rate_limit: AsyncRateLimit | None = None) -> AsyncRateLimit:
+    if rate_limit is None:
+        rate_limit = AsyncRateLimit(rate=5)
+    return rate_limit
+
+
+def _resolve_async_http_client(
+    http_client: httpx.AsyncClient | None = None,
+    n_concurrent: int = 100,
+) -> httpx.AsyncClient:
+    if http_client is None:
+        timeout = httpx.Timeout(timeout=10, read=30)
+        pool_limits = httpx.Limits(max_connections=n_concurrent, max_keepalive_connections=n_concurrent)
+        http_client = httpx.AsyncClient(timeout=timeout, limits=pool_limits)
+    return http_client
+
+
+def _generate_fetch_kwargs(
+    ioc_codes: list[str],
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    **kwargs: T.Any,
+) -> list[dict[str, T.Any]]:
+    fetch_kwargs = []
+    for ioc_code in ioc_codes:
+        urls = generate_station_urls(ioc_code=ioc_code, start_date=start_date, end_date=end_date, chunk_size=chunk_size)
+        for url in urls:
+            fetch_kwargs.append(dict(ioc_code=ioc_code, url=url, **kwargs))
+    return fetch_kwargs
+
+
 def retrieve_ioc_data(
     ioc_codes: list[str],
-    start_date: pd.Timestamp,
+    start_date: StartDate,
     end_date: pd.Timestamp,
     rate_limit: multifutures.RateLimit,
     http_client: httpx.Client,
     n_threads: int,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    cache: ResponseCache | None = None,
+    check: bool = True,
 ) -> list[multifutures.FutureResult]:
-    kwargs = []
-    for ioc_code in ioc_codes:
-        for url in generate_urls(ioc_code=ioc_code, start_date=start_date, end_date=end_date):
-            kwargs.append(
-                dict(
-                    ioc_code=ioc_code,
-                    url=url,
-                    client=http_client,
-                    rate_limit=rate_limit,
-                )
-            )
-    with http_client:
+    kwargs = _generate_fetch_kwargs(
+        ioc_codes=ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        chunk_size=chunk_size,
+        client=http_client,
+        rate_limit=rate_limit,
+        cache=cache,
+    )
+    results = _fetch_urls(func_kwargs=kwargs, http_client=http_client, n_threads=n_threads)
+    if check:
+        multifutures.check_results(results)
+    return results
+
+
+def _fetch_urls(
+    func_kwargs: list[dict[str, T.Any]],
+    http_client: httpx.Client,
+    n_threads: int,
+) -> list[multifutures.FutureResult]:
+    with http_client, get_metrics().phase("fetch"):
         logger.debug("Starting data retrieval")
         results = multifutures.multithread(
             func=fetch_url,
-            func_kwargs=kwargs,
+            func_kwargs=func_kwargs,
             check=False,
             n_workers=n_threads
         )
         logger.debug("Finished data retrieval")
+    return results
+
+
+async def retrieve_ioc_data_async(
+    ioc_codes: list[str],
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    rate_limit: AsyncRateLimit,
+    http_client: httpx.AsyncClient,
+    n_concurrent: int,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    cache: ResponseCache | None = None,
+) -> list[multifutures.FutureResult]:
+    kwargs = _generate_fetch_kwargs(
+        ioc_codes=ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        chunk_size=chunk_size,
+        client=http_client,
+        rate_limit=rate_limit,
+        cache=cache,
+    )
+    # The semaphore bounds the number of requests in flight, the rate limit bounds how often they start
+    semaphore = asyncio.Semaphore(n_concurrent)
+
+    async def fetch(func_kwargs: dict[str, T.Any]) -> multifutures.FutureResult:
+        async with semaphore:
+            try:
+                result = await fetch_url_async(**func_kwargs)
+            except Exception as exc:
+                return multifutures.FutureResult(exception=exc, kwargs=func_kwargs)
+            return multifutures.FutureResult(result=result, kwargs=func_kwargs)
+
+    async with http_client:
+        logger.debug("Starting async data retrieval")
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch(func_kwargs) for func_kwargs in kwargs))
+        get_metrics().inc("observer_phase_seconds_total", time.perf_counter() - started, phase="fetch")
+        logger.debug("Finished async data retrieval")
     multifutures.check_results(results)
     return results
 
 
+def is_empty_response(content: str, ioc_code: str) -> bool:
+    # if a url doesn't have any data instead of a 404, it returns an empty list `[]`
+    if content == "[]":
+        return True
+    # For some stations though we get a json like this:
+    #    '[{"error":"code \'blri\' not found"}]'
+    #    '[{"error":"code \'bmda2\' not found"}]'
+    # we should ignore these, too
+    elif content == f"""[{{"error":"code '{ioc_code}' not found"}}]""":
+        return True
+    # And if the IOC code does not match some pattern (5 letters?) then we get this error
+    elif content == '[{"error":"Incorrect code"}]':
+        return True
+    return False
+
+
+def _parse_inline(func_kwargs: list[dict[str, T.Any]]) -> list[multifutures.FutureResult]:
+    results = []
+    for kwargs in func_kwargs:
+        try:
+            df = parse_json(**kwargs)
+        except Exception as exc:
+            results.append(multifutures.FutureResult(exception=exc, kwargs=kwargs))
+        else:
+            results.append(multifutures.FutureResult(result=df, kwargs=kwargs))
+    return results
+
+
+def _get_encoded_size(content: str) -> int:
+    # Most responses are ASCII, so they don't need to be encoded just to find their size
+    return len(content) if content.isascii() else len(content.encode())
+
+
+def _parse_in_processes(
+    func_kwargs: list[dict[str, T.Any]],
+    n_processes: int,
+) -> list[multifutures.FutureResult]:
+    # Instead of pickling each response to the workers, we copy all of them to a single shared memory block
+    # and only send the offsets. The workers send back numpy buffers instead of pickled dataframes.
+    # Each response is encoded right before it is copied, so the encoded responses are never all in memory
+    # next to the shared memory block.
+    sizes = [_get_encoded_size(kwargs["content"]) for kwargs in func_kwargs]
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)))
+    try:
+        shm_kwargs = []
+        offset = 0
+        for kwargs, size in zip(func_kwargs, sizes):
+            shm.buf[offset : offset + size] = kwargs["content"].encode()
+            shm_kwargs.append(
+                dict(
+                    name=shm.name,
+                    offset=offset,
+                    size=size,
+                    ioc_code=kwargs["ioc_code"],
+                    url=kwargs["url"],
+                    layout=kwargs["layout"],
+                ),
+            )
+            offset += size
+        results = multifutures.multiprocess(
+            parse_ioc_json_shared_memory,
+            func_kwargs=shm_kwargs,
+            check=False,
+            n_workers=n_processes,
+        )
+    finally:
+        _release_shared_memory(shm)
+    for result in results:
+        if result.exception is None:
+            result.result = result.result.to_df()
+    return results
+
+
+def _resolve_parse_executor(executor: ParseExecutor, total_size: int) -> ParseExecutor:
+    if executor == "auto":
+        # For small jobs, starting the processes costs more than the parsing itself
+        executor = "inline" if total_size <= AUTO_INLINE_MAX_SIZE else "process"
+    return executor
+
+
 def parse_ioc_responses(
     ioc_responses: list[multifutures.FutureResult],
     n_processes: int,
+    executor: ParseExecutor = "auto",
+    check: bool = True,
+    layout: DataLayout = "wide",
 ) -> list[multifutures.FutureResult]:
-    # Parse the json files using pandas
-    # This is a CPU heavy process, so let's use multiprocess
+    # Parse the json files.
+    # This is a CPU heavy process, so for big jobs let's use multiprocess
     # Not all the urls contain data, so let's filter them out
     kwargs = []
     for result in ioc_responses:
         ioc_code = result.kwargs["ioc_code"]  # type: ignore[index]
-        # if a url doesn't have any data instead of a 404, it returns an empty list `[]`
-        if result.result == "[]":
-            continue
-        # For some stations though we get a json like this:
-        #    '[{"error":"code \'blri\' not found"}]'
-        #    '[{"error":"code \'bmda2\' not found"}]'
-        # we should ignore these, too
-        elif result.result == f"""[{{"error":"code '{ioc_code}' not found"}}]""":
-            continue
-        # And if the IOC code does not match some pattern (5 letters?) then we get this error
-        elif result.result == '[{"error":"Incorrect code"}]':
-            continue
+        if not is_empty_response(content=result.result, ioc_code=ioc_code):
+            url = result.kwargs.get("url", "")  # type: ignore[union-attr]
+            kwargs.append(dict(ioc_code=ioc_code, content=result.result, url=url, layout=layout))
+    total_size = sum(len(item["content"]) for item in kwargs)
+    executor = _resolve_parse_executor(executor, total_size=total_size)
+    logger.debug("Starting JSON parsing: %s", executor)
+    metrics = get_metrics()
+    with metrics.phase("parse"):
+        if executor == "inline":
+            results = _parse_inline(func_kwargs=kwargs)
+        elif executor == "thread":
+            results = multifutures.multithread(
+                parse_json, func_kwargs=kwargs, check=False, n_workers=n_processes
+            )
+        elif executor == "process":
+            results = _parse_in_processes(func_kwargs=kwargs, n_processes=n_processes)
         else:
-            kwargs.append(dict(ioc_code=ioc_code, content=io.StringIO(result.result)))
-    logger.debug("Starting JSON parsing")
-    results = multifutures.multiprocess(parse_json, func_kwargs=kwargs, check=False, n_workers=n_processes)
-    multifutures.check_results(results)
+            raise ValueError(f"Unknown parse executor: {executor}")
+    metrics.inc("observer_ioc_parsed_bytes_total", total_size)
+    parsed_rows = sum(len(result.result) for result in results if result.exception is None)
+    metrics.inc("observer_ioc_parsed_rows_total", parsed_rows)
+    if check:
+        multifutures.check_results(results)
     logger.debug("Finished JSON parsing")
     return results
 
 
+def _is_strictly_increasing(index: pd.DatetimeIndex) -> bool:
+    times = index.asi8
+    return bool((times[1:] > times[:-1]).all())
+
+
+def merge_sorted_chunks(dfs: list[pd.DataFrame]) -> pd.DataFrame | None:
+    """
+    Merge the chunks of a station into a single dataframe with a single allocation.
+
+    The chunks are generated by `generate_urls()`, so each one of them is sorted and consecutive chunks
+    overlap (at most) at their boundary timestamp. The boundary rows are combined; where both chunks have
+    a value, the one of the earlier chunk is kept. This avoids the copies of `pd.concat()` + `sort_index()`
+    + `index.duplicated()`.
+    Return `None` if the chunks don't have this structure, e.g. if their time ranges overlap.
+    """
+    chunks = [df for df in dfs if len(df)]
+    if not chunks:
+        return None
+    for df in chunks:
+        if not isinstance(df.index, pd.DatetimeIndex) or df.index.tz is not None:
+            return None
+        if not (df.dtypes == np.float64).all() or not _is_strictly_increasing(df.index):
+            return None
+    # The chunks of the retried requests come last; `sorted()` is stable so the order of the rest is kept
+    chunks = sorted(chunks, key=lambda df: df.index[0])
+    first_rows = [0]
+    for previous, df in itertools.pairwise(chunks):
+        if df.index[0] < previous.index[-1]:
+            return None
+        first_rows.append(int(df.index[0] == previous.index[-1]))
+    # Same order as `pd.concat()`: the order of appearance
+    columns = list(dict.fromkeys(column for df in dfs for column in df.columns))
+    column_positions = {column: position for position, column in enumerate(columns)}
+    n_rows = sum(len(df) - first_row for df, first_row in zip(chunks, first_rows))
+    times = np.empty(n_rows, dtype="datetime64[ns]")
+    # One row per column, so that pandas can use it as its (only) block without copying it
+    values = np.full((len(columns), n_rows), np.nan)
+    offset = 0
+    for df, first_row in zip(chunks, first_rows):
+        size = len(df) - first_row
+        times[offset : offset + size] = df.index.to_numpy()[first_row:]
+        positions = [column_positions[column] for column in df.columns]
+        chunk_values = df.to_numpy()
+        if first_row:
+            boundary = values[positions, offset - 1]
+            values[positions, offset - 1] = np.where(np.isnan(boundary), chunk_values[0], boundary)
+        values[positions, offset : offset + size] = chunk_values[first_row:].T
+        offset += size
+    df = pd.DataFrame(
+        values.T,
+        index=pd.DatetimeIndex(times, name="time"),
+        columns=pd.Index(columns, dtype=object, name=chunks[0].columns.name),
+        copy=False,
+    )
+    return df
+
+
+def concat_station_dfs(ioc_code: str, dfs: list[pd.DataFrame], layout: DataLayout = "wide") -> pd.DataFrame:
+    # Concatenate dataframes and remove duplicates
+    if layout == "long":
+        long_df = concat_long_ioc_dfs(dfs, ioc_code=ioc_code) if dfs else empty_long_ioc_df()
+        logger.debug("%s: Concatenated long chunks: %d rows", ioc_code, len(long_df))
+        return long_df
+    if dfs and (df := merge_sorted_chunks(dfs)) is not None:
+        logger.debug("%s: Merged sorted chunks: %d timestamps", ioc_code, len(df))
+    elif dfs:
+        # Same precedence and columns as `merge_sorted_chunks()`: the chunks in the order of their first
+        # timestamp and the columns in the order of appearance
+        chunks = sorted((df for df in dfs if len(df)), key=lambda df: df.index[0])
+        columns = list(dict.fromkeys(column for df in dfs for column in df.columns))
+        df = pd.concat(chunks or dfs)[columns]
+        df = df.sort_index(kind="stable")
+        logger.debug("%s: Total timestamps : %d", ioc_code, len(df))
+        if df.index.has_duplicates:
+            # Combine the duplicate rows, i.e. fill the missing values from the later chunks
+            df = df.groupby(level=0, sort=False).first()
+        logger.debug("%s: Unique timestamps: %d", ioc_code, len(df))
+    else:
+        logger.warning("%s: No data. Creating a dummy dataframe", ioc_code)
+        df = pd.DataFrame(columns=["time"], dtype='datetime64[ns]').set_index("time")
+    logger.debug("%s: Finished conversion to pandas", ioc_code)
+    return df
+
+
 def group_results(
     ioc_codes: list[str],
     parsed_responses: list[multifutures.FutureResult],
+    layout: DataLayout = "wide",
 ) -> dict[str, pd.DataFrame]:
     # Group per IOC code
     df_groups = collections.defaultdict(list)
     for item in parsed_responses:
         df_groups[item.kwargs["ioc_code"]].append(item.result)  # type: ignore[index]
 
-    # Concatenate dataframes and remove duplicates
     dataframes: dict[str, pd.DataFrame] = {}
-    for ioc_code in ioc_codes:
-        if ioc_code in df_groups:
-            df_group = df_groups[ioc_code]
-            df = pd.concat(df_group)
-            df = df.sort_index()
-            logger.debug("%s: Total timestamps : %d", ioc_code, len(df))
-            df = df[~df.index.duplicated()]
-            logger.debug("%s: Unique timestamps: %d", ioc_code, len(df))
-        else:
-            logger.warning("%s: No data. Creating a dummy dataframe", ioc_code)
-            df = pd.DataFrame(columns=["time"], dtype='datetime64[ns]').set_index("time")
-        dataframes[ioc_code] = df
-        logger.debug("%s: Finished conversion to pandas", ioc_code)
-
+    with get_metrics().phase("group"):
+        for ioc_code in ioc_codes:
+            dataframes[ioc_code] = concat_station_dfs(
+                ioc_code=ioc_code, dfs=df_groups.get(ioc_code, []), layout=layout
+            )
     return dataframes
 
 
+def _is_event_loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
 def scrape_ioc(
     *,
     ioc_codes: list[str],
-    start_date: pd.Timestamp,
+    start_date: StartDate,
     end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
     rate_limit: multifutures.RateLimit | None = None,
     http_client: httpx.Client | None = None,
     n_threads: int = 5,
     n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    use_async: bool = False,
+    n_concurrent: int = 100,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
 ) -> dict[str, pd.DataFrame]:
+    if use_async:
+        # The async engine needs its own (async) client and rate limiter
+        if rate_limit is not None or http_client is not None:
+            msg = "'rate_limit' and 'http_client' are not supported when 'use_async' is True. Use `scrape_ioc_async()`"
+            raise ValueError(msg)
+        if _is_event_loop_running():
+            # `asyncio.run()` can't be nested, e.g. in Jupyter
+            raise RuntimeError("An event loop is already running. Await `scrape_ioc_async()` instead")
+        return asyncio.run(
+            scrape_ioc_async(
+                ioc_codes=ioc_codes,
+                start_date=start_date,
+                end_date=end_date,
+                chunk_size=chunk_size,
+                n_concurrent=n_concurrent,
+                n_processes=n_processes,
+                parse_executor=parse_executor,
+                cache=cache,
+                layout=layout,
+            ),
+        )
     logger.info("Starting scraping: %s - %s", start_date, end_date)
-    rate_limit = _resolve_rate_limit(rate_limit=rate_limit)
+    rate_limit = resolve_rate_limit(rate_limit=rate_limit)
     http_client = _resolve_http_client(http_client=http_client)
 
     # Fetch json files from the IOC website
@@ -227,39 +743,433 @@ def scrape_ioc(
         rate_limit=rate_limit,
         http_client=http_client,
         n_threads=n_threads,
+        chunk_size=chunk_size,
+        cache=cache,
     )
 
-    # Parse the json files using pandas
-    # This is a CPU heavy process, so we are using multiprocessing here
+    # Parse the json files
+    # This is a CPU heavy process, so for big jobs we are using multiprocessing here
     parsed_responses: list[multifutures.FutureResult] = parse_ioc_responses(
         ioc_responses=ioc_responses,
-        n_processes=n_processes
+        n_processes=n_processes,
+        executor=parse_executor,
+        layout=layout,
     )
 
     # OK, now we have a list of dataframes. We need to group them per ioc_code, concatenate them and remove duplicates
-    dataframes = group_results(ioc_codes=ioc_codes, parsed_responses=parsed_responses)
+    dataframes = group_results(ioc_codes=ioc_codes, parsed_responses=parsed_responses, layout=layout)
     return dataframes
 
 
+async def scrape_ioc_async(
+    *,
+    ioc_codes: list[str],
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    rate_limit: AsyncRateLimit | None = None,
+    http_client: httpx.AsyncClient | None = None,
+    n_concurrent: int = 100,
+    n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
+) -> dict[str, pd.DataFrame]:
+    logger.info("Starting async scraping: %s - %s", start_date, end_date)
+    rate_limit = _resolve_async_rate_limit(rate_limit=rate_limit)
+    http_client = _resolve_async_http_client(http_client=http_client, n_concurrent=n_concurrent)
+
+    # Fetch json files from the IOC website
+    # A single event loop can keep hundreds of requests in flight while the shared rate limit
+    # makes sure that we don't exceed the IOC policy
+    ioc_responses = await retrieve_ioc_data_async(
+        ioc_codes=ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        rate_limit=rate_limit,
+        http_client=http_client,
+        n_concurrent=n_concurrent,
+        chunk_size=chunk_size,
+        cache=cache,
+    )
+
+    # Parsing is CPU bound and blocking; run it in a thread so that we don't block the event loop
+    parsed_responses = await asyncio.to_thread(
+        parse_ioc_responses,
+        ioc_responses=ioc_responses,
+        n_processes=n_processes,
+        executor=parse_executor,
+        layout=layout,
+    )
+    dataframes = group_results(ioc_codes=ioc_codes, parsed_responses=parsed_responses, layout=layout)
+    return dataframes
+
+
+def _fetch_and_parse(
+    url: str,
+    client: httpx.Client,
+    rate_limit: multifutures.RateLimit,
+    ioc_code: str,
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
+) -> pd.DataFrame | None:
+    content = fetch_url(url=url, client=client, rate_limit=rate_limit, ioc_code=ioc_code, cache=cache)
+    if is_empty_response(content=content, ioc_code=ioc_code):
+        return None
+    return parse_json(content=content, ioc_code=ioc_code, layout=layout)
+
+
+def _submit_shared_memory_parse(
+    process_pool: concurrent.futures.ProcessPoolExecutor,
+    content: str,
+    ioc_code: str,
+    layout: DataLayout = "wide",
+) -> tuple[concurrent.futures.Future[ParsedChunk | ParsedLongChunk], shared_memory.SharedMemory]:
+    size = _get_encoded_size(content)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    shm.buf[:size] = content.encode()
+    future = process_pool.submit(
+        parse_ioc_json_shared_memory,
+        name=shm.name,
+        offset=0,
+        size=size,
+        ioc_code=ioc_code,
+        layout=layout,
+    )
+    return future, shm
+
+
+def _release_shared_memory(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+def _get_future_result(
+    future: concurrent.futures.Future[T.Any],
+    shared_memories: dict[concurrent.futures.Future[T.Any], shared_memory.SharedMemory],
+) -> T.Any:
+    result = future.result()
+    if future in shared_memories:
+        _release_shared_memory(shared_memories.pop(future))
+        result = result.to_df()
+    return result
+
+
+def _resolve_streaming_parse_executor(executor: ParseExecutor, n_processes: int) -> ParseExecutor:
+    if executor == "auto":
+        # The size of the job is not known in advance, so it only depends on the available processes
+        executor = "process" if n_processes > 1 else "thread"
+    if executor not in ("inline", "thread", "process"):
+        raise ValueError(f"Unknown parse executor: {executor}")
+    return executor
+
+
+def scrape_ioc_iter(
+    *,
+    ioc_codes: list[str],
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    rate_limit: multifutures.RateLimit | None = None,
+    http_client: httpx.Client | None = None,
+    n_threads: int = 5,
+    n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    n_stations: int = 10,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
+) -> T.Iterator[tuple[str, pd.DataFrame]]:
+    """
+    Scrape the IOC stations and yield `(ioc_code, df)` tuples as soon as each station is complete.
+
+    Contrary to `scrape_ioc()`, responses are parsed as soon as they are downloaded and
+    only `n_stations` stations are being downloaded at any given time. This means that peak memory
+    is bounded by the stations in flight instead of the whole job, and that the stations can be
+    handed over to e.g. `write_ioc_df()` while the rest of the scraping is still in progress.
+    The stations are not necessarily yielded in the order of `ioc_codes`.
+
+    With `parse_executor="thread"` each response is parsed by the same thread that fetched it.
+    With `parse_executor="process"` the responses are passed to the process pool via shared memory.
+    With `parse_executor="inline"` they are parsed by the thread that consumes the iterator.
+    The dataframes have `layout` (see `DataLayout`).
+    """
+    logger.info("Starting streaming scraping: %s - %s", start_date, end_date)
+    rate_limit = resolve_rate_limit(rate_limit=rate_limit)
+    http_client = _resolve_http_client(http_client=http_client)
+    parse_executor = _resolve_streaming_parse_executor(parse_executor, n_processes=n_processes)
+    parse_in_fetch_thread = parse_executor == "thread"
+    fetch_func: T.Any = functools.partial(_fetch_and_parse, layout=layout) if parse_in_fetch_thread else fetch_url
+    fetch_kwargs = dict(client=http_client, rate_limit=rate_limit, cache=cache)
+
+    pending_codes = collections.deque(ioc_codes)
+    # The number of chunks that have not been parsed yet, per station
+    remaining: dict[str, int] = {}
+    chunks: dict[str, list[pd.DataFrame]] = {}
+    # future -> (phase, ioc_code)
+    futures: dict[concurrent.futures.Future[T.Any], tuple[str, str]] = {}
+    shared_memories: dict[concurrent.futures.Future[T.Any], shared_memory.SharedMemory] = {}
+    thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_threads)
+    process_pool = None
+    if parse_executor == "process":
+        process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=n_processes)
+    try:
+        with http_client:
+            while pending_codes or futures:
+                while pending_codes and len(remaining) < n_stations:
+                    ioc_code = pending_codes.popleft()
+                    urls = generate_station_urls(
+                        ioc_code=ioc_code,
+                        start_date=start_date,
+                        end_date=end_date,
+                        chunk_size=chunk_size,
+                    )
+                    if not urls:
+                        yield ioc_code, concat_station_dfs(ioc_code=ioc_code, dfs=[], layout=layout)
+                        continue
+                    remaining[ioc_code] = len(urls)
+                    chunks[ioc_code] = []
+                    futures.update(
+                        (thread_pool.submit(fetch_func, url=url, ioc_code=ioc_code, **fetch_kwargs), ("fetch", ioc_code))
+                        for url in urls
+                    )
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    phase, ioc_code = futures.pop(future)
+                    result = _get_future_result(future, shared_memories=shared_memories)
+                    if parse_in_fetch_thread:
+                        # Already parsed by the thread that fetched it; `None` means that there was no data
+                        phase = "parse" if result is not None else "fetch"
+                    elif phase == "fetch" and not is_empty_response(content=result, ioc_code=ioc_code):
+                        if process_pool is None:
+                            result = parse_json(content=result, ioc_code=ioc_code, layout=layout)
+                            phase = "parse"
+                        else:
+                            parse_future, shm = _submit_shared_memory_parse(
+                                process_pool, content=result, ioc_code=ioc_code, layout=layout
+                            )
+                            shared_memories[parse_future] = shm
+                            futures[parse_future] = ("parse", ioc_code)
+                            continue
+                    if phase == "parse":
+                        get_metrics().inc("observer_ioc_parsed_rows_total", len(result))
+                        chunks[ioc_code].append(result)
+                    remaining[ioc_code] -= 1
+                    if remaining[ioc_code] == 0:
+                        del remaining[ioc_code]
+                        yield ioc_code, concat_station_dfs(ioc_code=ioc_code, dfs=chunks.pop(ioc_code), layout=layout)
+    finally:
+        # If the consumer stops early or something fails, don't wait for the rest of the work
+        thread_pool.shutdown(cancel_futures=True)
+        if process_pool is not None:
+            process_pool.shutdown(cancel_futures=True)
+        for shm in shared_memories.values():
+            _release_shared_memory(shm)
+    logger.info("Finished streaming scraping: %s - %s", start_date, end_date)
+
+
+class FailedChunk(pydantic.BaseModel):
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
+    ioc_code: str
+    url: str
+    phase: T.Literal["fetch", "parse"]
+    exception: BaseException
+    attempts: int = 1
+
+
+class ScrapeResult(pydantic.BaseModel):
+    """
+    The result of `scrape_ioc_with_report()`.
+
+    `dataframes` only contains the stations whose chunks were all scraped successfully.
+    The already parsed chunks of the rest of the stations are kept in `partial_chunks`
+    so that `retry_failed_chunks()` only needs to fetch the chunks listed in `failures`.
+    """
+
+    model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
+
+    dataframes: dict[str, pd.DataFrame] = {}
+    failures: list[FailedChunk] = []
+    partial_chunks: dict[str, list[pd.DataFrame]] = {}
+
+    @property
+    def failed_ioc_codes(self) -> list[str]:
+        return sorted({failure.ioc_code for failure in self.failures})
+
+
+def _to_failed_chunk(result: multifutures.FutureResult, phase: T.Literal["fetch", "parse"]) -> FailedChunk:
+    exception: BaseException = T.cast(Exception, result.exception)
+    attempts = 1
+    # `fetch_url` raises a RetryError if all the attempts failed
+    if isinstance(exception, tenacity.RetryError):
+        attempts = exception.last_attempt.attempt_number
+        exception = exception.last_attempt.exception() or exception
+    return FailedChunk(
+        ioc_code=result.kwargs["ioc_code"],  # type: ignore[index]
+        url=result.kwargs.get("url", ""),  # type: ignore[union-attr]
+        phase=phase,
+        exception=exception,
+        attempts=attempts,
+    )
+
+
+def _scrape_chunks(
+    ioc_codes: list[str],
+    fetch_kwargs: list[dict[str, T.Any]],
+    http_client: httpx.Client,
+    n_threads: int,
+    n_processes: int,
+    parse_executor: ParseExecutor,
+    partial_chunks: dict[str, list[pd.DataFrame]] | None = None,
+    layout: DataLayout = "wide",
+) -> ScrapeResult:
+    fetched = _fetch_urls(func_kwargs=fetch_kwargs, http_client=http_client, n_threads=n_threads)
+    failures = [_to_failed_chunk(result, phase="fetch") for result in fetched if result.exception is not None]
+    parsed = parse_ioc_responses(
+        ioc_responses=[result for result in fetched if result.exception is None],
+        n_processes=n_processes,
+        executor=parse_executor,
+        check=False,
+        layout=layout,
+    )
+    failures.extend(_to_failed_chunk(result, phase="parse") for result in parsed if result.exception is not None)
+    chunks: dict[str, list[pd.DataFrame]] = collections.defaultdict(list)
+    for ioc_code, dfs in (partial_chunks or {}).items():
+        chunks[ioc_code].extend(dfs)
+    for result in parsed:
+        if result.exception is None:
+            chunks[result.kwargs["ioc_code"]].append(result.result)  # type: ignore[index]
+    failed_ioc_codes = {failure.ioc_code for failure in failures}
+    dataframes = {}
+    with get_metrics().phase("group"):
+        for ioc_code in ioc_codes:
+            if ioc_code not in failed_ioc_codes:
+                dataframes[ioc_code] = concat_station_dfs(
+                    ioc_code=ioc_code, dfs=chunks.get(ioc_code, []), layout=layout
+                )
+    if failures:
+        logger.warning("Failed chunks: %d, failed stations: %d", len(failures), len(failed_ioc_codes))
+    scrape_result = ScrapeResult(
+        dataframes=dataframes,
+        failures=failures,
+        partial_chunks={ioc_code: chunks.get(ioc_code, []) for ioc_code in failed_ioc_codes},
+    )
+    return scrape_result
+
+
+def scrape_ioc_with_report(
+    *,
+    ioc_codes: list[str],
+    start_date: StartDate,
+    end_date: pd.Timestamp,
+    chunk_size: ChunkSize = DEFAULT_CHUNK_SIZE,
+    rate_limit: multifutures.RateLimit | None = None,
+    http_client: httpx.Client | None = None,
+    n_threads: int = 5,
+    n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
+) -> ScrapeResult:
+    """
+    Like `scrape_ioc()`, but failed chunks don't abort the whole scraping.
+
+    Instead, they are reported in the returned `ScrapeResult` and can be retried with `retry_failed_chunks()`.
+    The dataframes have `layout` (see `DataLayout`).
+    """
+    logger.info("Starting scraping: %s - %s", start_date, end_date)
+    rate_limit = resolve_rate_limit(rate_limit=rate_limit)
+    http_client = _resolve_http_client(http_client=http_client)
+    fetch_kwargs = _generate_fetch_kwargs(
+        ioc_codes=ioc_codes,
+        start_date=start_date,
+        end_date=end_date,
+        chunk_size=chunk_size,
+        client=http_client,
+        rate_limit=rate_limit,
+        cache=cache,
+    )
+    result = _scrape_chunks(
+        ioc_codes=ioc_codes,
+        fetch_kwargs=fetch_kwargs,
+        http_client=http_client,
+        n_threads=n_threads,
+        n_processes=n_processes,
+        parse_executor=parse_executor,
+        layout=layout,
+    )
+    return result
+
+
+def retry_failed_chunks(
+    result: ScrapeResult,
+    *,
+    rate_limit: multifutures.RateLimit | None = None,
+    http_client: httpx.Client | None = None,
+    n_threads: int = 5,
+    n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
+) -> ScrapeResult:
+    """
+    Retry only the failed chunks of `result` and return a new `ScrapeResult`.
+
+    The stations whose chunks all succeed this time are merged into `dataframes`.
+    `layout` must be the one that `result` has been scraped with.
+    """
+    rate_limit = resolve_rate_limit(rate_limit=rate_limit)
+    http_client = _resolve_http_client(http_client=http_client)
+    logger.info("Retrying failed chunks: %d", len(result.failures))
+    fetch_kwargs = [
+        dict(ioc_code=failure.ioc_code, url=failure.url, client=http_client, rate_limit=rate_limit, cache=cache)
+        for failure in result.failures
+    ]
+    retried = _scrape_chunks(
+        ioc_codes=result.failed_ioc_codes,
+        fetch_kwargs=fetch_kwargs,
+        http_client=http_client,
+        n_threads=n_threads,
+        n_processes=n_processes,
+        parse_executor=parse_executor,
+        partial_chunks=result.partial_chunks,
+        layout=layout,
+    )
+    retried.dataframes = {**result.dataframes, **retried.dataframes}
+    return retried
+
+
 def scrape_ioc_station(
     *,
     ioc_code: str,
     start_date: pd.Timestamp,
     end_date: pd.Timestamp,
+    chunk_size: pd.Timedelta = DEFAULT_CHUNK_SIZE,
     rate_limit: multifutures.RateLimit | None = None,
     http_client: httpx.Client | None = None,
     n_threads: int = 5,
     n_processes: int = multifutures.MAX_AVAILABLE_PROCESSES,
+    use_async: bool = False,
+    n_concurrent: int = 100,
+    parse_executor: ParseExecutor = "auto",
+    cache: ResponseCache | None = None,
+    layout: DataLayout = "wide",
 ) -> pd.DataFrame:
     logger.info("%s: Starting scraping: %s - %s", ioc_code, start_date, end_date)
     df = scrape_ioc(
         ioc_codes=[ioc_code],
         start_date=start_date,
         end_date=end_date,
+        chunk_size=chunk_size,
         rate_limit=rate_limit,
         http_client=http_client,
         n_threads=n_threads,
         n_processes=n_processes,
+        use_async=use_async,
+        n_concurrent=n_concurrent,
+        parse_executor=parse_executor,
+        cache=cache,
+        layout=layout,
     )[ioc_code]
     logger.info("%s: Finished scraping: %s - %s", ioc_code, start_date, end_date)
     return df
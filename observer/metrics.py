@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import threading
+import time
+import typing as T
+
+# Seconds
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "observer_phase_seconds_total": "Wall time spent in each phase of the pipeline",
+    "observer_ioc_requests_total": "Requests to IOC, by HTTP status",
+    "observer_ioc_request_seconds": "Latency of the requests to IOC",
+    "observer_ioc_downloaded_bytes_total": "Bytes downloaded from IOC",
+    "observer_ioc_retries_total": "Requests to IOC that have been retried",
+    "observer_ioc_cache_hits_total": "Responses served by the response cache",
+    "observer_ioc_rate_limit_wait_seconds_total": "Time spent waiting for the rate limit",
+    "observer_ioc_parsed_bytes_total": "Bytes of IOC responses that have been parsed",
+    "observer_ioc_parsed_rows_total": "Rows of the parsed IOC responses",
+    "observer_uploaded_bytes_total": "Bytes written to the storage",
+    "observer_upload_seconds": "Time to write a station to the storage",
+}
+
+Labels: T.TypeAlias = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: T.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # The last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the `q` quantile as the upper bound of the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels: Labels, **extra: str) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms of the hot paths of scraping and storage.
+
+    The instrumented code records into the process-wide registry that is returned by `get_metrics()`.
+    Metrics that are recorded in worker processes (e.g. by the "process" parse executor) are not included.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def get(self, name: str, **labels: str) -> float:
+        """
+        Return the value of a counter, or the sum of a histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key].sum
+            return self._counters.get(key, 0)
+
+    @contextlib.contextmanager
+    def phase(self, phase: str) -> T.Iterator[None]:
+        """
+        Add the wall time of the block to `observer_phase_seconds_total`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc("observer_phase_seconds_total", time.perf_counter() - started, phase=phase)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> T.Iterator[None]:
+        """
+        Observe the wall time of the block in the `name` histogram.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def report(self) -> dict[str, T.Any]:
+        """
+        Return a JSON serializable summary of the metrics, including the derived throughputs.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (hist.count, hist.sum, hist.quantile(0.5), hist.quantile(0.95))
+                for key, hist in self._histograms.items()
+            }
+
+        def total(name: str) -> float:
+            return sum(value for (key, _), value in counters.items() if key == name)
+
+        def rate(numerator: float, seconds: float) -> float:
+            return numerator / seconds if seconds else 0.0
+
+        phases = {
+            dict(labels)["phase"]: value
+            for (name, labels), value in counters.items()
+            if name == "observer_phase_seconds_total"
+        }
+        requests_by_status = {
+            dict(labels)["status"]: int(value)
+            for (name, labels), value in counters.items()
+            if name == "observer_ioc_requests_total"
+        }
+        latency = histograms.get(("observer_ioc_request_seconds", ()), (0, 0.0, 0.0, 0.0))
+        uploads = histograms.get(("observer_upload_seconds", ()), (0, 0.0, 0.0, 0.0))
+        report = {
+            "phase_seconds": phases,
+            "requests": {
+                "total": sum(requests_by_status.values()),
+                "by_status": requests_by_status,
+                "retries": int(total("observer_ioc_retries_total")),
+                "cache_hits": int(total("observer_ioc_cache_hits_total")),
+                "latency_mean_seconds": rate(latency[1], latency[0]),
+                "latency_p50_seconds": latency[2],
+                "latency_p95_seconds": latency[3],
+                "rate_limit_wait_seconds": total("observer_ioc_rate_limit_wait_seconds_total"),
+            },
+            "downloaded_bytes": int(total("observer_ioc_downloaded_bytes_total")),
+            "download_bytes_per_second": rate(
+                total("observer_ioc_downloaded_bytes_total"), phases.get("fetch", 0)
+            ),
+            "parsed_rows": int(total("observer_ioc_parsed_rows_total")),
+            "parse_rows_per_second": rate(total("observer_ioc_parsed_rows_total"), phases.get("parse", 0)),
+            "uploads": uploads[0],
+            "uploaded_bytes": int(total("observer_uploaded_bytes_total")),
+            "upload_bytes_per_second": rate(
+                total("observer_uploaded_bytes_total"), phases.get("upload", 0)
+            ),
+        }
+        return report
+
+    def to_prometheus(self) -> str:
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            if name not in described:
+                lines.extend([f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"])
+                described.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), hist in histograms:
+            if name not in described:
+                lines.extend([f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"])
+                described.add(name)
+            cumulative = 0
+            for bound, count in zip([*hist.buckets, "+Inf"], hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=str(bound))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class CountingFile:
+    """
+    Wrap a writable file object and count the bytes that are written to it.
+    """
+
+    def __init__(self, fd: T.Any, registry: MetricsRegistry, name: str) -> None:
+        self._fd = fd
+        self._registry = registry
+        self._name = name
+
+    def write(self, data: bytes) -> int:
+        self._registry.inc(self._name, len(data))
+        return T.cast(int, self._fd.write(data))
+
+    def __getattr__(self, name: str) -> T.Any:
+        return getattr(self._fd, name)
+
+    def __enter__(self) -> CountingFile:
+        self._fd.__enter__()
+        return self
+
+    def __exit__(self, *args: T.Any) -> None:
+        self._fd.__exit__(*args)
+
+
+_METRICS = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    Return the process-wide `MetricsRegistry`.
+    """
+    return _METRICS
@@ -3,19 +3,43 @@ from __future__ import annotations
 import typing as T
 from functools import lru_cache
 
-from pydantic import Field
+import fsspec.utils
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 from pydantic_settings import SettingsConfigDict
 
+AZURE_PROTOCOLS = ("az", "abfs", "abfss")
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict()  # secrets_dir="./secrets")
 
-    storage_account: str = Field(min_length=1)
-    container_name: str = Field(min_length=1)
+    storage_account: str = ""
+    container_name: str = ""
+    # Any fsspec URL, e.g. "/data/obs", "file:///data/obs" or "memory://obs".
+    # If it is not set, the data are stored in the `container_name` container of Azure Blob Storage.
+    storage_url: str = ""
 
     engine: T.Final = "fastparquet"
 
+    @model_validator(mode="after")
+    def check_storage(self) -> Settings:
+        if not self.storage_url and not self.container_name:
+            raise ValueError("Either STORAGE_URL or CONTAINER_NAME must be set")
+        if self.is_azure and not self.storage_account:
+            raise ValueError("STORAGE_ACCOUNT must be set when the data are stored in Azure")
+        return self
+
+    @property
+    def storage_root(self) -> str:
+        if self.storage_url:
+            return self.storage_url.rstrip("/")
+        return f"az://{self.container_name}"
+
+    @property
+    def is_azure(self) -> bool:
+        return fsspec.utils.get_protocol(self.storage_root) in AZURE_PROTOCOLS
+
 
 @lru_cache
 def get_settings() -> Settings:
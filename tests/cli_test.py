@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+import json
+import unittest.mock
+
+import pandas as pd
 from typer.testing import CliRunner
+
+import observer.cli
 from observer.cli import app
+from observer.ioc.mirror import SyncResult
+from observer.ioc.pipeline import PipelineResult
 
 runner = CliRunner()
 
@@ -11,3 +19,125 @@ runner = CliRunner()
 #     assert result.exit_code == 0
 # assert "Hello Camila" in result.stdout
 # assert "Let's have a coffee in Berlin" in result.stdout
+
+
+def test_sync(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "observer.cli.sync_ioc_archive", unittest.mock.Mock(return_value=SyncResult(unchanged=2))
+    )
+    result = runner.invoke(app, ["sync", str(tmp_path), "-s", "acnj", "-s", "blri", "--no-delete"])
+    assert result.exit_code == 0
+    assert "unchanged: 2" in result.stdout
+    observer.cli.sync_ioc_archive.assert_called_once_with(
+        tmp_path,
+        ioc_codes=["acnj", "blri"],
+        delete=False,
+        n_threads=10,
+    )
+
+
+def test_sync_fails(monkeypatch, tmp_path):
+    failed = SyncResult(failures={"stations/acnj.parquet/_metadata": ValueError("Checksum mismatch")})
+    monkeypatch.setattr("observer.cli.sync_ioc_archive", unittest.mock.Mock(return_value=failed))
+    result = runner.invoke(app, ["sync", str(tmp_path)])
+    assert result.exit_code == 1
+
+
+def _mock_pipeline(monkeypatch, result: PipelineResult) -> unittest.mock.Mock:
+    monkeypatch.setattr("observer.cli.ObsSession", unittest.mock.MagicMock())
+    monkeypatch.setattr("observer.cli.run_ioc_pipeline", unittest.mock.Mock(return_value=result))
+    return observer.cli.run_ioc_pipeline
+
+
+def test_scrape(monkeypatch, tmp_path):
+    mocked = _mock_pipeline(monkeypatch, PipelineResult(stations=2, requests=10, rows=100, elapsed=2.0))
+    stations_file = tmp_path / "stations.txt"
+    stations_file.write_text("# comment\nblri\n\nacnj\n")
+    args = [
+        "scrape",
+        "--start",
+        "2023-01-01",
+        "--end",
+        "2023-02-01",
+        "-s",
+        "acnj",
+        "--stations-file",
+        stations_file,
+    ]
+    result = runner.invoke(
+        app,
+        [*map(str, args), "--threads", "3", "--rate-limit", "2/second", "--batch-size", "7", "--layout", "long"],
+    )
+    assert result.exit_code == 0
+    assert "Throughput: 5.00 requests/s, 50 rows/s" in result.stdout
+    kwargs = mocked.call_args.kwargs
+    assert mocked.call_args.args == (["acnj", "blri"],)
+    assert kwargs["mode"] == "scrape"
+    assert kwargs["start_date"] == pd.Timestamp("2023-01-01")
+    assert kwargs["end_date"] == pd.Timestamp("2023-02-01")
+    assert kwargs["chunk_size"] == pd.Timedelta(days=30)
+    assert kwargs["n_threads"] == 3
+    assert kwargs["batch_size"] == 7
+    assert kwargs["layout"] == "long"
+
+
+def test_scrape_auto_chunk_size(monkeypatch):
+    mocked = _mock_pipeline(monkeypatch, PipelineResult())
+    metadata = pd.DataFrame({"ioc_code": ["acnj", "blri"], "sample_interval": ["1'", "1'"]})
+    catalog = pd.DataFrame({"sensors": [["wls"]]}, index=pd.Index(["acnj"], name="ioc_code"))
+    monkeypatch.setattr("observer.cli.get_ioc_metadata", lambda: metadata)
+    monkeypatch.setattr("observer.cli.get_ioc_catalog", lambda: catalog)
+    result = runner.invoke(app, ["scrape", "--start", "2023-01-01", "-s", "acnj", "-s", "blri", "--auto-chunk-size"])
+    assert result.exit_code == 0
+    chunk_size = mocked.call_args.kwargs["chunk_size"]
+    # The sensors of the cataloged stations are known, the rest are assumed to have 3
+    assert chunk_size["acnj"] == pd.Timedelta(days=50_000 / 1440).floor("min")
+    assert chunk_size["blri"] == pd.Timedelta(days=50_000 / 4320).floor("min")
+
+
+def test_scrape_metrics(monkeypatch, tmp_path):
+    _mock_pipeline(monkeypatch, PipelineResult(stations=1, requests=2, rows=10, elapsed=1.0))
+    args = ["scrape", "--start", "2023-01-01", "-s", "acnj"]
+    metrics, prometheus = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    result = runner.invoke(app, [*args, "--metrics", str(metrics), "--prometheus", str(prometheus)])
+    assert result.exit_code == 0
+    report = json.loads(metrics.read_text())
+    assert report["pipeline"]["mode"] == "scrape"
+    assert report["pipeline"]["rows"] == 10
+    assert "parse_rows_per_second" in report
+    assert prometheus.exists()
+
+
+def test_update_where(monkeypatch):
+    mocked = _mock_pipeline(monkeypatch, PipelineResult())
+    metadata = pd.DataFrame({"ioc_code": ["acnj", "blri", "dzaou"], "country": ["USA", "USA", "France"]})
+    monkeypatch.setattr("observer.cli.get_ioc_metadata", lambda: metadata)
+    result = runner.invoke(app, ["update", "--where", "country == 'USA'"])
+    assert result.exit_code == 0
+    assert mocked.call_args.args == (["acnj", "blri"],)
+    assert mocked.call_args.kwargs["mode"] == "update"
+
+
+def test_backfill(monkeypatch):
+    _mock_pipeline(monkeypatch, PipelineResult())
+    failed = PipelineResult(stations=1, failures={"acnj": ValueError("boom")})
+    monkeypatch.setattr("observer.cli.run_ioc_backfill", unittest.mock.Mock(return_value=failed))
+    args = ["backfill", "--start", "2023-01-01", "--end", "2023-02-01", "-s", "acnj", "-s", "blri"]
+    result = runner.invoke(app, [*args, "--shard", "2/3", "--run-name", "full"])
+    assert result.exit_code == 1
+    assert not observer.cli.run_ioc_pipeline.called
+    kwargs = observer.cli.run_ioc_backfill.call_args.kwargs
+    assert (kwargs["shard"], kwargs["n_shards"], kwargs["name"]) == (2, 3, "full")
+    assert runner.invoke(app, [*args, "--shard", "4/3"]).exit_code == 2
+    assert runner.invoke(app, [*args, "--shard", "x"]).exit_code == 2
+
+
+def test_scrape_requires_stations(monkeypatch):
+    mocked = _mock_pipeline(monkeypatch, PipelineResult())
+    assert runner.invoke(app, ["scrape", "--start", "2023-01-01"]).exit_code == 2
+    assert (
+        runner.invoke(app, ["scrape", "--start", "2023-01-01", "-s", "acnj", "--rate-limit", "x"]).exit_code
+        == 2
+    )
+    assert runner.invoke(app, ["scrape", "--start", "2023-01-01", "-s", "acnj", "--layout", "x"]).exit_code == 2
+    assert not mocked.called
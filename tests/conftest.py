@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import fsspec
+import pytest
+
+import observer.ioc.fs as iocfs
+from observer.settings import get_settings
+
+
+@pytest.fixture
+def memory_fs(monkeypatch):
+    monkeypatch.setenv("STORAGE_URL", "memory://obs")
+    get_settings.cache_clear()
+    fs = fsspec.filesystem("memory")
+    yield fs
+    get_settings.cache_clear()
+    iocfs._FILE_CACHE.clear()
+    if fs.exists("/obs"):
+        fs.rm("/obs", recursive=True)
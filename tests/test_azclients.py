@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import concurrent.futures
+import unittest.mock
+
+import pytest
+
+from observer import azclients
+from observer.settings import get_settings
+
+
+@pytest.fixture
+def mocked_clients(monkeypatch):
+    monkeypatch.setenv("STORAGE_ACCOUNT", "account")
+    monkeypatch.setenv("CONTAINER_NAME", "obs")
+    get_settings.cache_clear()
+    with (
+        unittest.mock.patch("observer.azclients.adlfs.AzureBlobFileSystem") as fs_class,
+        unittest.mock.patch("observer.azclients.BlobServiceClient") as client_class,
+        unittest.mock.patch("observer.azclients.get_credential_aio") as get_credential_aio,
+        unittest.mock.patch("observer.azclients.get_credential"),
+        unittest.mock.patch("observer.azclients.fsspec.asyn.sync") as sync,
+    ):
+        fs_class.side_effect = lambda **kwargs: unittest.mock.Mock(name="fs")
+        client_class.side_effect = lambda **kwargs: unittest.mock.Mock(name="client")
+        get_credential_aio.side_effect = lambda: unittest.mock.Mock(name="credential")
+        yield sync
+    get_settings.cache_clear()
+
+
+def test_obs_session_reuses_clients(mocked_clients):
+    with azclients.ObsSession(storage_account="account") as session:
+        assert azclients.get_active_session() is session
+        assert azclients.get_obs_fs() is azclients.get_obs_fs() is session.fs
+        assert azclients.get_blob_client() is azclients.get_blob_client() is session.blob_client
+        assert azclients.get_storage_options()["credential"] is session.credential
+        assert azclients.get_obs_client(container_name="obs") is not None
+    assert azclients.get_active_session() is None
+
+
+def test_obs_session_explicit_credential_bypasses_session(mocked_clients):
+    credential = unittest.mock.Mock()
+    with azclients.ObsSession(storage_account="account") as session:
+        assert azclients.get_storage_options(credential=credential)["credential"] is credential
+        assert azclients.get_storage_options()["credential"] is not credential
+        assert session.credential is not credential
+
+
+def test_obs_session_close(mocked_clients):
+    sync = mocked_clients
+    with azclients.ObsSession(storage_account="account") as session:
+        fs = session.fs
+        client = session.blob_client
+        credential = session.credential
+    client.close.assert_called_once()
+    sync.assert_any_call(fs.loop, fs.service_client.close)
+    sync.assert_any_call(fs.loop, credential.close)
+
+
+def test_obs_session_does_not_close_external_credential(mocked_clients):
+    sync = mocked_clients
+    credential = unittest.mock.Mock()
+    with azclients.ObsSession(credential=credential, storage_account="account") as session:
+        fs = session.fs
+    sync.assert_called_once_with(fs.loop, fs.service_client.close)
+
+
+def test_obs_session_nesting(mocked_clients):
+    with azclients.ObsSession(storage_account="outer") as outer:
+        with azclients.ObsSession(storage_account="inner") as inner:
+            assert azclients.get_active_session() is inner
+        assert azclients.get_active_session() is outer
+    assert azclients.get_active_session() is None
+
+
+def test_obs_session_is_not_shared_between_threads(mocked_clients):
+    with azclients.ObsSession(storage_account="account"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(azclients.get_active_session).result() is None
+
+
+def test_obs_session_blob_client_shares_the_credential(mocked_clients):
+    sync = mocked_clients
+    with (
+        azclients.ObsSession(storage_account="account") as session,
+        unittest.mock.patch("observer.azclients._create_blob_client") as create_blob_client,
+    ):
+        session.blob_client
+        credential = create_blob_client.call_args.kwargs["credential"]
+        credential.get_token("scope")
+        sync.assert_called_once_with(unittest.mock.ANY, session.credential.get_token, "scope")
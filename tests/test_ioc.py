@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import unittest.mock
+from observer.ioc.incremental import get_ioc_start_dates
+from observer.ioc.incremental import scrape_ioc_incremental
 from observer.ioc.scraper import scrape_ioc
 from observer.ioc.scraper import scrape_ioc_station
 import  observer.ioc.scraper as scraper
@@ -10,6 +14,7 @@ import limits
 import multifutures
 import pandas as pd
 import pytest
+import tenacity
 
 
 def test_generate_urls():
@@ -42,7 +47,7 @@ def test_generate_urls_raises_when_end_date_before_start_date():
 
 def test_resolve_rate_limit_returns_object_as_is():
     rate_limit = multifutures.RateLimit()
-    resolved = scraper._resolve_rate_limit(rate_limit=rate_limit)
+    resolved = scraper.resolve_rate_limit(rate_limit=rate_limit)
     assert resolved is rate_limit
 
 
@@ -152,3 +157,447 @@ def test_scrape_ioc_station_normal_call(mocked_fetch_url):
     assert df.wls.max() == 0.906
     assert df.wls.min() == 0.896
     assert df.wls.median() == 0.905
+
+
+def test_async_rate_limit_spaces_out_acquisitions():
+    rate_limit = scraper.AsyncRateLimit(rate=20)
+
+    async def acquire_many():
+        for _ in range(5):
+            await rate_limit.acquire()
+
+    start = time.monotonic()
+    asyncio.run(acquire_many())
+    # The first token is available immediately, the rest need 1/20 of a second each
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.mark.parametrize("rate,burst", [(0, 1), (-1, 1), (5, 0)])
+def test_async_rate_limit_raises_on_invalid_arguments(rate, burst):
+    with pytest.raises(ValueError):
+        scraper.AsyncRateLimit(rate=rate, burst=burst)
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url_async")
+def test_scrape_ioc_async_normal_call(mocked_fetch_url_async):
+    ioc_code="acnj"
+    start_date = pd.Timestamp("2022-03-12T11:04:00")
+    end_date = pd.Timestamp("2022-03-12T11:06:00")
+    mocked_fetch_url_async.side_effect = [
+        """ [\
+        {"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":0.906,"stime":"2022-03-12 11:05:00","sensor":"wls"},
+        {"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"}
+        ]""",
+    ]
+    data = scrape_ioc(
+        ioc_codes=[ioc_code],
+        start_date=start_date,
+        end_date=end_date,
+        use_async=True,
+    )
+    assert len(data) == 1
+    assert ioc_code in data
+    assert len(data[ioc_code]) == 3
+    assert mocked_fetch_url_async.await_count == 1
+
+
+def test_scrape_ioc_async_raises_with_sync_http_client():
+    with pytest.raises(ValueError) as exc:
+        scrape_ioc(
+            ioc_codes=["acnj"],
+            start_date=pd.Timestamp("2022-03-12"),
+            end_date=pd.Timestamp("2022-03-13"),
+            http_client=httpx.Client(),
+            use_async=True,
+        )
+    assert "scrape_ioc_async" in str(exc.value)
+
+
+def test_scrape_ioc_async_raises_in_running_event_loop():
+    async def scrape():
+        return scrape_ioc(
+            ioc_codes=["acnj"],
+            start_date=pd.Timestamp("2022-03-12"),
+            end_date=pd.Timestamp("2022-03-13"),
+            use_async=True,
+        )
+
+    with pytest.raises(RuntimeError, match="scrape_ioc_async"):
+        asyncio.run(scrape())
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_iter_yields_each_station(mocked_fetch_url):
+    start_date = pd.Timestamp("2022-03-12T11:04:00")
+    end_date = pd.Timestamp("2022-03-12T11:06:00")
+    responses = {
+        "acnj": """ [\
+        {"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":0.906,"stime":"2022-03-12 11:05:00","sensor":"wls"},
+        {"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"}
+        ]""",
+        "blri": """[{"error":"code 'blri' not found"}]""",
+    }
+    mocked_fetch_url.side_effect = lambda url, ioc_code, **kwargs: responses[ioc_code]
+    data = dict(
+        scraper.scrape_ioc_iter(
+            ioc_codes=["acnj", "blri"],
+            start_date=start_date,
+            end_date=end_date,
+            n_stations=1,
+        )
+    )
+    assert sorted(data) == ["acnj", "blri"]
+    assert len(data["acnj"]) == 3
+    assert data["blri"].empty
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_with_start_date_per_station(mocked_fetch_url):
+    end_date = pd.Timestamp("2022-03-12T11:06:00")
+    mocked_fetch_url.side_effect = [
+        """[{"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"}]""",
+    ]
+    data = scrape_ioc(
+        ioc_codes=["acnj", "blri"],
+        start_date={"acnj": pd.Timestamp("2022-03-12T11:04:00"), "blri": end_date},
+        end_date=end_date,
+    )
+    # blri is up to date, so only acnj should have been fetched
+    assert mocked_fetch_url.call_count == 1
+    assert mocked_fetch_url.call_args.kwargs["ioc_code"] == "acnj"
+    assert len(data["acnj"]) == 1
+    assert data["blri"].empty
+
+
+@unittest.mock.patch("observer.ioc.incremental.get_ioc_last_timestamps")
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_incremental(mocked_fetch_url, mocked_get_ioc_last_timestamps):
+    mocked_get_ioc_last_timestamps.return_value = {"acnj": pd.Timestamp("2022-03-12T11:05:00")}
+    mocked_fetch_url.side_effect = [
+        """ [\
+        {"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":0.906,"stime":"2022-03-12 11:05:00","sensor":"wls"},
+        {"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"}
+        ]""",
+    ]
+    data = scrape_ioc_incremental(
+        ioc_codes=["acnj"],
+        default_start_date=pd.Timestamp("2022-01-01"),
+        end_date=pd.Timestamp("2022-03-12T11:06:00"),
+        overlap=pd.Timedelta(minutes=1),
+    )
+    url = mocked_fetch_url.call_args.kwargs["url"]
+    assert "timestart=2022-03-12T11:04:00" in url
+    # Only the timestamps after the last stored one should be returned
+    assert data["acnj"].index.tolist() == [pd.Timestamp("2022-03-12T11:06:00")]
+
+
+@unittest.mock.patch("observer.ioc.incremental.get_ioc_last_timestamps")
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_incremental_long_layout(mocked_fetch_url, mocked_get_ioc_last_timestamps):
+    mocked_get_ioc_last_timestamps.return_value = {"acnj": pd.Timestamp("2022-03-12T11:05:00")}
+    mocked_fetch_url.side_effect = [
+        """ [\
+        {"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":1.203,"stime":"2022-03-12 11:05:00","sensor":"rad"},
+        {"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"}
+        ]""",
+    ]
+    data = scrape_ioc_incremental(
+        ioc_codes=["acnj"],
+        default_start_date=pd.Timestamp("2022-01-01"),
+        end_date=pd.Timestamp("2022-03-12T11:06:00"),
+        overlap=pd.Timedelta(minutes=1),
+        layout="long",
+    )
+    assert data["acnj"].time.tolist() == [pd.Timestamp("2022-03-12T11:06:00")]
+    assert data["acnj"].sensor.tolist() == ["wls"]
+
+
+def test_get_ioc_start_dates():
+    start_dates = get_ioc_start_dates(
+        ioc_codes=["acnj", "blri"],
+        default_start_date=pd.Timestamp("2020-01-01"),
+        overlap=pd.Timedelta(hours=1),
+        last_timestamps={"acnj": pd.Timestamp("2023-01-01T12:00"), "blri": None},
+    )
+    assert start_dates == {"acnj": pd.Timestamp("2023-01-01T11:00"), "blri": pd.Timestamp("2020-01-01")}
+
+
+@pytest.mark.parametrize("executor", ["auto", "inline", "thread", "process"])
+def test_parse_ioc_responses_executors(executor):
+    content = """[\
+        {"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":0.906,"stime":"2022-03-12 11:05:00","sensor":"wls"}
+    ]"""
+    ioc_responses = [
+        multifutures.FutureResult(result=content, kwargs=dict(ioc_code="acnj")),
+        multifutures.FutureResult(result="[]", kwargs=dict(ioc_code="acnj")),
+        multifutures.FutureResult(result=content.replace("11:0", "12:0"), kwargs=dict(ioc_code="acnj")),
+    ]
+    results = scraper.parse_ioc_responses(ioc_responses=ioc_responses, n_processes=1, executor=executor)
+    assert len(results) == 2
+    assert all(isinstance(result.result, pd.DataFrame) for result in results)
+    assert sorted(len(result.result) for result in results) == [2, 2]
+    assert all(result.kwargs["ioc_code"] == "acnj" for result in results)
+
+
+def test_parse_ioc_responses_raises_on_unknown_executor():
+    ioc_responses = [multifutures.FutureResult(result='[{"slevel":1,"stime":"2022-03-12 11:04:00","sensor":"wls"}]', kwargs=dict(ioc_code="acnj"))]
+    with pytest.raises(ValueError):
+        scraper.parse_ioc_responses(ioc_responses=ioc_responses, n_processes=1, executor="gpu")
+
+
+@pytest.mark.parametrize("parse_executor", ["inline", "thread", "process"])
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_iter_parse_executors(mocked_fetch_url, parse_executor):
+    mocked_fetch_url.side_effect = [
+        """[{"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"}]""",
+    ]
+    data = dict(
+        scraper.scrape_ioc_iter(
+            ioc_codes=["acnj"],
+            start_date=pd.Timestamp("2022-03-12T11:04:00"),
+            end_date=pd.Timestamp("2022-03-12T11:06:00"),
+            n_processes=1,
+            parse_executor=parse_executor,
+        )
+    )
+    assert len(data["acnj"]) == 1
+    assert data["acnj"].wls.iloc[0] == 0.905
+
+
+def test_scrape_ioc_iter_raises_on_unknown_executor():
+    with pytest.raises(ValueError, match="Unknown parse executor"):
+        list(
+            scraper.scrape_ioc_iter(
+                ioc_codes=["acnj"],
+                start_date=pd.Timestamp("2022-03-12"),
+                end_date=pd.Timestamp("2022-03-13"),
+                parse_executor="gpu",
+            )
+        )
+
+
+@pytest.mark.parametrize("parse_executor", ["inline", "thread", "process"])
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_iter_long_layout(mocked_fetch_url, parse_executor):
+    mocked_fetch_url.side_effect = [
+        """[{"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+        {"slevel":null,"stime":"2022-03-12 11:04:00","sensor":"rad"}]""",
+    ]
+    data = dict(
+        scraper.scrape_ioc_iter(
+            ioc_codes=["acnj", "blri"],
+            start_date={"acnj": pd.Timestamp("2022-03-12T11:04:00"), "blri": pd.Timestamp("2022-03-13")},
+            end_date=pd.Timestamp("2022-03-12T11:06:00"),
+            n_processes=1,
+            parse_executor=parse_executor,
+            layout="long",
+        )
+    )
+    assert data["acnj"].sensor.tolist() == ["wls"]
+    assert data["acnj"].value.tolist() == [0.905]
+    # Stations without data are empty long dataframes
+    assert list(data["blri"].columns) == ["time", "sensor", "value"]
+    assert data["blri"].empty
+
+
+def test_generate_urls_chunk_size():
+    urls = scraper.generate_urls(
+        ioc_code="acnj",
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-01-11"),
+        chunk_size=pd.Timedelta(days=1),
+    )
+    assert len(urls) == 11
+    assert "timestart=2023-01-01T00:00:00&timestop=2023-01-01T21:49:05" in urls[0]
+
+
+def test_generate_urls_raises_on_non_positive_chunk_size():
+    with pytest.raises(ValueError):
+        scraper.generate_urls(
+            ioc_code="acnj",
+            start_date=pd.Timestamp("2023-01-01"),
+            end_date=pd.Timestamp("2023-01-11"),
+            chunk_size=pd.Timedelta(0),
+        )
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("1'", pd.Timedelta(minutes=1)),
+        ("15'", pd.Timedelta(minutes=15)),
+        ("30''", pd.Timedelta(seconds=30)),
+        ('30"', pd.Timedelta(seconds=30)),
+        (2, pd.Timedelta(minutes=2)),
+        ("5min", pd.Timedelta(minutes=5)),
+        ("", None),
+        ("n/a", None),
+        (0, None),
+        (None, None),
+    ],
+)
+def test_parse_sample_interval(value, expected):
+    assert scraper.parse_sample_interval(value) == expected
+
+
+def test_get_chunk_sizes():
+    metadata = pd.DataFrame(
+        {
+            "ioc_code": ["fast", "slow", "unknown"],
+            "sample_interval": ["1'", "15'", None],
+        }
+    )
+    chunk_sizes = scraper.get_chunk_sizes(metadata, n_sensors={"fast": 3, "slow": 1}, target_records=43_200)
+    # 3 sensors * 1440 records per day
+    assert chunk_sizes["fast"] == pd.Timedelta(days=10)
+    # 96 records per day would give 450 days
+    assert chunk_sizes["slow"] == scraper.MAX_CHUNK_SIZE
+    assert "unknown" not in chunk_sizes
+
+
+def test_get_chunk_sizes_without_n_sensors():
+    metadata = pd.DataFrame({"ioc_code": ["fast"], "sample_interval": ["1'"]})
+    chunk_sizes = scraper.get_chunk_sizes(metadata)
+    # 3 sensors * 1440 records per day; a single sensor would give ~35 days
+    assert chunk_sizes["fast"] == pd.Timedelta(days=50_000 / 4320).floor("min")
+    assert chunk_sizes["fast"] < scraper.DEFAULT_CHUNK_SIZE
+
+
+def test_learn_chunk_sizes():
+    index = pd.date_range("2023-01-01", "2023-01-11", freq="min", name="time")
+    df = pd.DataFrame({"wls": 1.0, "rad": 1.0}, index=index)
+    chunk_sizes = scraper.learn_chunk_sizes({"acnj": df, "empty": df.iloc[:0]}, target_records=28_800)
+    assert list(chunk_sizes) == ["acnj"]
+    # 2 sensors * 1440 records per day
+    assert abs(chunk_sizes["acnj"] - pd.Timedelta(days=10)) < pd.Timedelta(minutes=5)
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_with_chunk_size_per_station(mocked_fetch_url):
+    mocked_fetch_url.return_value = "[]"
+    scrape_ioc(
+        ioc_codes=["acnj", "blri"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-01-11"),
+        chunk_size={"acnj": pd.Timedelta(days=1)},
+    )
+    urls = [call.kwargs["url"] for call in mocked_fetch_url.call_args_list]
+    assert sum("code=acnj" in url for url in urls) == 11
+    assert sum("code=blri" in url for url in urls) == 1
+
+
+def _fetch_with_failures(failing: set[str]):
+    def fetch(url, ioc_code, **kwargs):
+        if any(f"timestart={timestart}" in url and f"code={ioc_code}" in url for timestart in failing):
+            raise httpx.ReadTimeout("timeout")
+        timestart = url.split("timestart=")[1][:19].replace("T", " ")
+        return f'[{{"slevel":0.905,"stime":"{timestart}","sensor":"wls"}}]'
+
+    return fetch
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_with_report_and_retry(mocked_fetch_url):
+    start_date = pd.Timestamp("2023-01-01")
+    end_date = pd.Timestamp("2023-02-15")
+    mocked_fetch_url.side_effect = _fetch_with_failures({"2023-01-01T00:00:00"})
+    result = scraper.scrape_ioc_with_report(
+        ioc_codes=["acnj", "blri"],
+        start_date={"acnj": start_date, "blri": pd.Timestamp("2023-02-01")},
+        end_date=end_date,
+    )
+    assert list(result.dataframes) == ["blri"]
+    assert result.failed_ioc_codes == ["acnj"]
+    assert len(result.failures) == 1
+    failure = result.failures[0]
+    assert failure.phase == "fetch"
+    assert failure.attempts == 1
+    assert isinstance(failure.exception, httpx.ReadTimeout)
+    assert "code=acnj" in failure.url
+    assert len(result.partial_chunks["acnj"]) == 1
+
+    mocked_fetch_url.reset_mock()
+    mocked_fetch_url.side_effect = _fetch_with_failures(set())
+    retried = scraper.retry_failed_chunks(result)
+    # Only the failed chunk should have been fetched again
+    assert mocked_fetch_url.call_count == 1
+    assert not retried.failures
+    assert sorted(retried.dataframes) == ["acnj", "blri"]
+    assert len(retried.dataframes["acnj"]) == 2
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_scrape_ioc_with_report_parse_failure(mocked_fetch_url):
+    mocked_fetch_url.return_value = '[{"slevel":0.905,"stime":"garbage","sensor":"wls"}]'
+    result = scraper.scrape_ioc_with_report(
+        ioc_codes=["acnj"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-01-02"),
+    )
+    assert not result.dataframes
+    assert [failure.phase for failure in result.failures] == ["parse"]
+    assert "code=acnj" in result.failures[0].url
+
+
+def test_failed_chunk_unwraps_retry_error():
+    last_attempt = tenacity.Future(attempt_number=7)
+    last_attempt.set_exception(httpx.ConnectError("boom"))
+    result = multifutures.FutureResult(
+        exception=tenacity.RetryError(last_attempt),
+        kwargs=dict(ioc_code="acnj", url="https://example.com"),
+    )
+    failure = scraper._to_failed_chunk(result, phase="fetch")
+    assert failure.attempts == 7
+    assert isinstance(failure.exception, httpx.ConnectError)
+
+
+def _chunk(start: str, end: str, sensors: list[str], freq: str = "1h") -> pd.DataFrame:
+    index = pd.date_range(start, end, freq=freq, name="time")
+    # The values only depend on the timestamp, so the overlapping boundaries are identical
+    values = {sensor: index.asi8 / 1e9 + position for position, sensor in enumerate(sensors)}
+    df = pd.DataFrame(values, index=index)
+    df.columns.name = ""
+    return df
+
+
+def test_merge_sorted_chunks_matches_concat():
+    dfs = [
+        _chunk("2023-01-11", "2023-01-21", ["rad", "wls"]),
+        _chunk("2023-01-01", "2023-01-11", ["rad"]),
+        # An empty response
+        scraper.parse_ioc_json("[]", ioc_code="acnj"),
+        _chunk("2023-01-21 01:00", "2023-01-31", ["prs", "rad"]),
+    ]
+    merged = scraper.merge_sorted_chunks(dfs)
+    assert merged is not None
+    # The boundary rows are combined
+    expected = pd.concat(dfs).groupby(level="time").first()
+    pd.testing.assert_frame_equal(merged, expected)
+    pd.testing.assert_frame_equal(scraper.concat_station_dfs("acnj", dfs), expected)
+
+
+def test_merge_sorted_chunks_falls_back_when_chunks_overlap():
+    dfs = [_chunk("2023-01-01", "2023-01-11", ["rad"]), _chunk("2023-01-10", "2023-01-21", ["rad"])]
+    assert scraper.merge_sorted_chunks(dfs) is None
+    assert scraper.merge_sorted_chunks([]) is None
+    df = scraper.concat_station_dfs("acnj", dfs)
+    assert df.index.is_unique
+    assert df.index.is_monotonic_increasing
+    assert len(df) == 20 * 24 + 1
+
+
+def test_concat_station_dfs_combines_duplicates_like_merge_sorted_chunks():
+    dfs = [
+        _chunk("2023-01-11", "2023-01-21", ["rad", "wls"]),
+        _chunk("2023-01-01", "2023-01-11", ["prs"]),
+    ]
+    merged = scraper.concat_station_dfs("acnj", dfs)
+    concatenated = scraper.concat_station_dfs("acnj", [df.astype("float32") for df in dfs])
+    # The boundary row has the values of both chunks
+    assert merged.loc[pd.Timestamp("2023-01-11")].notna().all()
+    pd.testing.assert_frame_equal(merged.astype("float32"), concatenated, check_freq=False)
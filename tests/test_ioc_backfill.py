@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import unittest.mock
+
+import pandas as pd
+import pytest
+
+import observer.ioc.fs as iocfs
+from observer.ioc.backfill import _get_manifest_uri
+from observer.ioc.backfill import _read_manifest
+from observer.ioc.backfill import _update_catalog_if_finished
+from observer.ioc.backfill import _write_manifest
+from observer.ioc.backfill import BackfillManifest
+from observer.ioc.backfill import plan_ioc_shards
+from observer.ioc.backfill import run_ioc_backfill
+
+START_DATE = pd.Timestamp("2023-01-01")
+END_DATE = pd.Timestamp("2023-03-01")
+
+
+def _fetch(url, ioc_code, **kwargs):
+    timestart = url.split("timestart=")[1][:19].replace("T", " ")
+    return f'[{{"slevel":0.905,"stime":"{timestart}","sensor":"wls"}}]'
+
+
+def test_plan_ioc_shards():
+    chunk_sizes = {"acnj": pd.Timedelta(days=1), "blri": pd.Timedelta(days=10)}
+    kwargs = dict(start_date=START_DATE, end_date=END_DATE, n_shards=3, chunk_size=chunk_sizes)
+    ioc_codes = ["acnj", "blri", "dzaou", "abed", "ptmi"]
+    shards = plan_ioc_shards(ioc_codes, **kwargs)
+    assert shards == plan_ioc_shards(ioc_codes[::-1], **kwargs)
+    assert sorted(sum(shards, [])) == sorted(ioc_codes)
+    # "acnj" needs more requests than all the other stations together
+    assert shards[0] == ["acnj"]
+    # "blri" needs 7 requests, the rest 3 each
+    assert shards[1:] == [["blri"], ["abed", "dzaou", "ptmi"]]
+
+
+def test_plan_ioc_shards_raises_on_invalid_n_shards():
+    with pytest.raises(ValueError, match="n_shards"):
+        plan_ioc_shards(["acnj"], start_date=START_DATE, end_date=END_DATE, n_shards=0)
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_backfill_shards(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = _fetch
+    ioc_codes = ["acnj", "blri", "dzaou"]
+    kwargs = dict(start_date=START_DATE, end_date=END_DATE, n_shards=2, name="test")
+    first = run_ioc_backfill(ioc_codes, shard=1, **kwargs)
+    assert first.uploaded == ["acnj", "dzaou"]
+    manifest = _read_manifest(memory_fs, _get_manifest_uri("test", 1, 2))
+    assert manifest.completed == ["acnj", "dzaou"]
+    assert manifest.is_complete
+    # The catalog is only updated once all the shards are complete
+    assert iocfs.get_ioc_catalog(refresh=True).empty
+
+    second = run_ioc_backfill(ioc_codes, shard=2, **kwargs)
+    assert second.uploaded == ["blri"]
+    assert iocfs.get_ioc_catalog(refresh=True).index.tolist() == ioc_codes
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_backfill_resumes(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = (
+        lambda url, ioc_code, **kwargs: _fetch(url, ioc_code) if ioc_code != "blri" else 1 / 0
+    )
+    kwargs = dict(start_date=START_DATE, end_date=END_DATE, batch_size=1)
+    result = run_ioc_backfill(["acnj", "blri"], **kwargs)
+    assert list(result.failures) == ["blri"]
+    manifest = _read_manifest(memory_fs, _get_manifest_uri("20230101T0000-20230301T0000", 1, 1))
+    assert manifest.completed == ["acnj"]
+    assert "ZeroDivisionError" in manifest.failed["blri"]
+
+    mocked_fetch_url.reset_mock()
+    mocked_fetch_url.side_effect = _fetch
+    progress = unittest.mock.Mock()
+    result = run_ioc_backfill(["acnj", "blri"], progress=progress, **kwargs)
+    # Only the failed station is scraped again
+    assert result.uploaded == ["blri"]
+    assert all("code=blri" in call.kwargs["url"] for call in mocked_fetch_url.call_args_list)
+    assert [call.args for call in progress.call_args_list] == [(1,), (1,)]
+    manifest = _read_manifest(memory_fs, _get_manifest_uri("20230101T0000-20230301T0000", 1, 1))
+    assert manifest.completed == ["acnj", "blri"]
+    assert manifest.failed == {}
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_backfill_shards_with_failed_station(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = (
+        lambda url, ioc_code, **kwargs: _fetch(url, ioc_code) if ioc_code != "blri" else 1 / 0
+    )
+    ioc_codes = ["acnj", "blri", "dzaou"]
+    kwargs = dict(start_date=START_DATE, end_date=END_DATE, n_shards=2, name="test")
+    run_ioc_backfill(ioc_codes, shard=1, **kwargs)
+    second = run_ioc_backfill(ioc_codes, shard=2, **kwargs)
+    assert list(second.failures) == ["blri"]
+    # A failed station doesn't keep the completed ones out of the catalog
+    assert iocfs.get_ioc_catalog(refresh=True).index.tolist() == ["acnj", "dzaou"]
+
+    mocked_fetch_url.side_effect = _fetch
+    run_ioc_backfill(ioc_codes, shard=2, **kwargs)
+    assert iocfs.get_ioc_catalog(refresh=True).index.tolist() == ioc_codes
+
+
+@unittest.mock.patch("observer.ioc.backfill.update_ioc_catalog")
+def test_update_catalog_if_finished_only_once(mocked_update_ioc_catalog, memory_fs):
+    for shard, ioc_codes in enumerate([["acnj"], ["blri"]], start=1):
+        manifest = BackfillManifest(
+            shard=shard,
+            n_shards=2,
+            start_date=str(START_DATE),
+            end_date=str(END_DATE),
+            ioc_codes=ioc_codes,
+            completed=ioc_codes,
+        )
+        _write_manifest(memory_fs, _get_manifest_uri("test", shard, 2), manifest)
+    # E.g. both shards finish at the same time and find all the shards finished
+    mocked_update_ioc_catalog.side_effect = RuntimeError
+    with pytest.raises(RuntimeError):
+        _update_catalog_if_finished(memory_fs, name="test", n_shards=2)
+    # A failed update doesn't prevent the next one
+    mocked_update_ioc_catalog.side_effect = None
+    _update_catalog_if_finished(memory_fs, name="test", n_shards=2)
+    _update_catalog_if_finished(memory_fs, name="test", n_shards=2)
+    assert mocked_update_ioc_catalog.call_count == 2
+    mocked_update_ioc_catalog.assert_called_with(["acnj", "blri"], fs=memory_fs)
+
+
+def test_run_ioc_backfill_raises_on_changed_plan(memory_fs):
+    kwargs = dict(start_date=START_DATE, end_date=END_DATE, name="test", n_shards=2)
+    with unittest.mock.patch("observer.ioc.backfill.run_ioc_pipeline"):
+        run_ioc_backfill(["acnj", "blri"], **kwargs)
+        with pytest.raises(ValueError, match="don't match its manifest"):
+            run_ioc_backfill(["acnj", "blri", "dzaou"], **kwargs)
+        with pytest.raises(ValueError, match="time range .* doesn't match its manifest"):
+            run_ioc_backfill(["acnj", "blri"], **{**kwargs, "end_date": END_DATE + pd.Timedelta(days=1)})
+    with pytest.raises(ValueError, match="'shard' must be between 1 and 2"):
+        run_ioc_backfill(["acnj"], shard=3, **kwargs)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import unittest.mock
+
+import httpx
+import multifutures
+import pandas as pd
+import pytest
+import tenacity
+
+import observer.ioc.scraper as scraper
+from observer.ioc.cache import ResponseCache
+
+URL = scraper.BASE_URL.format(ioc_code="acnj", timestart="2022-03-12T11:04:00", timestop="2022-03-12T11:06:00")
+CONTENT = '[{"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"}]'
+
+
+def test_response_cache_roundtrip(tmp_path):
+    cache = ResponseCache(tmp_path)
+    assert cache.get_url(URL) is None
+    cache.set_url(URL, content=CONTENT)
+    assert cache.get_url(URL) == CONTENT
+    assert cache.get("acnj", "2022-03-12T11:04:00", "2022-03-12T11:06:00") == CONTENT
+    assert cache.size == len(CONTENT)
+    # A new instance picks up the existing files
+    assert ResponseCache(tmp_path).size == len(CONTENT)
+
+
+def test_response_cache_skips_open_windows(tmp_path):
+    cache = ResponseCache(tmp_path, min_age=pd.Timedelta(days=1))
+    timestop = (pd.Timestamp.now(tz="UTC").tz_localize(None) - pd.Timedelta(hours=1)).strftime(scraper.IOC_URL_TS_FORMAT)
+    cache.set("acnj", "2022-03-12T11:04:00", timestop, content=CONTENT)
+    assert cache.get("acnj", "2022-03-12T11:04:00", timestop) is None
+    assert cache.size == 0
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_size=2 * len(CONTENT))
+    cache.set("aaaa", "2022-01-01T00:00:00", "2022-01-02T00:00:00", content=CONTENT)
+    cache.set("bbbb", "2022-01-01T00:00:00", "2022-01-02T00:00:00", content=CONTENT)
+    # Make "aaaa" older than "bbbb" and then use it, so that "bbbb" becomes the least recently used
+    path = next(tmp_path.glob("aaaa/*.json"))
+    os.utime(path, (0, 0))
+    assert cache.get("aaaa", "2022-01-01T00:00:00", "2022-01-02T00:00:00") == CONTENT
+    cache.set("cccc", "2022-01-01T00:00:00", "2022-01-02T00:00:00", content=CONTENT)
+    assert cache.size == 2 * len(CONTENT)
+    assert cache.get("aaaa", "2022-01-01T00:00:00", "2022-01-02T00:00:00") == CONTENT
+    assert cache.get("bbbb", "2022-01-01T00:00:00", "2022-01-02T00:00:00") is None
+    assert cache.get("cccc", "2022-01-01T00:00:00", "2022-01-02T00:00:00") == CONTENT
+
+
+def test_response_cache_get_while_evicted(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.set_url(URL, content=CONTENT)
+    read_text = pathlib.Path.read_text
+
+    def read_and_evict(path):
+        content = read_text(path)
+        path.unlink()
+        return content
+
+    with unittest.mock.patch("pathlib.Path.read_text", autospec=True, side_effect=read_and_evict):
+        assert cache.get_url(URL) == CONTENT
+    # The evicted response is not recreated as an empty file
+    assert cache.get_url(URL) is None
+
+
+def test_response_cache_clear(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.set_url(URL, content=CONTENT)
+    cache.clear()
+    assert cache.size == 0
+    assert cache.get_url(URL) is None
+
+
+def test_fetch_url_uses_cache(tmp_path):
+    cache = ResponseCache(tmp_path)
+    client = unittest.mock.Mock()
+    client.get.return_value = httpx.Response(200, text=CONTENT, request=httpx.Request("GET", URL))
+    rate_limit = multifutures.RateLimit()
+    for _ in range(2):
+        assert scraper.fetch_url(url=URL, client=client, rate_limit=rate_limit, cache=cache) == CONTENT
+    assert client.get.call_count == 1
+
+
+def test_fetch_url_raises_on_client_errors(tmp_path):
+    cache = ResponseCache(tmp_path)
+    client = unittest.mock.Mock()
+    client.get.return_value = httpx.Response(404, text="Not Found", request=httpx.Request("GET", URL))
+    with pytest.raises(httpx.HTTPStatusError):
+        scraper.fetch_url(url=URL, client=client, rate_limit=multifutures.RateLimit(), cache=cache)
+    # Not retried and not cached
+    assert client.get.call_count == 1
+    assert cache.get_url(URL) is None
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_fetch_url_retries_transient_errors(tmp_path, status_code):
+    cache = ResponseCache(tmp_path)
+    client = unittest.mock.Mock()
+    client.get.side_effect = [
+        httpx.Response(status_code, text="Service Unavailable", request=httpx.Request("GET", URL)),
+        httpx.Response(200, text=CONTENT, request=httpx.Request("GET", URL)),
+    ]
+    with unittest.mock.patch.object(scraper.fetch_url.retry, "wait", tenacity.wait_none()):
+        content = scraper.fetch_url(url=URL, client=client, rate_limit=multifutures.RateLimit(), cache=cache)
+    assert content == CONTENT
+    assert client.get.call_count == 2
+    # Only the successful response is cached
+    assert cache.get_url(URL) == CONTENT
@@ -0,0 +1,602 @@
+from __future__ import annotations
+
+import unittest.mock
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+
+import observer.ioc.fs as iocfs
+from observer.ioc.archive import open_ioc_archive
+from observer.ioc.cache import StationCache
+from observer.ioc.parser import melt_ioc_df
+from observer.settings import get_settings
+
+
+def _station_path(ioc_code: str) -> str:
+    return f"obs/ioc/stations/{ioc_code}.parquet"
+
+
+def _write_station(fs, ioc_code: str, index: pd.DatetimeIndex, append: bool = False) -> None:
+    df = pd.DataFrame({"wls": np.arange(len(index), dtype=float)}, index=index.rename("time"))
+    df = df.assign(year=df.index.year)
+    df.to_parquet(
+        _station_path(ioc_code),
+        partition_cols=["year"],
+        index=True,
+        engine="fastparquet",
+        append=append,
+        open_with=fs.open,
+        mkdirs=lambda path: fs.mkdirs(path, exist_ok=True),
+    )
+
+
+def test_get_ioc_last_timestamp(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2022-12-31T23:00", periods=3, freq="h"))
+    _write_station(memory_fs, "acnj", pd.date_range("2023-02-01", periods=3, freq="min"), append=True)
+    assert iocfs.get_ioc_last_timestamp("acnj") == pd.Timestamp("2023-02-01T00:02")
+
+
+def test_get_ioc_last_timestamp_returns_none_for_missing_station(memory_fs):
+    assert iocfs.get_ioc_last_timestamp("blri") is None
+
+
+def test_get_ioc_last_timestamps(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2023-01-01", periods=3, freq="min"))
+    last_timestamps = iocfs.get_ioc_last_timestamps(["acnj", "blri"], credential=unittest.mock.Mock())
+    assert last_timestamps == {"acnj": pd.Timestamp("2023-01-01T00:02"), "blri": None}
+
+
+def _station_df(index: pd.DatetimeIndex) -> pd.DataFrame:
+    return pd.DataFrame({"wls": np.arange(len(index), dtype=float)}, index=index.rename("time"))
+
+
+def test_write_ioc_df_append(memory_fs):
+    df1 = _station_df(pd.date_range("2022-12-31T23:00", periods=3, freq="h"))
+    df2 = _station_df(pd.date_range("2023-02-01", periods=3, freq="min"))
+    iocfs.write_ioc_df(df=df1, ioc_code="acnj", fs=memory_fs)
+    iocfs.write_ioc_df(df=df2, ioc_code="acnj", fs=memory_fs, append=True)
+    pf = iocfs.get_ioc_parquet_file("acnj")
+    df = pf.to_pandas().drop(columns="year")
+    pd.testing.assert_frame_equal(df, pd.concat([df1, df2]), check_freq=False)
+
+
+def test_write_ioc_dfs(memory_fs):
+    dfs = {
+        "acnj": _station_df(pd.date_range("2023-01-01", periods=3, freq="min")),
+        "blri": _station_df(pd.date_range("2023-01-01", periods=5, freq="min")),
+        "empty": _station_df(pd.DatetimeIndex([])),
+    }
+    failures = iocfs.write_ioc_dfs(dfs, fs=memory_fs, n_threads=2)
+    assert failures == {}
+    assert memory_fs.exists(_station_path("acnj"))
+    assert memory_fs.exists(_station_path("blri"))
+    assert not memory_fs.exists(_station_path("empty"))
+    assert iocfs.get_ioc_last_timestamp("blri") == pd.Timestamp("2023-01-01T00:04")
+
+
+def test_write_ioc_dfs_reports_failures(memory_fs):
+    dfs = {
+        "acnj": _station_df(pd.date_range("2023-01-01", periods=3, freq="min")),
+        "blri": pd.DataFrame({"wls": [1.0]}, index=pd.Index([1], name="time")),
+    }
+    failures = iocfs.write_ioc_dfs(dfs, fs=memory_fs)
+    assert list(failures) == ["blri"]
+    assert memory_fs.exists(_station_path("acnj"))
+
+
+def test_get_ioc_dfs(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2022-12-31T23:00", periods=3, freq="h"))
+    _write_station(memory_fs, "blri", pd.date_range("2023-01-01", periods=3, freq="h"))
+    dfs = iocfs.get_ioc_dfs(
+        ["blri", "acnj", "missing"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-01-01T01:00"),
+        fs=memory_fs,
+    )
+    assert list(dfs) == ["blri", "acnj"]
+    assert dfs["acnj"].index.tolist() == [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-01T01:00")]
+    assert dfs["blri"].index.tolist() == [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-01T01:00")]
+    assert dfs["acnj"].columns.tolist() == ["wls"]
+
+
+def test_get_ioc_dataset(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2023-01-01", periods=3, freq="h"))
+    _write_station(memory_fs, "blri", pd.date_range("2023-01-01T01:00", periods=3, freq="h"))
+    ds = iocfs.get_ioc_dataset(["acnj", "blri"], fs=memory_fs)
+    assert dict(ds.sizes) == {"ioc_code": 2, "time": 4}
+    assert ds.ioc_code.values.tolist() == ["acnj", "blri"]
+    assert np.isnan(ds.wls.sel(ioc_code="blri", time="2023-01-01T00:00"))
+    assert ds.wls.sel(ioc_code="blri", time="2023-01-01T03:00") == 2
+
+
+def test_get_ioc_df_with_overlapping_appends(memory_fs):
+    first = pd.DataFrame(
+        {"wls": [1.0, 2.0, 3.0], "rad": [10.0, 20.0, 30.0]},
+        index=pd.date_range("2023-01-01", periods=3, freq="h", name="time"),
+    )
+    # A rerun that overlaps with the last 2 hours, without the "rad" value of 01:00
+    second = pd.DataFrame(
+        {"wls": [2.5, 3.5, 4.5], "rad": [np.nan, 35.0, 45.0]},
+        index=pd.date_range("2023-01-01T01:00", periods=3, freq="h", name="time"),
+    )
+    iocfs.write_ioc_df(df=first, ioc_code="acnj", fs=memory_fs)
+    iocfs.write_ioc_df(df=second, ioc_code="acnj", fs=memory_fs, append=True)
+    df = iocfs.get_ioc_df("acnj", no_years=None, fs=memory_fs)
+    assert df.index.tolist() == pd.date_range("2023-01-01", periods=4, freq="h").tolist()
+    assert df.wls.tolist() == [1.0, 2.5, 3.5, 4.5]
+    # A missing value doesn't overwrite a stored one
+    assert df.rad.tolist() == [10.0, 20.0, 35.0, 45.0]
+    ds = iocfs.get_ioc_dataset(["acnj"], fs=memory_fs)
+    assert dict(ds.sizes) == {"ioc_code": 1, "time": 4}
+
+
+def test_get_ioc_dataset_empty(memory_fs):
+    ds = iocfs.get_ioc_dataset(["missing"], fs=memory_fs)
+    assert dict(ds.sizes) == {"ioc_code": 0, "time": 0}
+
+
+@pytest.fixture
+def three_partitions(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2022-12-31T22:00", periods=3, freq="h"))
+    _write_station(memory_fs, "acnj", pd.date_range("2023-02-01", periods=3, freq="h"), append=True)
+    _write_station(memory_fs, "acnj", pd.date_range("2023-03-01", periods=3, freq="h"), append=True)
+    return memory_fs
+
+
+def test_get_ioc_df_time_range(three_partitions):
+    df = iocfs.get_ioc_df(
+        "acnj",
+        start_date=pd.Timestamp("2023-02-01T01:00"),
+        end_date=pd.Timestamp("2023-02-05"),
+        fs=three_partitions,
+    )
+    assert df.index.tolist() == [pd.Timestamp("2023-02-01T01:00"), pd.Timestamp("2023-02-01T02:00")]
+
+
+def test_get_ioc_df_only_reads_overlapping_row_groups(three_partitions):
+    opened = []
+    original_open = three_partitions.open
+
+    def spy_open(path, *args, **kwargs):
+        opened.append(path)
+        return original_open(path, *args, **kwargs)
+
+    with unittest.mock.patch.object(three_partitions, "open", side_effect=spy_open):
+        iocfs.get_ioc_df(
+            "acnj",
+            start_date=pd.Timestamp("2023-02-01T01:00"),
+            end_date=pd.Timestamp("2023-02-05"),
+            fs=three_partitions,
+        )
+    data_files = {path for path in opened if not path.endswith("_metadata")}
+    assert len(data_files) == 1
+    assert "year=2023" in data_files.pop()
+
+
+def test_get_ioc_df_sensors(three_partitions):
+    df = iocfs.get_ioc_df("acnj", sensors=["wls", "rad"], fs=three_partitions)
+    assert df.columns.tolist() == ["wls"]
+
+
+def test_get_ioc_df_no_years(three_partitions):
+    df = iocfs.get_ioc_df("acnj", no_years=1, fs=three_partitions)
+    assert df.index.min() == pd.Timestamp("2023-01-01")
+    assert len(df) == 7
+    df = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions)
+    assert len(df) == 9
+
+
+def _count_downloads(fs):
+    return unittest.mock.patch.object(fs, "get_file", side_effect=fs.get_file)
+
+
+def test_station_cache_serves_repeated_reads_locally(three_partitions, tmp_path):
+    cache = StationCache(tmp_path)
+    expected = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions)
+    with _count_downloads(three_partitions) as get_file:
+        df = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions, cache=cache)
+        assert get_file.call_count > 0
+        get_file.reset_mock()
+        df2 = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions, cache=cache)
+        assert get_file.call_count == 0
+    pd.testing.assert_frame_equal(df, expected)
+    pd.testing.assert_frame_equal(df2, expected)
+    assert cache.size > 0
+
+
+def test_station_cache_only_downloads_needed_files(three_partitions, tmp_path):
+    cache = StationCache(tmp_path)
+    with _count_downloads(three_partitions) as get_file:
+        iocfs.get_ioc_df(
+            "acnj",
+            start_date=pd.Timestamp("2023-02-01"),
+            end_date=pd.Timestamp("2023-02-02"),
+            fs=three_partitions,
+            cache=cache,
+        )
+    downloaded = [call.args[0] for call in get_file.call_args_list]
+    data_files = [path for path in downloaded if path.endswith(".parquet")]
+    assert len(data_files) == 1
+
+
+def test_station_cache_revalidates(three_partitions, tmp_path):
+    cache = StationCache(tmp_path)
+    df = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions, cache=cache)
+    assert len(df) == 9
+    _write_station(three_partitions, "acnj", pd.date_range("2023-04-01", periods=2, freq="h"), append=True)
+    df = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions, cache=cache)
+    assert len(df) == 11
+
+
+def test_station_cache_evicts_least_recently_used(memory_fs, tmp_path):
+    _write_station(memory_fs, "acnj", pd.date_range("2023-01-01", periods=3, freq="h"))
+    _write_station(memory_fs, "blri", pd.date_range("2023-01-01", periods=3, freq="h"))
+    cache = StationCache(tmp_path, max_size=1)
+    iocfs.get_ioc_df("acnj", fs=memory_fs, cache=cache)
+    iocfs.get_ioc_df("blri", fs=memory_fs, cache=cache)
+    assert not list(tmp_path.rglob("acnj.parquet/*"))
+    assert list(tmp_path.rglob("blri.parquet/*"))
+
+
+def test_station_cache_missing_station(memory_fs, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        iocfs.get_ioc_df("missing", fs=memory_fs, cache=StationCache(tmp_path))
+
+
+def test_open_ioc_archive(three_partitions):
+    _write_station(three_partitions, "blri", pd.date_range("2023-01-01", periods=4, freq="h"))
+    ddf = open_ioc_archive(["acnj", "blri", "missing"], fs=three_partitions)
+    # acnj: 2022 + 2023, blri: 2023
+    assert ddf.npartitions == 3
+    assert ddf.columns.tolist() == ["wls", "ioc_code"]
+    maxima = ddf.groupby("ioc_code", observed=True).wls.max().compute()
+    assert maxima.to_dict() == {"acnj": 2.0, "blri": 3.0}
+
+
+def test_open_ioc_archive_time_range(three_partitions):
+    ddf = open_ioc_archive(
+        ["acnj"],
+        start_date=pd.Timestamp("2023-02-01T01:00"),
+        end_date=pd.Timestamp("2023-03-01"),
+        fs=three_partitions,
+    )
+    assert ddf.npartitions == 1
+    df = ddf.compute()
+    assert df.index.tolist() == [
+        pd.Timestamp("2023-02-01T01:00"),
+        pd.Timestamp("2023-02-01T02:00"),
+        pd.Timestamp("2023-03-01"),
+    ]
+    assert (df.ioc_code == "acnj").all()
+
+
+def test_open_ioc_archive_union_of_sensors(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2023-01-01", periods=2, freq="h"))
+    index = pd.date_range("2023-01-01", periods=2, freq="h", name="time")
+    df = pd.DataFrame({"rad": [1.0, 2.0]}, index=index)
+    iocfs.write_ioc_df(df=df, ioc_code="blri", fs=memory_fs)
+    df = open_ioc_archive(["acnj", "blri"], fs=memory_fs).compute()
+    assert df.columns.tolist() == ["rad", "wls", "ioc_code"]
+    assert df[df.ioc_code == "acnj"].rad.isna().all()
+    assert df[df.ioc_code == "blri"].rad.tolist() == [1.0, 2.0]
+
+
+def test_open_ioc_archive_empty(memory_fs):
+    ddf = open_ioc_archive(["missing"], fs=memory_fs)
+    assert len(ddf.compute()) == 0
+
+
+def test_write_ioc_df_row_group_size(memory_fs):
+    df = _station_df(pd.date_range("2022-12-31T21:00", periods=10, freq="h"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", row_group_size=4, fs=memory_fs)
+    pf = iocfs.get_ioc_parquet_file("acnj")
+    # 2022: 3 rows, 2023: 7 rows
+    assert [rg.num_rows for rg in pf.row_groups] == [3, 4, 3]
+
+
+def test_compact_ioc_station(three_partitions):
+    overlap = pd.date_range("2023-03-01T01:00", periods=3, freq="h")
+    _write_station(three_partitions, "acnj", overlap, append=True)
+    assert len(iocfs.get_ioc_parquet_file("acnj").row_groups) == 5
+
+    assert iocfs.compact_ioc_station("acnj", fs=three_partitions)
+
+    pf = iocfs.get_ioc_parquet_file("acnj")
+    assert len(pf.row_groups) == 2
+    assert not three_partitions.exists(_station_path("acnj") + ".compacting")
+    assert not three_partitions.exists(_station_path("acnj") + ".replaced")
+    df = iocfs.get_ioc_df("acnj", no_years=None, fs=three_partitions)
+    assert df.index.is_monotonic_increasing
+    assert df.index.is_unique
+    assert len(df) == 10
+    # The last append wins
+    assert df.wls["2023-03-01T01:00"] == 0
+
+
+def test_compact_ioc_station_after_interrupted_compaction(three_partitions):
+    fs, path = three_partitions, _station_path("acnj")
+    expected = iocfs.get_ioc_df("acnj", no_years=None, fs=fs)
+    # Interrupted while writing the new files: they are discarded
+    fs.copy(path, path + ".compacting", recursive=True)
+    fs.rm(path + ".compacting/year=2023", recursive=True)
+    assert iocfs.compact_ioc_station("acnj", fs=fs)
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None, fs=fs), expected)
+    # Interrupted after the new files had been moved in place: the old ones are deleted
+    fs.copy(path, path + ".replaced", recursive=True)
+    assert iocfs.compact_ioc_station("acnj", force=True, fs=fs)
+    assert not fs.exists(path + ".replaced")
+    # Interrupted while moving the files: nothing is deleted
+    fs.copy(path, path + ".replaced", recursive=True)
+    fs.copy(path, path + ".compacting", recursive=True)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        iocfs.compact_ioc_station("acnj", force=True, fs=fs)
+    assert fs.exists(path + ".replaced") and fs.exists(path + ".compacting")
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None, fs=fs), expected)
+
+
+def test_compact_ioc_station_skips_compact_stations(memory_fs):
+    _write_station(memory_fs, "acnj", pd.date_range("2022-12-31T23:00", periods=3, freq="h"))
+    assert not iocfs.compact_ioc_station("acnj", fs=memory_fs)
+    assert iocfs.compact_ioc_station("acnj", force=True, fs=memory_fs)
+
+
+def test_compact_ioc_archive(three_partitions):
+    failures = iocfs.compact_ioc_archive(["acnj", "missing"], fs=three_partitions)
+    assert list(failures) == ["missing"]
+    assert isinstance(failures["missing"], FileNotFoundError)
+    assert len(iocfs.get_ioc_parquet_file("acnj").row_groups) == 2
+
+
+def test_update_ioc_catalog(three_partitions):
+    _write_station(three_partitions, "blri", pd.date_range("2023-01-01", periods=4, freq="h"))
+    assert iocfs.get_ioc_catalog().empty
+    catalog = iocfs.update_ioc_catalog(["blri", "acnj", "missing"])
+    assert catalog.index.tolist() == ["acnj", "blri"]
+    acnj = catalog.loc["acnj"]
+    assert acnj.start == pd.Timestamp("2022-12-31T22:00")
+    assert acnj.end == pd.Timestamp("2023-03-01T02:00")
+    assert acnj.num_rows == 9
+    assert list(acnj.sensors) == ["wls"]
+    assert len(acnj.files) == 4
+    # The accessor is refreshed after an update
+    pd.testing.assert_frame_equal(iocfs.get_ioc_catalog(), catalog)
+    assert iocfs.list_ioc_stations(from_catalog=True) == ["acnj", "blri"]
+    assert iocfs.get_ioc_last_timestamps(["blri", "missing"], from_catalog=True) == {
+        "blri": pd.Timestamp("2023-01-01T03:00"),
+        "missing": None,
+    }
+
+
+def test_update_ioc_catalog_removes_deleted_stations(three_partitions):
+    iocfs.update_ioc_catalog(["acnj"])
+    three_partitions.rm(_station_path("acnj"), recursive=True)
+    catalog = iocfs.update_ioc_catalog(["acnj"])
+    assert catalog.empty
+
+
+def test_get_ioc_catalog_is_cached(three_partitions):
+    iocfs.update_ioc_catalog(["acnj"])
+    iocfs.get_ioc_catalog()
+    with unittest.mock.patch("observer.ioc.fs.fastparquet.ParquetFile") as parquet_file:
+        iocfs.get_ioc_catalog()
+        # Cached by URI, not by filesystem
+        iocfs.get_ioc_catalog(fs=fsspec.filesystem("memory", skip_instance_cache=True))
+        parquet_file.assert_not_called()
+        iocfs.get_ioc_catalog(refresh=True)
+        parquet_file.assert_called_once()
+
+
+def test_write_ioc_dfs_updates_catalog(memory_fs):
+    dfs = {"acnj": _station_df(pd.date_range("2023-01-01", periods=3, freq="min"))}
+    iocfs.write_ioc_dfs(dfs, fs=memory_fs)
+    catalog = iocfs.get_ioc_catalog()
+    assert catalog.index.tolist() == ["acnj"]
+    assert catalog.num_rows["acnj"] == 3
+    iocfs.write_ioc_dfs(dfs, fs=memory_fs, append=True)
+    assert iocfs.get_ioc_catalog().num_rows["acnj"] == 6
+    iocfs.compact_ioc_archive(["acnj"], fs=memory_fs)
+    assert iocfs.get_ioc_catalog().num_rows["acnj"] == 3
+
+
+def test_local_storage_backend(monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_URL", str(tmp_path))
+    get_settings.cache_clear()
+    try:
+        df = _station_df(pd.date_range("2023-01-01", periods=3, freq="min"))
+        iocfs.write_ioc_df(df=df, ioc_code="acnj")
+        assert (tmp_path / "ioc" / "stations" / "acnj.parquet" / "_metadata").exists()
+        assert iocfs.list_ioc_stations() == ["acnj"]
+        pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj"), df, check_freq=False)
+        metadata = pd.DataFrame({"ioc_code": ["acnj"], "lat": [39.35]})
+        metadata.to_parquet(tmp_path / "ioc" / "metadata.parquet", engine="fastparquet")
+        pd.testing.assert_frame_equal(iocfs.get_ioc_metadata(refresh=True), metadata)
+    finally:
+        get_settings.cache_clear()
+        iocfs._FILE_CACHE.clear()
+
+
+def _sea_levels(index: pd.DatetimeIndex) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    # Like the IOC responses: 3 decimals and some missing values
+    values = np.sin(np.arange(len(index)) / 100) * 2 + rng.normal(scale=0.01, size=len(index))
+    values[::7] = np.nan
+    df = pd.DataFrame({"prs": (values + 10).round(3), "rad": values.round(3)}, index=index.rename("time"))
+    df.columns.name = ""
+    return df
+
+
+@pytest.mark.parametrize(
+    "encoding,tolerance",
+    [("float64", 0), ("float32", 1e-5), ("scaled", 0)],
+)
+def test_write_ioc_df_encodings(memory_fs, encoding, tolerance):
+    df = _sea_levels(pd.date_range("2022-12-31", "2023-01-02", freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs, encoding=encoding)
+    # Appends keep the encoding of the station
+    appended = _sea_levels(pd.date_range("2023-02-01", periods=10, freq="min"))
+    iocfs.write_ioc_df(df=appended, ioc_code="acnj", fs=memory_fs, append=True)
+    assert iocfs.get_ioc_parquet_file("acnj").key_value_metadata[iocfs.ENCODING_KEY] == encoding
+
+    result = iocfs.get_ioc_df(
+        "acnj", start_date=pd.Timestamp("2022-12-31T12:00"), end_date=pd.Timestamp("2023-02-02")
+    )
+    expected = pd.concat([df, appended]).loc["2022-12-31T12:00":]
+    assert result.index.dtype == "datetime64[ns]"
+    pd.testing.assert_frame_equal(
+        result, expected, check_freq=False, rtol=tolerance, atol=tolerance, check_exact=not tolerance
+    )
+    assert result.rad.isna().sum() == expected.rad.isna().sum()
+    assert iocfs.get_ioc_last_timestamp("acnj") == pd.Timestamp("2023-02-01T00:09")
+
+    result = iocfs.get_ioc_df("acnj", no_years=None, dtype="float32")
+    assert (result.dtypes == np.float32).all()
+    dask_df = open_ioc_archive(["acnj"]).compute()
+    np.testing.assert_allclose(
+        dask_df.rad.to_numpy(), pd.concat([df, appended]).rad.to_numpy(), atol=tolerance
+    )
+
+
+@pytest.mark.parametrize("encoding", ["float32", "scaled"])
+def test_compact_encodings_with_overlapping_appends(memory_fs, encoding):
+    df = _sea_levels(pd.date_range("2023-01-01", periods=100, freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs, encoding=encoding)
+    iocfs.write_ioc_df(df=df + 1, ioc_code="acnj", fs=memory_fs, append=True)
+    # The last append wins on read too
+    pd.testing.assert_frame_equal(
+        iocfs.get_ioc_df("acnj", no_years=None), df + 1, check_freq=False, atol=1e-5, check_exact=False
+    )
+    assert len(open_ioc_archive(["acnj"]).compute()) == 100
+
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs)
+    # The last append wins
+    pd.testing.assert_frame_equal(
+        iocfs.get_ioc_df("acnj", no_years=None), df + 1, check_freq=False, atol=1e-5, check_exact=False
+    )
+
+
+def test_compact_ioc_station_with_partially_overlapping_appends(memory_fs):
+    df = _sea_levels(pd.date_range("2023-01-01", periods=100, freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs)
+    # The overlapping append has no `rad` values for the last 10 minutes
+    appended = _sea_levels(pd.date_range("2023-01-01T01:30", periods=20, freq="min")) + 1
+    appended.loc[:"2023-01-01T01:39", "rad"] = np.nan
+    iocfs.write_ioc_df(df=appended, ioc_code="acnj", fs=memory_fs, append=True)
+
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs)
+    result = iocfs.get_ioc_df("acnj", no_years=None)
+    assert len(result) == 110
+    assert iocfs.get_ioc_parquet_file("acnj").count() == 110
+    # The missing values of the append don't overwrite the stored ones
+    pd.testing.assert_series_equal(
+        result.rad.loc["2023-01-01T01:30":"2023-01-01T01:39"], df.rad.loc["2023-01-01T01:30":], check_freq=False
+    )
+    pd.testing.assert_frame_equal(result, appended.combine_first(df), check_freq=False, check_names=False)
+
+
+def test_compact_encoding_is_smaller(memory_fs):
+    df = _sea_levels(pd.date_range("2023-01-01", "2023-03-01", freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs)
+    iocfs.write_ioc_df(
+        df=df,
+        ioc_code="blri",
+        fs=memory_fs,
+        encoding="scaled",
+        compression_level=iocfs.COMPACT_COMPRESSION_LEVEL,
+    )
+    assert memory_fs.du(_station_path("blri")) < memory_fs.du(_station_path("acnj")) * 0.6
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("blri", no_years=None), df, check_freq=False)
+
+
+def test_compact_ioc_station_changes_encoding(memory_fs):
+    df = _sea_levels(pd.date_range("2023-01-01", periods=100, freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs)
+    assert not iocfs.compact_ioc_station("acnj", fs=memory_fs)
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs, encoding="scaled")
+    assert iocfs.get_ioc_parquet_file("acnj").key_value_metadata[iocfs.ENCODING_KEY] == "scaled"
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None), df, check_freq=False)
+
+
+def test_encode_ioc_df_raises_on_overflow():
+    df = pd.DataFrame({"rad": [1e7]}, index=pd.DatetimeIndex(["2023-01-01"], name="time"))
+    with pytest.raises(ValueError, match="int32"):
+        iocfs.encode_ioc_df(df, encoding="scaled")
+
+
+def _sparse_sea_levels(index: pd.DatetimeIndex) -> pd.DataFrame:
+    # A sensor per minute and a sensor per 5 minutes, i.e. mostly NaN in the wide layout
+    df = _sea_levels(index)
+    df.loc[df.index.minute % 5 != 0, "prs"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("encoding", ["float64", "scaled"])
+def test_write_ioc_df_long_layout(memory_fs, encoding):
+    df = _sparse_sea_levels(pd.date_range("2022-12-31", "2023-01-02", freq="min"))
+    iocfs.write_ioc_df(df=melt_ioc_df(df), ioc_code="acnj", fs=memory_fs, encoding=encoding)
+    # Appends are converted to the layout of the station
+    appended = _sparse_sea_levels(pd.date_range("2023-02-01", periods=10, freq="min"))
+    iocfs.write_ioc_df(df=appended, ioc_code="acnj", fs=memory_fs, append=True)
+    pf = iocfs.get_ioc_parquet_file("acnj")
+    assert pf.key_value_metadata[iocfs.LAYOUT_KEY] == "long"
+    assert sorted(pf.cats["sensor"]) == ["prs", "rad"]
+    expected = pd.concat([df, appended]).dropna(how="all")
+
+    result = iocfs.get_ioc_df("acnj", no_years=None)
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
+    assert iocfs.get_ioc_last_timestamp("acnj") == pd.Timestamp("2023-02-01T00:09")
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=1), expected.loc["2023"], check_freq=False)
+    long = iocfs.get_ioc_df("acnj", no_years=None, layout="long")
+    pd.testing.assert_frame_equal(long, melt_ioc_df(expected))
+
+    # Only the files of the requested sensor are read
+    opened = []
+    original_open = memory_fs.open
+
+    def spy_open(path, *args, **kwargs):
+        opened.append(path)
+        return original_open(path, *args, **kwargs)
+
+    with unittest.mock.patch.object(memory_fs, "open", side_effect=spy_open):
+        result = iocfs.get_ioc_df(
+            "acnj",
+            start_date=pd.Timestamp("2023-01-01T12:00"),
+            end_date=pd.Timestamp("2023-01-01T13:00"),
+            sensors=["prs"],
+            fs=memory_fs,
+        )
+    data_files = {path for path in opened if not path.endswith("_metadata")}
+    assert len(data_files) == 1
+    assert "sensor=prs" in data_files.pop()
+    pd.testing.assert_frame_equal(
+        result, expected.loc["2023-01-01T12:00":"2023-01-01T13:00", ["prs"]].dropna(), check_freq=False
+    )
+    dask_df = open_ioc_archive(["acnj"]).compute()
+    pd.testing.assert_frame_equal(dask_df.drop(columns="ioc_code"), expected, check_freq=False)
+    assert iocfs.update_ioc_catalog(["acnj"]).sensors["acnj"] == ["prs", "rad"]
+
+
+def test_empty_long_station(memory_fs):
+    iocfs.write_ioc_df(df=melt_ioc_df(pd.DataFrame()), ioc_code="acnj", fs=memory_fs)
+    assert iocfs.get_ioc_df("acnj", layout="long").empty
+    assert iocfs.get_ioc_df("acnj", no_years=None).empty
+    assert iocfs.compact_ioc_station("acnj", force=True, fs=memory_fs)
+
+
+def test_compact_ioc_station_changes_layout(memory_fs):
+    df = _sparse_sea_levels(pd.date_range("2023-01-01", periods=100, freq="min"))
+    iocfs.write_ioc_df(df=df, ioc_code="acnj", fs=memory_fs)
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs, layout="long")
+    assert iocfs.get_ioc_parquet_file("acnj").key_value_metadata[iocfs.LAYOUT_KEY] == "long"
+    # Later appends take precedence
+    iocfs.write_ioc_df(df=df.iloc[-10:] + 1, ioc_code="acnj", fs=memory_fs, append=True)
+    expected = pd.concat([df.iloc[:-10], df.iloc[-10:] + 1]).dropna(how="all")
+    # Both before and after the compaction
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None), expected, check_freq=False)
+    long = iocfs.get_ioc_df("acnj", no_years=None, layout="long")
+    pd.testing.assert_frame_equal(long, melt_ioc_df(expected))
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs)
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None), expected, check_freq=False)
+    assert iocfs.compact_ioc_station("acnj", fs=memory_fs, layout="wide")
+    pd.testing.assert_frame_equal(iocfs.get_ioc_df("acnj", no_years=None), expected, check_freq=False)
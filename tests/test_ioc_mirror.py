@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import hashlib
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+
+import observer.ioc.fs as iocfs
+from observer.ioc.mirror import MANIFEST_NAME
+from observer.ioc.mirror import sync_ioc_archive
+from observer.settings import get_settings
+
+
+def _write(fs, ioc_code: str, periods: int = 3, append: bool = False) -> None:
+    start = "2023-02-01" if append else "2023-01-01"
+    index = pd.date_range(start, periods=periods, freq="min", name="time")
+    df = pd.DataFrame({"wls": np.arange(periods, dtype=float)}, index=index)
+    iocfs.write_ioc_df(df=df, ioc_code=ioc_code, fs=fs, append=append)
+
+
+def _local_files(destination) -> set[str]:
+    root = destination / "ioc"
+    return {path.relative_to(root).as_posix() for path in root.rglob("*") if path.is_file()}
+
+
+def test_sync_ioc_archive(memory_fs, tmp_path):
+    _write(memory_fs, "acnj")
+    _write(memory_fs, "blri")
+    result = sync_ioc_archive(tmp_path, fs=memory_fs)
+    assert not result.failures
+    assert result.unchanged == 0
+    assert set(result.transferred) == _local_files(tmp_path) - {MANIFEST_NAME}
+    assert result.transferred_bytes > 0
+    # The mirror is a valid storage root
+    with unittest.mock.patch.dict("os.environ", {"STORAGE_URL": str(tmp_path)}):
+        get_settings.cache_clear()
+        df = iocfs.get_ioc_df(
+            "acnj", start_date=pd.Timestamp("2023-01-01"), end_date=pd.Timestamp("2023-01-02")
+        )
+    assert len(df) == 3
+
+
+def test_sync_ioc_archive_is_incremental(memory_fs, tmp_path):
+    _write(memory_fs, "acnj")
+    _write(memory_fs, "blri")
+    first = sync_ioc_archive(tmp_path, fs=memory_fs)
+    second = sync_ioc_archive(tmp_path, fs=memory_fs)
+    assert second.transferred == []
+    assert second.unchanged == len(first.transferred)
+    _write(memory_fs, "acnj", append=True)
+    third = sync_ioc_archive(tmp_path, fs=memory_fs)
+    assert third.transferred
+    assert all(name.startswith("stations/acnj.parquet/") for name in third.transferred)
+
+
+def test_sync_ioc_archive_deletes_stale_files(memory_fs, tmp_path):
+    _write(memory_fs, "acnj")
+    _write(memory_fs, "blri")
+    sync_ioc_archive(tmp_path, fs=memory_fs)
+    memory_fs.rm("/obs/ioc/stations/blri.parquet", recursive=True)
+    result = sync_ioc_archive(tmp_path, fs=memory_fs, delete=False)
+    assert result.deleted == []
+    assert any(name.startswith("stations/blri.parquet/") for name in _local_files(tmp_path))
+    result = sync_ioc_archive(tmp_path, fs=memory_fs)
+    assert result.deleted
+    assert not any(name.startswith("stations/blri.parquet/") for name in _local_files(tmp_path))
+
+
+def test_sync_ioc_archive_filters_stations(memory_fs, tmp_path):
+    _write(memory_fs, "acnj")
+    _write(memory_fs, "blri")
+    sync_ioc_archive(tmp_path, fs=memory_fs, ioc_codes=["acnj"])
+    assert {name.split("/")[1] for name in _local_files(tmp_path) if "/" in name} == {"acnj.parquet"}
+
+
+def test_sync_ioc_archive_checksum_mismatch(memory_fs, tmp_path):
+    _write(memory_fs, "acnj")
+    find = memory_fs.find
+
+    def find_with_md5(*args, **kwargs):
+        listing = find(*args, **kwargs)
+        for info in listing.values():
+            info["content_settings"] = {"content_md5": bytearray(hashlib.md5(b"corrupt").digest())}
+        return listing
+
+    with unittest.mock.patch.object(memory_fs, "find", find_with_md5):
+        result = sync_ioc_archive(tmp_path, fs=memory_fs)
+    assert result.failures
+    assert result.transferred == []
+    # Neither the corrupt data files nor the metadata that reference them are written
+    assert _local_files(tmp_path) == {MANIFEST_NAME}
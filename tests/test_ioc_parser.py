@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from observer.ioc.parser import concat_long_ioc_dfs
+from observer.ioc.parser import melt_ioc_df
+from observer.ioc.parser import parse_ioc_json
+from observer.ioc.parser import parse_ioc_json_shared_memory
+from observer.ioc.parser import pivot_long_ioc_df
+from observer.ioc.parser import SENSOR_DTYPE
+
+from pandas_parser import parse_json_pandas
+
+
+CONTENT = """ [\
+{"slevel":0.905,"stime":"2022-03-12 11:04:00","sensor":"wls"},
+{"slevel":1.203,"stime":"2022-03-12 11:04:00","sensor":"rad"},
+{"slevel":0.906,"stime":"2022-03-12 11:05:00","sensor":"wls"},
+{"slevel":0.907,"stime":"2022-03-12 11:05:00","sensor":"wls"},
+{"slevel":null,"stime":"2022-03-12 11:05:30 ","sensor":"rad"},
+{"slevel":9.999,"stime":"2022-03-12 11:05:30","sensor":"xyz"},
+{"slevel":0.896,"stime":"2022-03-12 11:06:00","sensor":"wls"},
+{"slevel":1.199,"stime":"2022-03-12 11:03:00","sensor":"rad"}
+]"""
+
+
+def test_parse_ioc_json_matches_pandas_implementation():
+    expected = parse_json_pandas(content=CONTENT, ioc_code="acnj")
+    df = parse_ioc_json(content=CONTENT, ioc_code="acnj")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_parse_ioc_json_keeps_first_duplicate():
+    df = parse_ioc_json(content=CONTENT, ioc_code="acnj")
+    assert df.wls[pd.Timestamp("2022-03-12 11:05:00")] == 0.906
+    assert "xyz" not in df.columns
+    assert df.index.is_monotonic_increasing
+
+
+def test_parse_ioc_json_accepts_bytes():
+    df = parse_ioc_json(content=CONTENT.encode(), ioc_code="acnj")
+    assert len(df) == 5
+
+
+def test_parse_ioc_json_only_unknown_sensors():
+    content = '[{"slevel":9.999,"stime":"2022-03-12 11:05:30","sensor":"xyz"}]'
+    df = parse_ioc_json(content=content, ioc_code="acnj")
+    assert df.empty
+    assert isinstance(df.index, pd.DatetimeIndex)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_parse_ioc_json_matches_pandas_implementation_random(seed):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2023-01-01", periods=200, freq="min").strftime("%Y-%m-%d %H:%M:%S")
+    records = [
+        {"slevel": round(float(rng.random()), 3), "stime": rng.choice(times), "sensor": rng.choice(["wls", "rad", "prs"])}
+        for _ in range(500)
+    ]
+    content = json.dumps(records)
+    expected = parse_json_pandas(content=content, ioc_code="acnj")
+    df = parse_ioc_json(content=content, ioc_code="acnj")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_parse_ioc_json_long():
+    df = parse_ioc_json(content=CONTENT, ioc_code="acnj", layout="long")
+    assert list(df.columns) == ["time", "sensor", "value"]
+    assert df.sensor.dtype == SENSOR_DTYPE
+    # The unknown sensor, the duplicate and the null value are dropped
+    assert df.sensor.tolist() == ["rad", "rad", "wls", "wls", "wls"]
+    assert df.value.tolist() == [1.199, 1.203, 0.905, 0.906, 0.896]
+    assert df[df.sensor == "wls"].time.is_monotonic_increasing
+
+
+def test_parse_ioc_json_unknown_layout():
+    with pytest.raises(ValueError, match="Unknown layout"):
+        parse_ioc_json(content=CONTENT, ioc_code="acnj", layout="tall")  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_long_layout_round_trip(seed):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2023-01-01", periods=200, freq="min").strftime("%Y-%m-%d %H:%M:%S")
+    records = [
+        {"slevel": round(float(rng.random()), 3), "stime": rng.choice(times), "sensor": rng.choice(["wls", "rad", "prs"])}
+        for _ in range(500)
+    ]
+    content = json.dumps(records)
+    wide = parse_ioc_json(content=content, ioc_code="acnj")
+    long = parse_ioc_json(content=content, ioc_code="acnj", layout="long")
+    assert len(long) == wide.count().sum()
+    pd.testing.assert_frame_equal(pivot_long_ioc_df(long), wide)
+    pd.testing.assert_frame_equal(melt_ioc_df(wide), long)
+
+
+def test_pivot_long_ioc_df_drops_all_null_timestamps():
+    wide = parse_ioc_json(content=CONTENT, ioc_code="acnj")
+    long = parse_ioc_json(content=CONTENT, ioc_code="acnj", layout="long")
+    pd.testing.assert_frame_equal(pivot_long_ioc_df(long), wide.dropna(how="all"))
+
+
+def test_concat_long_ioc_dfs_keep():
+    first = parse_ioc_json(content=CONTENT, ioc_code="acnj", layout="long")
+    second = first.assign(value=-first.value)
+    df = concat_long_ioc_dfs([second.iloc[2:], first], ioc_code="acnj")
+    assert len(df) == len(first)
+    assert df.value.tolist() == [1.199, 1.203, -0.905, -0.906, -0.896]
+    df = concat_long_ioc_dfs([second.iloc[2:], first], ioc_code="acnj", keep="last")
+    assert df.value.tolist() == [1.199, 1.203, 0.905, 0.906, 0.896]
+    assert concat_long_ioc_dfs([], ioc_code="acnj").empty
+
+
+def test_parse_ioc_json_shared_memory_long():
+    data = CONTENT.encode()
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[: len(data)] = data
+        chunk = parse_ioc_json_shared_memory(shm.name, offset=0, size=len(data), ioc_code="acnj", layout="long")
+    finally:
+        shm.close()
+        shm.unlink()
+    pd.testing.assert_frame_equal(chunk.to_df(), parse_ioc_json(content=CONTENT, ioc_code="acnj", layout="long"))
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import unittest.mock
+
+import httpx
+import pandas as pd
+import pytest
+
+import observer.ioc.fs as iocfs
+from observer.ioc.pipeline import run_ioc_pipeline
+
+
+def _fetch(failing: set[str] = set()):
+    # One record at the start of each chunk
+    def fetch(url, ioc_code, **kwargs):
+        if ioc_code in failing:
+            raise httpx.ReadTimeout("timeout")
+        timestart = url.split("timestart=")[1][:19].replace("T", " ")
+        return f'[{{"slevel":0.905,"stime":"{timestart}","sensor":"wls"}}]'
+
+    return fetch
+
+
+def _read(ioc_code: str) -> pd.DataFrame:
+    return iocfs.get_ioc_parquet_file(ioc_code).to_pandas().drop(columns="year")
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = _fetch()
+    progress = unittest.mock.Mock()
+    result = run_ioc_pipeline(
+        ["acnj", "blri", "dzaou"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-03-01"),
+        batch_size=2,
+        progress=progress,
+    )
+    assert not result.failures
+    assert result.uploaded == ["acnj", "blri", "dzaou"]
+    assert result.stations == 3
+    assert result.requests == mocked_fetch_url.call_count == 6
+    assert result.rows == 6
+    assert result.elapsed > 0
+    assert [call.args for call in progress.call_args_list] == [(2,), (1,)]
+    assert len(_read("acnj")) == 2
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline_modes(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = _fetch()
+    kwargs = dict(start_date=pd.Timestamp("2023-01-01"), end_date=pd.Timestamp("2023-01-02"))
+    run_ioc_pipeline(["acnj"], **kwargs)
+    assert _read("acnj").index.tolist() == [pd.Timestamp("2023-01-01")]
+
+    # "scrape" appends the time range as it is
+    run_ioc_pipeline(["acnj"], start_date=pd.Timestamp("2023-02-01"), end_date=pd.Timestamp("2023-02-02"))
+    assert _read("acnj").index.tolist() == [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-02-01")]
+
+    # "update" only scrapes after the last stored timestamp and doesn't store the overlap twice
+    result = run_ioc_pipeline(
+        ["acnj"],
+        mode="update",
+        start_date=pd.Timestamp("2000-01-01"),
+        end_date=pd.Timestamp("2023-02-03"),
+        overlap=pd.Timedelta(hours=1),
+    )
+    url = mocked_fetch_url.call_args.kwargs["url"]
+    assert "timestart=2023-01-31T23:00:00" in url
+    assert result.rows == 0
+    assert len(_read("acnj")) == 2
+
+    # "backfill" replaces the stored data
+    run_ioc_pipeline(["acnj"], mode="backfill", **kwargs)
+    assert _read("acnj").index.tolist() == [pd.Timestamp("2023-01-01")]
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline_update_with_outdated_catalog(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = _fetch()
+    kwargs = dict(end_date=pd.Timestamp("2023-02-03"), chunk_size=pd.Timedelta(days=30))
+    run_ioc_pipeline(["acnj"], start_date=pd.Timestamp("2023-01-01"), end_date=pd.Timestamp("2023-01-02"))
+    # Written without updating the catalog, whose end is still 2023-01-01
+    stored = pd.DataFrame({"wls": [0.5]}, index=pd.DatetimeIndex(["2023-01-30T23:00"], name="time"))
+    iocfs.write_ioc_df(df=stored, ioc_code="acnj", append=True)
+    assert iocfs.get_ioc_catalog().end["acnj"] == pd.Timestamp("2023-01-01")
+
+    # Scrapes 2022-12-31T23:00 and 2023-01-30T23:00, which is already stored
+    run_ioc_pipeline(["acnj"], mode="update", start_date=pd.Timestamp("2000-01-01"), from_catalog=True, **kwargs)
+    df = _read("acnj")
+    assert df.index.tolist() == [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-30T23:00")]
+    assert df.wls.tolist() == [0.905, 0.5]
+
+
+@pytest.mark.parametrize("mode", ["scrape", "update"])
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline_with_station_missing_from_catalog(mocked_fetch_url, memory_fs, mode):
+    mocked_fetch_url.side_effect = _fetch()
+    # Stored without updating the catalog, e.g. because `update_ioc_catalog()` failed
+    stored = pd.DataFrame(
+        {"wls": [0.5, 0.6]}, index=pd.DatetimeIndex(["2023-01-01", "2023-01-10"], name="time")
+    )
+    iocfs.write_ioc_df(df=stored, ioc_code="acnj")
+    assert iocfs.get_ioc_catalog().empty
+
+    run_ioc_pipeline(
+        ["acnj"],
+        mode=mode,
+        start_date=pd.Timestamp("2023-01-20"),
+        end_date=pd.Timestamp("2023-01-21"),
+        from_catalog=True,
+    )
+    # The stored data are appended to instead of being replaced
+    stored_times = [pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-10")]
+    urls = [call.kwargs["url"] for call in mocked_fetch_url.call_args_list]
+    if mode == "scrape":
+        assert _read("acnj").index.tolist() == [*stored_times, pd.Timestamp("2023-01-20")]
+    else:
+        # Scraped from the last stored timestamp (minus the overlap) instead of `start_date`
+        assert "timestart=2023-01-09T23:00:00" in urls[0]
+        assert _read("acnj").index.tolist() == stored_times
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline_failures(mocked_fetch_url, memory_fs):
+    mocked_fetch_url.side_effect = _fetch(failing={"blri"})
+    result = run_ioc_pipeline(
+        ["acnj", "blri"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-01-02"),
+        n_retries=2,
+    )
+    assert result.uploaded == ["acnj"]
+    assert list(result.failures) == ["blri"]
+    assert isinstance(result.failures["blri"], httpx.ReadTimeout)
+    # The initial request of each station plus two retries of the failed one
+    assert mocked_fetch_url.call_count == result.requests == 4
+    assert not memory_fs.exists(iocfs._get_station_uri("blri"))
+
+
+@pytest.mark.parametrize("parse_executor", ["inline", "process"])
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_run_ioc_pipeline_long_layout(mocked_fetch_url, memory_fs, parse_executor):
+    mocked_fetch_url.side_effect = _fetch()
+    kwargs = dict(layout="long", parse_executor=parse_executor, n_processes=1)
+    result = run_ioc_pipeline(
+        ["acnj"], start_date=pd.Timestamp("2023-01-01"), end_date=pd.Timestamp("2023-03-01"), **kwargs
+    )
+    assert result.rows == 2
+    assert iocfs.get_ioc_parquet_file("acnj").key_value_metadata[iocfs.LAYOUT_KEY] == "long"
+    # "update" filters the overlap out of the long dataframes too
+    result = run_ioc_pipeline(
+        ["acnj"],
+        mode="update",
+        start_date=pd.Timestamp("2000-01-01"),
+        end_date=pd.Timestamp("2023-03-02"),
+        overlap=pd.Timedelta(days=1),
+        **kwargs,
+    )
+    assert result.rows == 1
+    df = iocfs.get_ioc_df("acnj", no_years=None)
+    assert len(df) == 3
+    assert df.index.is_unique
+    assert df.columns.tolist() == ["wls"]
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import unittest.mock
+
+import httpx
+import limits
+import multifutures
+import pandas as pd
+import pytest
+
+from observer.ioc import scraper
+from observer.ioc.pipeline import run_ioc_pipeline
+from observer.metrics import CountingFile
+from observer.metrics import get_metrics
+from observer.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def metrics():
+    registry = get_metrics()
+    registry.reset()
+    yield registry
+    registry.reset()
+
+
+def test_report():
+    registry = MetricsRegistry()
+    registry.inc("observer_ioc_requests_total", status="200")
+    registry.inc("observer_ioc_requests_total", status="200")
+    registry.inc("observer_ioc_requests_total", status="503")
+    registry.observe("observer_ioc_request_seconds", 0.02)
+    registry.observe("observer_ioc_request_seconds", 0.2)
+    registry.inc("observer_phase_seconds_total", 2, phase="parse")
+    registry.inc("observer_ioc_parsed_rows_total", 1000)
+    report = registry.report()
+    assert report["requests"]["total"] == 3
+    assert report["requests"]["by_status"] == {"200": 2, "503": 1}
+    assert report["requests"]["latency_mean_seconds"] == pytest.approx(0.11)
+    assert report["requests"]["latency_p50_seconds"] == 0.025
+    assert report["requests"]["latency_p95_seconds"] == 0.25
+    assert report["phase_seconds"] == {"parse": 2}
+    assert report["parse_rows_per_second"] == 500
+    # Nothing was uploaded
+    assert report["upload_bytes_per_second"] == 0
+    registry.reset()
+    assert registry.report()["requests"]["total"] == 0
+
+
+def test_to_prometheus():
+    registry = MetricsRegistry()
+    registry.inc("observer_ioc_requests_total", status="200")
+    registry.observe("observer_ioc_request_seconds", 0.3)
+    with registry.phase("fetch"):
+        pass
+    text = registry.to_prometheus()
+    assert "# TYPE observer_ioc_requests_total counter" in text
+    assert 'observer_ioc_requests_total{status="200"} 1' in text
+    assert 'observer_phase_seconds_total{phase="fetch"}' in text
+    assert "# TYPE observer_ioc_request_seconds histogram" in text
+    assert 'observer_ioc_request_seconds_bucket{le="0.25"} 0' in text
+    assert 'observer_ioc_request_seconds_bucket{le="0.5"} 1' in text
+    assert 'observer_ioc_request_seconds_bucket{le="+Inf"} 1' in text
+    assert "observer_ioc_request_seconds_count 1" in text
+
+
+def test_counting_file(tmp_path):
+    registry = MetricsRegistry()
+    with CountingFile(open(tmp_path / "data", "wb"), registry=registry, name="written") as fd:
+        fd.write(b"12345")
+        fd.write(b"67")
+        assert fd.tell() == 7
+    assert registry.get("written") == 7
+    assert (tmp_path / "data").read_bytes() == b"1234567"
+
+
+def test_fetch_url(metrics):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text="[]")
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    rate_limit = multifutures.RateLimit(rate_limit=limits.parse("100/second"))
+    for _ in range(3):
+        scraper.fetch_url("https://ioc/acnj", client=client, rate_limit=rate_limit, ioc_code="acnj")
+    report = metrics.report()
+    assert report["requests"]["by_status"] == {"200": 3}
+    assert report["downloaded_bytes"] == 6
+    assert metrics.get("observer_ioc_request_seconds") > 0
+
+
+def test_retries_are_counted(metrics):
+    scraper.my_before_sleep(unittest.mock.Mock(fn="fetch_url", attempt_number=1, outcome=None))
+    assert metrics.report()["requests"]["retries"] == 1
+
+
+@unittest.mock.patch("observer.ioc.scraper.fetch_url")
+def test_pipeline_metrics(mocked_fetch_url, memory_fs, metrics):
+    mocked_fetch_url.return_value = '[{"slevel":0.905,"stime":"2023-01-01 00:00:00","sensor":"wls"}]'
+    run_ioc_pipeline(
+        ["acnj", "blri"],
+        start_date=pd.Timestamp("2023-01-01"),
+        end_date=pd.Timestamp("2023-03-01"),
+        parse_executor="inline",
+    )
+    report = metrics.report()
+    assert set(report["phase_seconds"]) == {"fetch", "parse", "group", "upload"}
+    assert report["parsed_rows"] == 4
+    assert report["uploads"] == 2
+    assert report["uploaded_bytes"] > 0
+    assert report["upload_bytes_per_second"] > 0
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import pydantic
+import pytest
+
+from observer.settings import Settings
+
+
+def test_settings_default_to_azure(monkeypatch):
+    monkeypatch.delenv("STORAGE_URL", raising=False)
+    settings = Settings(storage_account="account", container_name="obs")
+    assert settings.storage_root == "az://obs"
+    assert settings.is_azure
+
+
+@pytest.mark.parametrize(
+    "storage_url, storage_root",
+    [
+        pytest.param("/data/obs/", "/data/obs", id="path"),
+        pytest.param("file:///data/obs", "file:///data/obs", id="file"),
+        pytest.param("memory://obs", "memory://obs", id="memory"),
+    ],
+)
+def test_settings_storage_url(monkeypatch, storage_url, storage_root):
+    monkeypatch.delenv("STORAGE_ACCOUNT", raising=False)
+    settings = Settings(storage_url=storage_url)
+    assert settings.storage_root == storage_root
+    assert not settings.is_azure
+
+
+def test_settings_azure_storage_url_requires_storage_account(monkeypatch):
+    monkeypatch.delenv("STORAGE_ACCOUNT", raising=False)
+    with pytest.raises(pydantic.ValidationError, match="STORAGE_ACCOUNT"):
+        Settings(storage_url="az://obs")
+
+
+def test_settings_require_storage(monkeypatch):
+    monkeypatch.delenv("STORAGE_URL", raising=False)
+    monkeypatch.delenv("CONTAINER_NAME", raising=False)
+    with pytest.raises(pydantic.ValidationError, match="STORAGE_URL"):
+        Settings(storage_account="account")